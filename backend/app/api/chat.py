@@ -1,28 +1,27 @@
+import json
+
 from fastapi import APIRouter
-from app.models.schemas import ChatRequest, ChatResponse, ChatResponseSource
-from app.rag.pipeline import rag_answer
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from app.config import BATCH_CONCURRENCY
+from app.models.schemas import (
+    BatchQueryRequest,
+    BatchQueryResult,
+    ChatRequest,
+    ChatResponse,
+    ChatResponseSource,
+)
+from app.rag.pipeline import rag_answer, rag_answer_batch, rag_answer_stream
 from app.rag.session_memory import add_message
 
 router = APIRouter()
 
-@router.post("/query", response_model=ChatResponse)
-async def chat_query(payload: ChatRequest):
-    answer, data = await rag_answer(
-        payload.query, 
-        k=payload.k, 
-        session_id=payload.session_id,
-        model=payload.model,
-        provider_type=payload.provider_type,
-        api_key=payload.api_key
-    )
-
-    # Save conversation history if session_id is provided
-    if payload.session_id:
-        add_message(payload.session_id, payload.query, answer)
 
+def _build_sources(data: dict) -> list[ChatResponseSource]:
     sources = []
-    for text, meta, score in zip(
-        data["docs"], data["metadatas"], data["scores"]
+    rerank_scores = data.get("rerank_scores") or [None] * len(data["docs"])
+    for text, meta, score, rerank_score in zip(
+        data["docs"], data["metadatas"], data["scores"], rerank_scores
     ):
         sources.append(
             ChatResponseSource(
@@ -31,7 +30,134 @@ async def chat_query(payload: ChatRequest):
                 chunk_index=meta.get("chunk_index", -1),
                 text=text,
                 score=float(score),
+                rerank_score=rerank_score,
             )
         )
+    return sources
+
+
+def _sse_event(event: str, data) -> str:
+    """Format a single Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@router.post("/query", response_model=ChatResponse)
+async def chat_query(payload: ChatRequest):
+    answer, data = await rag_answer(
+        payload.query,
+        k=payload.k,
+        session_id=payload.session_id,
+        model=payload.model,
+        provider_type=payload.provider_type,
+        api_key=payload.api_key,
+        retrieval_mode=payload.retrieval_mode,
+        doc_ids=payload.doc_ids,
+        titles=payload.titles,
+        tags=payload.tags,
+        tenant=payload.tenant,
+        rerank=payload.rerank,
+    )
+
+    # Save conversation history if session_id is provided
+    if payload.session_id:
+        await run_in_threadpool(add_message, payload.session_id, payload.query, answer)
+
+    return ChatResponse(
+        answer=answer,
+        sources=_build_sources(data),
+        prompt_usage=data.get("prompt_usage"),
+    )
+
+
+@router.post("/query/stream")
+async def chat_query_stream(payload: ChatRequest):
+    """
+    Stream a RAG answer as Server-Sent Events.
+
+    Events, in order:
+        sources: list of retrieved sources (same shape as ChatResponse.sources)
+        token:   {"content": "..."} for every generated fragment
+        done:    {"answer": "...", "prompt_usage": {...}} with the full answer
+        error:   {"detail": "..."} if generation fails mid-stream
+    """
+    async def event_stream():
+        parts: list[str] = []
+        prompt_usage = None
+        try:
+            async for kind, value in rag_answer_stream(
+                payload.query,
+                k=payload.k,
+                session_id=payload.session_id,
+                model=payload.model,
+                provider_type=payload.provider_type,
+                api_key=payload.api_key,
+                retrieval_mode=payload.retrieval_mode,
+                doc_ids=payload.doc_ids,
+                titles=payload.titles,
+                tags=payload.tags,
+                tenant=payload.tenant,
+                rerank=payload.rerank,
+            ):
+                if kind == "sources":
+                    prompt_usage = value.get("prompt_usage")
+                    sources = [s.model_dump() for s in _build_sources(value)]
+                    yield _sse_event("sources", sources)
+                else:
+                    parts.append(value)
+                    yield _sse_event("token", {"content": value})
+        except Exception as exc:
+            yield _sse_event("error", {"detail": str(exc)})
+            return
+
+        answer = "".join(parts)
+        # Save conversation history once the full answer is known
+        if payload.session_id:
+            await run_in_threadpool(add_message, payload.session_id, payload.query, answer)
+        yield _sse_event("done", {"answer": answer, "prompt_usage": prompt_usage})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.post("/batch")
+async def chat_batch(payload: BatchQueryRequest):
+    """
+    Answer a list of independent questions, streamed as NDJSON.
+
+    One BatchQueryResult per line, in completion order; ``index`` gives the
+    position of the question in the request. A question that fails has
+    ``error`` set and no answer. No conversation history is used or stored.
+    """
+    async def result_lines():
+        try:
+            async for index, answer, data, error in rag_answer_batch(
+                payload.queries,
+                k=payload.k,
+                model=payload.model,
+                provider_type=payload.provider_type,
+                api_key=payload.api_key,
+                retrieval_mode=payload.retrieval_mode,
+                doc_ids=payload.doc_ids,
+                titles=payload.titles,
+                tags=payload.tags,
+                tenant=payload.tenant,
+                rerank=payload.rerank,
+                concurrency=payload.concurrency or BATCH_CONCURRENCY,
+            ):
+                result = BatchQueryResult(
+                    index=index,
+                    query=payload.queries[index],
+                    answer=answer,
+                    sources=_build_sources(data) if data else [],
+                    prompt_usage=data.get("prompt_usage") if data else None,
+                    error=error,
+                )
+                yield result.model_dump_json() + "\n"
+        except Exception as exc:
+            # Embedding or retrieval failed for the whole batch
+            yield json.dumps({"error": str(exc)}) + "\n"
 
-    return ChatResponse(answer=answer, sources=sources)
+    return StreamingResponse(result_lines(), media_type="application/x-ndjson")
@@ -1,20 +1,186 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
-import uuid, os
-from app.rag.pipeline import ingest_document  # adjust import if needed
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+import uuid, os, re
+from app.config import EMBEDDING_MODEL_NAME, EMBEDDING_MODELS
+from app.models.schemas import DocumentInfo, IngestJobStatus, TENANT_PATTERN
+from app.rag import doc_registry, maintenance
+from app.rag.ingest_queue import (
+    submit_ingest, submit_delete, submit_compact, submit_reembed, get_job, IngestQueueFull
+)
 
 router = APIRouter()
 UPLOAD_DIR = "data/uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
-@router.post("/upload")
-async def upload_document(file: UploadFile = File(...)):
+@router.post("/upload", status_code=202)
+async def upload_document(
+    file: UploadFile = File(...),
+    tags: str | None = Form(None),
+    tenant: str | None = Form(None),
+    doc_id: str | None = Form(None),
+):
     if not file.filename.lower().endswith(".pdf"):
         raise HTTPException(status_code=400, detail="Only PDF supported")
-    doc_id = str(uuid.uuid4())
+    if tenant is not None and not re.match(TENANT_PATTERN, tenant):
+        raise HTTPException(status_code=400, detail="Invalid tenant id")
+    # Comma-separated tags, e.g. "biology,grade-10"
+    tag_list = [tag.strip() for tag in (tags or "").split(",") if tag.strip()]
+    content = await file.read()
+    # Hashing, the file write and registry calls (which may wait on a locked
+    # registry) run off the event loop, so they never stall streaming responses
+    return await run_in_threadpool(_store_upload, content, file.filename, tenant, tag_list, doc_id)
+
+
+def _store_upload(
+    content: bytes, filename: str, tenant: str | None, tag_list: list[str], doc_id: str | None
+) -> dict:
+    """Register an uploaded PDF and queue its ingestion, unless it is a duplicate.
+
+    With ``doc_id`` the upload is a new version of that document; otherwise it is a new document.
+    """
+    file_hash = doc_registry.hash_bytes(content)
+
+    # A new version of an existing document only re-embeds its changed chunks
+    previous = doc_registry.get_document(doc_id) if doc_id else None
+    if doc_id and (previous is None or previous["tenant"] != tenant):
+        raise HTTPException(status_code=404, detail="Document not found")
+
+    # Exact duplicate: already indexed (or being indexed), nothing to do
+    duplicate = doc_registry.find_by_hash(file_hash, tenant=tenant)
+    if duplicate is not None:
+        return {
+            "doc_id": duplicate["doc_id"],
+            "filename": filename,
+            "job_id": None,
+            "status": "duplicate",
+        }
+    if previous is not None and previous["status"] == "pending":
+        raise HTTPException(
+            status_code=409,
+            detail="A previous version of this document is still being indexed",
+        )
+    if previous is not None and previous["status"] == "deleting":
+        raise HTTPException(
+            status_code=409,
+            detail="A previous version of this document is still being deleted",
+        )
+    doc_id = doc_id or str(uuid.uuid4())
     save_path = os.path.join(UPLOAD_DIR, f"{doc_id}.pdf")
 
     with open(save_path, "wb") as f:
-        f.write(await file.read())
+        f.write(content)
+    doc_registry.register_document(
+        doc_id, filename, file_hash, save_path, tenant=tenant, tags=tag_list, file_size=len(content)
+    )
+
+    # Parsing, chunking and embedding run on the background worker pool
+    try:
+        job = submit_ingest(
+            save_path, doc_id=doc_id, title=filename, tenant=tenant, tags=tag_list
+        )
+    except IngestQueueFull as exc:
+        doc_registry.set_status(doc_id, "failed")
+        raise _queue_full(exc)
+    return {"doc_id": doc_id, "filename": filename, "job_id": job.job_id, "status": job.status}
+
+
+@router.get("/jobs/{job_id}", response_model=IngestJobStatus)
+async def get_ingest_job(job_id: str):
+    job = await run_in_threadpool(get_job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+def _queue_full(exc: IngestQueueFull) -> HTTPException:
+    return HTTPException(status_code=503, detail=str(exc), headers={"Retry-After": "30"})
+
+
+def _document_or_404(doc_id: str) -> dict:
+    document = doc_registry.get_document(doc_id)
+    if document is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+    return document
+
+
+# The handlers below are plain functions: FastAPI runs them in its threadpool,
+# so their registry and job store calls never block the event loop
+@router.get("", response_model=list[DocumentInfo])
+def list_documents(
+    tenant: str | None = Query(None, pattern=TENANT_PATTERN),
+    status: str | None = None,
+):
+    """Documents with their status, chunk count and size, and embedding model, newest first."""
+    return doc_registry.list_documents(tenant=tenant, status=status)
+
+
+@router.get("/index")
+async def index_info():
+    """Chunks, allocated rows and dead rows per collection, and whether a re-embed is due."""
+    return await run_in_threadpool(maintenance.index_stats)
+
+
+@router.post("/compact", status_code=202, response_model=IngestJobStatus)
+def compact_index():
+    """Rebuild the index without deleted chunks; queries use the current one until the swap."""
+    try:
+        return submit_compact()
+    except IngestQueueFull as exc:
+        raise _queue_full(exc)
+
+
+@router.post("/reembed", status_code=202, response_model=IngestJobStatus)
+def reembed_index(model: str | None = None):
+    """Re-embed every chunk with ``model`` (default: EDUQUILL_EMBEDDING_MODEL), then switch to it."""
+    # Only configured models: any other name would be downloaded and made active by the job
+    allowed = [EMBEDDING_MODEL_NAME, *EMBEDDING_MODELS]
+    if model is not None and model not in allowed:
+        raise HTTPException(status_code=400, detail=f"Unknown embedding model; expected one of {allowed}")
+    try:
+        return submit_reembed(model)
+    except IngestQueueFull as exc:
+        raise _queue_full(exc)
+
+
+@router.get("/{doc_id}", response_model=DocumentInfo)
+def get_document(doc_id: str):
+    return _document_or_404(doc_id)
+
+
+@router.delete("/{doc_id}", status_code=202)
+def delete_document(doc_id: str):
+    """Remove a document from the index, the uploads and the registry, in the background."""
+    document = _document_or_404(doc_id)
+    if document["status"] in ("pending", "deleting"):
+        raise HTTPException(status_code=409, detail=f"Document is {document['status']}")
+    doc_registry.set_status(doc_id, "deleting")
+    try:
+        job = submit_delete(doc_id, title=document["title"])
+    except IngestQueueFull as exc:
+        doc_registry.set_status(doc_id, document["status"])
+        raise _queue_full(exc)
+    return {"doc_id": doc_id, "job_id": job.job_id, "status": job.status}
+
 
-    ingest_document(save_path, doc_id=doc_id, title=file.filename)
-    return {"doc_id": doc_id, "filename": file.filename}
+@router.post("/{doc_id}/rebuild", status_code=202)
+def rebuild_document(doc_id: str):
+    """Re-ingest a document from its uploaded PDF, e.g. after a failed ingest or chunking changes."""
+    document = _document_or_404(doc_id)
+    if document["status"] in ("pending", "deleting"):
+        raise HTTPException(status_code=409, detail=f"Document is {document['status']}")
+    if not os.path.exists(document["file_path"]):
+        raise HTTPException(status_code=409, detail="The uploaded file is missing; upload the document again")
+    doc_registry.set_status(doc_id, "pending")
+    try:
+        job = submit_ingest(
+            document["file_path"],
+            doc_id=doc_id,
+            title=document["title"],
+            tenant=document["tenant"],
+            tags=document["tags"],
+        )
+    except IngestQueueFull as exc:
+        # Nothing was changed: the document keeps its chunks and status
+        doc_registry.set_status(doc_id, document["status"])
+        raise _queue_full(exc)
+    return {"doc_id": doc_id, "filename": document["title"], "job_id": job.job_id, "status": job.status}
@@ -1,7 +1,37 @@
 from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+
+from app.rag import rate_limit, warmup
+from app.rag.embeddings import get_embedding_model
+from app.rag.llm_client import gateway
+from app.rag.query_batcher import get_query_batcher
+from app.rag.reranker import get_reranker
+from app.rag.semantic_cache import get_semantic_cache
+from app.rag.session_memory import get_session_store
 
 router = APIRouter()
 
 @router.get("/health")
 def health_check():
     return {"status": "ok"}
+
+
+@router.get("/ready")
+def readiness_check():
+    """Ready once warm-up is done; load balancers should route traffic only to ready workers."""
+    status = warmup.status()
+    return JSONResponse(status, status_code=200 if warmup.is_ready() else 503)
+
+
+@router.get("/stats")
+def stats():
+    cache = get_semantic_cache()
+    return {
+        "embedding_cache": get_embedding_model().stats(),
+        "query_batcher": get_query_batcher().stats(),
+        "reranker": get_reranker().stats(),
+        "semantic_cache": cache.stats() if cache is not None else {"enabled": False},
+        "sessions": get_session_store().stats(),
+        "rate_limits": rate_limit.stats(),
+        "llm_gateway": gateway.stats(),
+    }
@@ -0,0 +1,164 @@
+import os
+
+# --- Runtime configuration (override with environment variables) ---
+
+# Multi-worker deployment: several uvicorn workers sharing data/ (see README "Running Several Workers")
+MULTI_WORKER = os.getenv("EDUQUILL_MULTI_WORKER", "0").lower() in ("1", "true", "yes")
+# Ingestion jobs shared by every worker; one process at a time (the ingest leader) runs them and writes the index
+INGEST_JOB_DB_PATH = os.getenv("EDUQUILL_INGEST_JOB_DB_PATH", "data/jobs.sqlite3")
+# 0 keeps this process from running ingestion jobs, e.g. web workers next to `python -m app.ingest_worker`
+INGEST_LEADER = os.getenv("EDUQUILL_INGEST_LEADER", "1").lower() in ("1", "true", "yes")
+INGEST_POLL_SECONDS = float(os.getenv("EDUQUILL_INGEST_POLL_SECONDS", "1"))
+# Written by the ingest leader after each index change; other workers reload their view when it changes
+INDEX_GENERATION_PATH = os.getenv("EDUQUILL_INDEX_GENERATION_PATH", "data/index.generation")
+INDEX_REFRESH_SECONDS = float(os.getenv("EDUQUILL_INDEX_REFRESH_SECONDS", "1"))
+
+# Background ingestion
+INGEST_WORKERS = int(os.getenv("EDUQUILL_INGEST_WORKERS", "1"))
+INGEST_MAX_PENDING = int(os.getenv("EDUQUILL_INGEST_MAX_PENDING", "8"))
+INGEST_JOB_RETENTION_SECONDS = int(os.getenv("EDUQUILL_INGEST_JOB_RETENTION_SECONDS", "3600"))
+
+# LLM providers
+OLLAMA_BASE_URL = os.getenv("EDUQUILL_OLLAMA_BASE_URL", "http://localhost:11434")
+LLM_POOL_MAX_CLIENTS = int(os.getenv("EDUQUILL_LLM_POOL_MAX_CLIENTS", "32"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("EDUQUILL_HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+HTTP_KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("EDUQUILL_HTTP_KEEPALIVE_EXPIRY_SECONDS", "60"))
+
+# Embeddings
+EMBEDDING_MODEL_NAME = os.getenv("EDUQUILL_EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+# Other models POST /documents/reembed may switch to (comma-separated); EMBEDDING_MODEL_NAME is always allowed
+EMBEDDING_MODELS = [
+    name.strip() for name in os.getenv("EDUQUILL_EMBEDDING_MODELS", "").split(",") if name.strip()
+]
+EMBEDDING_CACHE_SIZE = int(os.getenv("EDUQUILL_EMBEDDING_CACHE_SIZE", "20000"))
+# Empty disables the on-disk cache tier
+EMBEDDING_CACHE_DIR = os.getenv("EDUQUILL_EMBEDDING_CACHE_DIR", "")
+
+# Ingestion embedding engine
+INGEST_EMBED_BATCH_SIZE = int(os.getenv("EDUQUILL_INGEST_EMBED_BATCH_SIZE", "64"))
+# 0 keeps torch's default intra-op thread count
+INGEST_EMBED_THREADS = int(os.getenv("EDUQUILL_INGEST_EMBED_THREADS", "0"))
+# 0 embeds in-process; >0 starts a sentence-transformers multi-process pool
+INGEST_EMBED_PROCESSES = int(os.getenv("EDUQUILL_INGEST_EMBED_PROCESSES", "0"))
+INGEST_PREFETCH_BATCHES = int(os.getenv("EDUQUILL_INGEST_PREFETCH_BATCHES", "4"))
+INGEST_WRITE_BATCH_SIZE = int(os.getenv("EDUQUILL_INGEST_WRITE_BATCH_SIZE", "1024"))
+
+# PDF parsing
+PDF_CHUNK_SIZE = int(os.getenv("EDUQUILL_PDF_CHUNK_SIZE", "400"))
+PDF_CHUNK_OVERLAP = int(os.getenv("EDUQUILL_PDF_CHUNK_OVERLAP", "50"))
+# 0 parses in-process; >0 shards large PDFs by page range across a process pool
+PDF_PARSE_PROCESSES = int(os.getenv("EDUQUILL_PDF_PARSE_PROCESSES", "0"))
+PDF_SHARD_MIN_PAGES = int(os.getenv("EDUQUILL_PDF_SHARD_MIN_PAGES", "200"))
+PDF_SHARD_PAGES = int(os.getenv("EDUQUILL_PDF_SHARD_PAGES", "16"))
+
+# Document registry
+REGISTRY_PATH = os.getenv("EDUQUILL_REGISTRY_PATH", "data/registry.sqlite3")
+
+# Semantic answer cache (opt-in)
+SEMANTIC_CACHE_ENABLED = os.getenv("EDUQUILL_SEMANTIC_CACHE", "0").lower() in ("1", "true", "yes")
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("EDUQUILL_SEMANTIC_CACHE_THRESHOLD", "0.95"))
+SEMANTIC_CACHE_TTL_SECONDS = int(os.getenv("EDUQUILL_SEMANTIC_CACHE_TTL_SECONDS", "3600"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("EDUQUILL_SEMANTIC_CACHE_MAX_ENTRIES", "2000"))
+
+# Session memory
+# "memory" keeps sessions in-process; "sqlite" persists them and shares them across workers
+SESSION_BACKEND = os.getenv("EDUQUILL_SESSION_BACKEND", "sqlite" if MULTI_WORKER else "memory")
+SESSION_DB_PATH = os.getenv("EDUQUILL_SESSION_DB_PATH", "data/sessions.sqlite3")
+SESSION_MAX_SESSIONS = int(os.getenv("EDUQUILL_SESSION_MAX_SESSIONS", "10000"))
+SESSION_IDLE_TTL_SECONDS = int(os.getenv("EDUQUILL_SESSION_IDLE_TTL_SECONDS", "21600"))
+SESSION_TOKEN_BUDGET = int(os.getenv("EDUQUILL_SESSION_TOKEN_BUDGET", "2000"))
+SESSION_MAX_MESSAGES = int(os.getenv("EDUQUILL_SESSION_MAX_MESSAGES", "40"))
+
+# Prompt budgeting
+DEFAULT_CONTEXT_WINDOW = int(os.getenv("EDUQUILL_CONTEXT_WINDOW", "8192"))
+# JSON object of per-model overrides, e.g. {"phi3": 4096, "llama-3.1-8b-instant": 16384}
+MODEL_CONTEXT_WINDOWS = os.getenv("EDUQUILL_MODEL_CONTEXT_WINDOWS", "")
+RESERVED_OUTPUT_TOKENS = int(os.getenv("EDUQUILL_RESERVED_OUTPUT_TOKENS", "1024"))
+# Share of the budget left after system prompt and instructions that history may use
+HISTORY_BUDGET_SHARE = float(os.getenv("EDUQUILL_HISTORY_BUDGET_SHARE", "0.3"))
+
+# Retrieval
+CHROMA_DIR = os.getenv("EDUQUILL_CHROMA_DIR", "data/chroma")
+# Chroma server, e.g. http://localhost:8000; empty embeds Chroma in CHROMA_DIR (single worker only)
+CHROMA_URL = os.getenv("EDUQUILL_CHROMA_URL", "")
+LEXICAL_INDEX_DIR = os.getenv("EDUQUILL_LEXICAL_INDEX_DIR", "data/lexical")
+# "dense" (vector only) or "hybrid" (BM25 + vector, reciprocal rank fusion)
+RETRIEVAL_MODE = os.getenv("EDUQUILL_RETRIEVAL_MODE", "hybrid")
+# Candidates fetched from each retriever per requested result before fusion
+HYBRID_CANDIDATE_FACTOR = int(os.getenv("EDUQUILL_HYBRID_CANDIDATE_FACTOR", "4"))
+RRF_K = int(os.getenv("EDUQUILL_RRF_K", "60"))
+
+# Vector backend
+# "chroma" (default) or "numpy" (memory-mapped matrices with quantized scan, see numpy_store)
+VECTOR_BACKEND = os.getenv("EDUQUILL_VECTOR_BACKEND", "chroma")
+VECTOR_INDEX_DIR = os.getenv("EDUQUILL_VECTOR_INDEX_DIR", "data/vectors")
+# "int8", "float16" or "none"; codes scanned before full-precision re-ranking
+VECTOR_QUANTIZATION = os.getenv("EDUQUILL_VECTOR_QUANTIZATION", "int8")
+# Collections with at least this many rows are partitioned (IVF) instead of scanned exhaustively
+VECTOR_IVF_MIN_ROWS = int(os.getenv("EDUQUILL_VECTOR_IVF_MIN_ROWS", "50000"))
+# 0 picks sqrt(rows) partitions
+VECTOR_IVF_LISTS = int(os.getenv("EDUQUILL_VECTOR_IVF_LISTS", "0"))
+VECTOR_IVF_NPROBE = int(os.getenv("EDUQUILL_VECTOR_IVF_NPROBE", "8"))
+# Quantized candidates re-ranked at full precision per requested result
+VECTOR_RERANK_FACTOR = int(os.getenv("EDUQUILL_VECTOR_RERANK_FACTOR", "4"))
+
+# Query embedding micro-batching
+# Longest a query embedding waits for others to share its forward pass
+QUERY_BATCH_MAX_WAIT_MS = float(os.getenv("EDUQUILL_QUERY_BATCH_MAX_WAIT_MS", "5"))
+# 1 disables batching (queries are still embedded off the event loop)
+QUERY_BATCH_MAX_SIZE = int(os.getenv("EDUQUILL_QUERY_BATCH_MAX_SIZE", "32"))
+
+# Batch question answering
+BATCH_MAX_QUERIES = int(os.getenv("EDUQUILL_BATCH_MAX_QUERIES", "500"))
+# Answers generated at once per batch request (requests may ask for up to BATCH_MAX_CONCURRENCY)
+BATCH_CONCURRENCY = int(os.getenv("EDUQUILL_BATCH_CONCURRENCY", "4"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("EDUQUILL_BATCH_MAX_CONCURRENCY", "16"))
+
+# Provider rate limits per API key, shared by chat and batch requests (0 = unlimited)
+GROQ_REQUESTS_PER_MINUTE = int(os.getenv("EDUQUILL_GROQ_REQUESTS_PER_MINUTE", "30"))
+GROQ_TOKENS_PER_MINUTE = int(os.getenv("EDUQUILL_GROQ_TOKENS_PER_MINUTE", "0"))
+OLLAMA_REQUESTS_PER_MINUTE = int(os.getenv("EDUQUILL_OLLAMA_REQUESTS_PER_MINUTE", "0"))
+
+# Cross-encoder re-ranking (opt-in; can be overridden per request)
+RERANK_ENABLED = os.getenv("EDUQUILL_RERANK", "0").lower() in ("1", "true", "yes")
+RERANK_MODEL = os.getenv("EDUQUILL_RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+# Candidates retrieved per requested chunk before re-ranking
+RERANK_CANDIDATE_FACTOR = int(os.getenv("EDUQUILL_RERANK_CANDIDATE_FACTOR", "4"))
+# Chunks scoring below this relevance (0-1) are not sent to the LLM
+RERANK_MIN_SCORE = float(os.getenv("EDUQUILL_RERANK_MIN_SCORE", "0.02"))
+RERANK_BATCH_SIZE = int(os.getenv("EDUQUILL_RERANK_BATCH_SIZE", "32"))
+RERANK_CACHE_SIZE = int(os.getenv("EDUQUILL_RERANK_CACHE_SIZE", "20000"))
+
+# Index maintenance: compaction and re-embedding rebuild a collection's copy, then swap it in
+# Chunks copied or re-embedded per step
+REBUILD_BATCH_SIZE = int(os.getenv("EDUQUILL_REBUILD_BATCH_SIZE", "256"))
+# Pause between steps, leaving CPU to queries while a large index is re-embedded
+REBUILD_PAUSE_MS = float(os.getenv("EDUQUILL_REBUILD_PAUSE_MS", "0"))
+# Replaced collections are deleted this long after the swap, once in-flight queries are done
+REBUILD_RETIRE_SECONDS = float(os.getenv("EDUQUILL_REBUILD_RETIRE_SECONDS", "60"))
+
+# Metrics: add a Server-Timing header with per-stage durations to API responses
+TIMING_HEADERS = os.getenv("EDUQUILL_TIMING_HEADERS", "0").lower() in ("1", "true", "yes")
+
+# Startup warm-up: load models and run a dummy search in the background; /ready reports 503 until done
+WARMUP_ENABLED = os.getenv("EDUQUILL_WARMUP", "1").lower() in ("1", "true", "yes")
+# A failed warm-up is retried after this many seconds, doubling up to WARMUP_RETRY_MAX_SECONDS
+WARMUP_RETRY_SECONDS = float(os.getenv("EDUQUILL_WARMUP_RETRY_SECONDS", "5"))
+WARMUP_RETRY_MAX_SECONDS = float(os.getenv("EDUQUILL_WARMUP_RETRY_MAX_SECONDS", "300"))
+
+# LLM provider gateway
+# Comma-separated Ollama servers; requests go to the least busy one and fail over to the others
+OLLAMA_BASE_URLS = [
+    url.strip() for url in os.getenv("EDUQUILL_OLLAMA_BASE_URLS", OLLAMA_BASE_URL).split(",") if url.strip()
+]
+# Concurrent generations per Ollama server / per Groq API key; further requests queue fairly
+OLLAMA_MAX_CONCURRENCY = int(os.getenv("EDUQUILL_OLLAMA_MAX_CONCURRENCY", "4"))
+GROQ_MAX_CONCURRENCY = int(os.getenv("EDUQUILL_GROQ_MAX_CONCURRENCY", "16"))
+# Groq model to use when every Ollama server failed (needs GROQ_API_KEY); empty disables
+LLM_FALLBACK_GROQ_MODEL = os.getenv("EDUQUILL_LLM_FALLBACK_GROQ_MODEL", "")
+LLM_FIRST_TOKEN_TIMEOUT_SECONDS = float(os.getenv("EDUQUILL_LLM_FIRST_TOKEN_TIMEOUT_SECONDS", "60"))
+LLM_TIMEOUT_SECONDS = float(os.getenv("EDUQUILL_LLM_TIMEOUT_SECONDS", "300"))
+LLM_MAX_RETRIES = int(os.getenv("EDUQUILL_LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BACKOFF_SECONDS = float(os.getenv("EDUQUILL_LLM_RETRY_BACKOFF_SECONDS", "0.5"))
+# Identical prompts in flight at the same time share one generation
+LLM_SINGLE_FLIGHT = os.getenv("EDUQUILL_LLM_SINGLE_FLIGHT", "1").lower() in ("1", "true", "yes")
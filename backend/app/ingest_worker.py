@@ -0,0 +1,34 @@
+"""
+Dedicated ingestion process for multi-worker deployments.
+
+    EDUQUILL_MULTI_WORKER=1 python -m app.ingest_worker
+
+Runs the shared ingestion queue and is the single writer of the index, so
+the web workers (started with EDUQUILL_INGEST_LEADER=0) only serve
+requests. Stops after finishing running jobs on SIGINT or SIGTERM.
+"""
+import asyncio
+import signal
+import threading
+
+from app.config import MULTI_WORKER
+from app.rag import chunking, embedding_engine, ingest_queue, resources
+
+
+def main():
+    if not MULTI_WORKER:
+        raise SystemExit("The ingestion worker serves the shared queue: set EDUQUILL_MULTI_WORKER=1")
+    stop = threading.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: stop.set())
+
+    ingest_queue.start()
+    stop.wait()
+    ingest_queue.shutdown(wait=True)
+    embedding_engine.shutdown()
+    chunking.shutdown()
+    asyncio.run(resources.shutdown())
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,34 @@
-from fastapi import FastAPI
+import time
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 
-from app.api import health, documents, chat
+from app.api import health, documents, chat, metrics
+from app.config import TIMING_HEADERS
+from app.rag import chunking, embedding_engine, index_sync, ingest_queue, query_batcher, resources, warmup
+from app.rag.metrics import HTTP_REQUEST_SECONDS, collect_request_timings, server_timing_header
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load models and open shared vector store handles in the background; see /ready
+    warmup.start()
+    # Multi-worker mode: follow other workers' index writes and compete for the ingest leadership
+    index_sync.start()
+    ingest_queue.start()
+    yield
+    await warmup.shutdown()
+    # Let in-flight ingestion jobs finish before the process exits
+    ingest_queue.shutdown(wait=True)
+    index_sync.shutdown()
+    embedding_engine.shutdown()
+    chunking.shutdown()
+    await query_batcher.shutdown()
+    await resources.shutdown()
 
-app = FastAPI(title="EduQuill RAG API")
+
+app = FastAPI(title="EduQuill RAG API", lifespan=lifespan)
 
 # --- CORS configuration ---
 origins = [
@@ -19,6 +44,30 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+def _route_label(request: Request) -> str:
+    """Route template of a request (path parameters as {name}), bounding label cardinality."""
+    if "route" not in request.scope:
+        return "unmatched"
+    names = {str(value): f"{{{name}}}" for name, value in request.path_params.items()}
+    return "/".join(names.get(segment, segment) for segment in request.url.path.split("/"))
+
+
+@app.middleware("http")
+async def record_request_timing(request: Request, call_next):
+    with collect_request_timings() as timings:
+        start = time.perf_counter()
+        response = await call_next(request)
+        elapsed = time.perf_counter() - start
+    HTTP_REQUEST_SECONDS.labels(request.method, _route_label(request), str(response.status_code)).observe(elapsed)
+    # Streaming responses return before their stages run, so only timed stages are reported
+    if TIMING_HEADERS and timings:
+        timings["app"] = elapsed
+        response.headers["Server-Timing"] = server_timing_header(timings)
+    return response
+
+
 app.include_router(health.router)
+app.include_router(metrics.router)
 app.include_router(documents.router, prefix="/api/v1/documents", tags=["documents"])
 app.include_router(chat.router, prefix="/api/v1/chat", tags=["chat"])
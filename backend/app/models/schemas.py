@@ -1,6 +1,11 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Literal
 
+from app.config import BATCH_MAX_QUERIES, BATCH_MAX_CONCURRENCY
+
+# Tenant ids become part of Chroma collection names
+TENANT_PATTERN = r"^[A-Za-z0-9_-]{1,48}$"
+
 class ChatRequest(BaseModel):
     query: str
     session_id: str | None = None
@@ -8,6 +13,16 @@ class ChatRequest(BaseModel):
     model: str = "qwen2.5:14b-instruct"
     provider_type: Literal["ollama", "groq"] = "ollama"
     api_key: str | None = None
+    # "dense" or "hybrid"; defaults to EDUQUILL_RETRIEVAL_MODE
+    retrieval_mode: Literal["dense", "hybrid"] | None = None
+    # Retrieval filters: only chunks of matching documents are searched
+    doc_ids: list[str] | None = None
+    titles: list[str] | None = None
+    tags: list[str] | None = None
+    # Searches only this tenant's collection
+    tenant: str | None = Field(default=None, pattern=TENANT_PATTERN)
+    # Cross-encoder re-ranking of over-fetched candidates; defaults to EDUQUILL_RERANK
+    rerank: bool | None = None
 
 class ChatResponseSource(BaseModel):
     doc_id: str
@@ -15,7 +30,64 @@ class ChatResponseSource(BaseModel):
     chunk_index: int
     text: str
     score: float
+    # Cross-encoder relevance (0-1) when the chunks were re-ranked
+    rerank_score: float | None = None
 
 class ChatResponse(BaseModel):
     answer: str
     sources: list[ChatResponseSource]
+    # Tokens used by each prompt part (system, history, context, instructions, total)
+    prompt_usage: dict[str, int] | None = None
+
+class BatchQueryRequest(BaseModel):
+    queries: list[str] = Field(min_length=1, max_length=BATCH_MAX_QUERIES)
+    k: int = 5
+    model: str = "qwen2.5:14b-instruct"
+    provider_type: Literal["ollama", "groq"] = "ollama"
+    api_key: str | None = None
+    retrieval_mode: Literal["dense", "hybrid"] | None = None
+    doc_ids: list[str] | None = None
+    titles: list[str] | None = None
+    tags: list[str] | None = None
+    tenant: str | None = Field(default=None, pattern=TENANT_PATTERN)
+    rerank: bool | None = None
+    # Answers generated at once; defaults to EDUQUILL_BATCH_CONCURRENCY
+    concurrency: int | None = Field(default=None, ge=1, le=BATCH_MAX_CONCURRENCY)
+
+class BatchQueryResult(BaseModel):
+    # Position of the query in the request; results arrive in completion order
+    index: int
+    query: str
+    answer: str | None = None
+    sources: list[ChatResponseSource] = []
+    prompt_usage: dict[str, int] | None = None
+    error: str | None = None
+
+class IngestJobStatus(BaseModel):
+    job_id: str
+    # "ingest" and "delete" act on one document; "compact" and "reembed" rebuild the whole index
+    kind: Literal["ingest", "delete", "compact", "reembed"] = "ingest"
+    doc_id: str | None = None
+    filename: str | None = None
+    status: Literal["queued", "running", "done", "failed"] = "queued"
+    pages_parsed: int = 0
+    # Chunks to process; rebuild jobs count copied or re-embedded chunks in chunks_embedded
+    chunks_total: int = 0
+    chunks_embedded: int = 0
+    error: str | None = None
+    created_at: float
+    updated_at: float
+
+class DocumentInfo(BaseModel):
+    doc_id: str
+    title: str
+    status: Literal["pending", "ready", "failed", "deleting"]
+    tenant: str | None = None
+    tags: list[str] = []
+    file_size: int
+    chunk_count: int
+    # Total characters over the document's chunks
+    chunk_chars: int
+    embedding_model: str | None = None
+    created_at: float
+    updated_at: float
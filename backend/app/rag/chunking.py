@@ -0,0 +1,199 @@
+import multiprocessing
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Iterator, List
+
+from langchain_core.documents import Document
+from pypdf import PdfReader
+try:
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+except ImportError:
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from app.config import (
+    PDF_CHUNK_SIZE,
+    PDF_CHUNK_OVERLAP,
+    PDF_PARSE_PROCESSES,
+    PDF_SHARD_MIN_PAGES,
+    PDF_SHARD_PAGES,
+)
+from app.rag.metrics import INGEST_PAGES, StageTimer
+
+ProgressCallback = Callable[..., None]
+
+_pool: ProcessPoolExecutor | None = None
+_pool_lock = threading.Lock()
+
+
+def _text_splitter(chunk_size: int, overlap: int) -> RecursiveCharacterTextSplitter:
+    # Use LangChain's RecursiveCharacterTextSplitter
+    return RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=overlap,
+        length_function=len,
+        separators=["\n\n", "\n", " ", ""],
+        add_start_index=True,
+    )
+
+
+def _chunk_page(
+    text_splitter: RecursiveCharacterTextSplitter,
+    text: str,
+    page_number: int,
+) -> List[Document]:
+    """Split one page's text, tagging chunks with page number and char offsets."""
+    chunks = text_splitter.create_documents([text], metadatas=[{"page": page_number}])
+    for chunk in chunks:
+        chunk.metadata["end_index"] = chunk.metadata["start_index"] + len(chunk.page_content)
+    return chunks
+
+
+def _chunk_page_range(
+    file_path: str,
+    start: int,
+    end: int,
+    chunk_size: int,
+    overlap: int,
+) -> tuple[List[List[Document]], float, float]:
+    """Process pool worker: parse and chunk pages [start, end), one list per page.
+
+    Also returns the seconds spent extracting text and splitting it.
+    """
+    timer = StageTimer()
+    with timer.stage("load"):
+        reader = PdfReader(file_path)
+    text_splitter = _text_splitter(chunk_size, overlap)
+    pages = []
+    for i in range(start, end):
+        with timer.stage("load"):
+            text = reader.pages[i].extract_text().strip()
+        with timer.stage("split"):
+            pages.append(_chunk_page(text_splitter, text, i))
+    return pages, timer.durations.get("load", 0.0), timer.durations.get("split", 0.0)
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Created lazily from an ingest thread once torch's threads run: forking then can deadlock the children
+            _pool = ProcessPoolExecutor(
+                max_workers=PDF_PARSE_PROCESSES, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _pool
+
+
+def _iter_pages_serial(
+    file_path: str,
+    reader: PdfReader,
+    chunk_size: int,
+    overlap: int,
+    timer: StageTimer,
+) -> Iterator[List[Document]]:
+    """Parse and chunk pages in-process, one page at a time."""
+    text_splitter = _text_splitter(chunk_size, overlap)
+    for i, page in enumerate(reader.pages):
+        with timer.stage("load"):
+            text = page.extract_text().strip()
+        with timer.stage("split"):
+            page_chunks = _chunk_page(text_splitter, text, i)
+        yield page_chunks
+
+
+def _iter_pages_sharded(
+    file_path: str,
+    page_count: int,
+    chunk_size: int,
+    overlap: int,
+    timer: StageTimer,
+) -> Iterator[List[Document]]:
+    """Parse and chunk page-range shards on the process pool, yielding pages in order.
+
+    Only a small window of shards is in flight at once, so memory grows with
+    the window and not with the document. Load and split times are the
+    workers' own, summed over shards.
+    """
+    pool = _get_pool()
+    window = max(2, PDF_PARSE_PROCESSES * 2)
+    shards = iter(range(0, page_count, PDF_SHARD_PAGES))
+    in_flight: deque = deque()
+
+    def submit_next() -> bool:
+        start = next(shards, None)
+        if start is None:
+            return False
+        end = min(start + PDF_SHARD_PAGES, page_count)
+        in_flight.append(pool.submit(_chunk_page_range, file_path, start, end, chunk_size, overlap))
+        return True
+
+    try:
+        while len(in_flight) < window and submit_next():
+            pass
+        while in_flight:
+            pages, load_seconds, split_seconds = in_flight.popleft().result()
+            timer.add("load", load_seconds)
+            timer.add("split", split_seconds)
+            submit_next()
+            yield from pages
+    finally:
+        for future in in_flight:
+            future.cancel()
+
+
+def iter_pdf_chunks(
+    file_path: str,
+    chunk_size: int = PDF_CHUNK_SIZE,
+    overlap: int = PDF_CHUNK_OVERLAP,
+    progress: ProgressCallback | None = None,
+    timer: StageTimer | None = None,
+) -> Iterator[Document]:
+    """
+    Stream chunks from a PDF page by page.
+
+    Large files (at least PDF_SHARD_MIN_PAGES pages) are sharded by page range
+    across a process pool when PDF_PARSE_PROCESSES > 0; smaller ones are
+    parsed in-process. Chunks never span pages.
+
+    Args:
+        file_path: Path of the PDF
+        chunk_size: Maximum characters per chunk
+        overlap: Characters shared by consecutive chunks of a page
+        progress: Optional callback receiving (pages_parsed, chunks_total)
+        timer: Optional timer collecting "load" (text extraction) and
+            "split" (chunking) times
+
+    Yields:
+        Documents with "page", "start_index" and "end_index" metadata; offsets
+        are character positions within the page text
+    """
+    timer = timer or StageTimer()
+    with timer.stage("load"):
+        reader = PdfReader(file_path)
+        page_count = len(reader.pages)
+
+    if PDF_PARSE_PROCESSES > 0 and page_count >= PDF_SHARD_MIN_PAGES:
+        del reader
+        pages = _iter_pages_sharded(file_path, page_count, chunk_size, overlap, timer)
+    else:
+        pages = _iter_pages_serial(file_path, reader, chunk_size, overlap, timer)
+
+    pages_parsed = 0
+    chunks_total = 0
+    for page_chunks in pages:
+        pages_parsed += 1
+        chunks_total += len(page_chunks)
+        INGEST_PAGES.inc()
+        if progress:
+            progress(pages_parsed=pages_parsed, chunks_total=chunks_total)
+        yield from page_chunks
+
+
+def shutdown():
+    """Stop the PDF parsing process pool if it was started."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True, cancel_futures=True)
+            _pool = None
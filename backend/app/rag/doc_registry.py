@@ -0,0 +1,302 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from app.config import REGISTRY_PATH
+
+_conn: sqlite3.Connection | None = None
+_lock = threading.Lock()
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    doc_id TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    file_hash TEXT NOT NULL,
+    file_path TEXT NOT NULL,
+    status TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS documents_file_hash ON documents (file_hash);
+CREATE INDEX IF NOT EXISTS documents_title ON documents (title);
+CREATE TABLE IF NOT EXISTS chunks (
+    chunk_id TEXT PRIMARY KEY,
+    doc_id TEXT NOT NULL,
+    chunk_hash TEXT NOT NULL,
+    chunk_index INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS chunks_doc_id ON chunks (doc_id);
+CREATE TABLE IF NOT EXISTS collections (
+    name TEXT PRIMARY KEY,
+    physical TEXT NOT NULL,
+    embedding_model TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+"""
+
+
+def _connection() -> sqlite3.Connection:
+    global _conn
+    if _conn is None:
+        directory = os.path.dirname(REGISTRY_PATH)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # WAL and a busy timeout let several worker processes share the registry
+        _conn = sqlite3.connect(REGISTRY_PATH, check_same_thread=False, timeout=30)
+        _conn.row_factory = sqlite3.Row
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.executescript(_SCHEMA)
+        _migrate(_conn)
+        _conn.commit()
+    return _conn
+
+
+def _migrate(conn: sqlite3.Connection):
+    """Add columns introduced after the first registry version."""
+    columns = {row["name"] for row in conn.execute("PRAGMA table_info(documents)")}
+    if "tenant" not in columns:
+        conn.execute("ALTER TABLE documents ADD COLUMN tenant TEXT NOT NULL DEFAULT ''")
+    if "tags" not in columns:
+        conn.execute("ALTER TABLE documents ADD COLUMN tags TEXT NOT NULL DEFAULT '[]'")
+    if "file_size" not in columns:
+        conn.execute("ALTER TABLE documents ADD COLUMN file_size INTEGER NOT NULL DEFAULT 0")
+    if "embedding_model" not in columns:
+        conn.execute("ALTER TABLE documents ADD COLUMN embedding_model TEXT NOT NULL DEFAULT ''")
+    chunk_columns = {row["name"] for row in conn.execute("PRAGMA table_info(chunks)")}
+    if "size" not in chunk_columns:
+        conn.execute("ALTER TABLE chunks ADD COLUMN size INTEGER NOT NULL DEFAULT 0")
+
+
+def _row_to_dict(row: sqlite3.Row | None) -> dict | None:
+    if row is None:
+        return None
+    doc = dict(row)
+    doc["tenant"] = doc.get("tenant") or None
+    doc["tags"] = json.loads(doc.get("tags") or "[]")
+    doc["embedding_model"] = doc.get("embedding_model") or None
+    return doc
+
+
+def hash_bytes(data: bytes) -> str:
+    """SHA-256 of raw file content."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def hash_text(text: str) -> str:
+    """SHA-256 of a chunk's text."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def find_by_hash(file_hash: str, tenant: str | None = None) -> dict | None:
+    """Return the tenant's indexed (ready) document with this exact file content, if any."""
+    with _lock:
+        row = _connection().execute(
+            "SELECT * FROM documents WHERE file_hash = ? AND tenant = ? AND status = 'ready'",
+            (file_hash, tenant or ""),
+        ).fetchone()
+    return _row_to_dict(row)
+
+
+def register_document(
+    doc_id: str,
+    title: str,
+    file_hash: str,
+    file_path: str,
+    tenant: str | None = None,
+    tags: list[str] | None = None,
+    file_size: int = 0,
+):
+    """Create or update a document entry and mark it as pending ingestion."""
+    now = time.time()
+    with _lock:
+        conn = _connection()
+        conn.execute(
+            """
+            INSERT INTO documents
+                (doc_id, title, file_hash, file_path, status, created_at, updated_at, tenant, tags, file_size)
+            VALUES (?, ?, ?, ?, 'pending', ?, ?, ?, ?, ?)
+            ON CONFLICT(doc_id) DO UPDATE SET
+                title = excluded.title,
+                file_hash = excluded.file_hash,
+                file_path = excluded.file_path,
+                status = 'pending',
+                updated_at = excluded.updated_at,
+                tenant = excluded.tenant,
+                tags = excluded.tags,
+                file_size = excluded.file_size
+            """,
+            (doc_id, title, file_hash, file_path, now, now, tenant or "", json.dumps(tags or []), file_size),
+        )
+        conn.commit()
+
+
+def set_status(doc_id: str, status: str, embedding_model: str | None = None):
+    """Update a document's status ('pending', 'ready', 'failed' or 'deleting').
+
+    ``embedding_model`` records which model embedded the document's chunks.
+    """
+    with _lock:
+        conn = _connection()
+        conn.execute(
+            """
+            UPDATE documents SET status = ?, updated_at = ?, embedding_model = COALESCE(?, embedding_model)
+            WHERE doc_id = ?
+            """,
+            (status, time.time(), embedding_model, doc_id),
+        )
+        conn.commit()
+
+
+def fail_interrupted(active_doc_ids: set[str]) -> int:
+    """Mark documents left pending or deleting by a lost job as failed; returns how many.
+
+    Documents in ``active_doc_ids`` still have a queued or running job and are left alone.
+    """
+    with _lock:
+        conn = _connection()
+        rows = conn.execute("SELECT doc_id FROM documents WHERE status IN ('pending', 'deleting')").fetchall()
+        interrupted = [(time.time(), row["doc_id"]) for row in rows if row["doc_id"] not in active_doc_ids]
+        conn.executemany("UPDATE documents SET status = 'failed', updated_at = ? WHERE doc_id = ?", interrupted)
+        conn.commit()
+    return len(interrupted)
+
+
+def get_document(doc_id: str) -> dict | None:
+    """Return a document with its chunk count and total chunk size (characters)."""
+    documents = list_documents(doc_id=doc_id)
+    return documents[0] if documents else None
+
+
+def list_documents(
+    tenant: str | None = None,
+    status: str | None = None,
+    doc_id: str | None = None,
+) -> list[dict]:
+    """
+    Return documents, newest first, with their chunk count and total chunk size.
+
+    Args:
+        tenant: Only this tenant's documents; all tenants when None
+        status: Only documents in this status
+        doc_id: Only this document
+    """
+    conditions, params = [], []
+    if tenant is not None:
+        conditions.append("d.tenant = ?")
+        params.append(tenant)
+    if status is not None:
+        conditions.append("d.status = ?")
+        params.append(status)
+    if doc_id is not None:
+        conditions.append("d.doc_id = ?")
+        params.append(doc_id)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    with _lock:
+        rows = _connection().execute(
+            f"""
+            SELECT d.*, COUNT(c.chunk_id) AS chunk_count, COALESCE(SUM(c.size), 0) AS chunk_chars
+            FROM documents d LEFT JOIN chunks c ON c.doc_id = d.doc_id
+            {where}
+            GROUP BY d.doc_id
+            ORDER BY d.created_at DESC
+            """,
+            params,
+        ).fetchall()
+    return [_row_to_dict(row) for row in rows]
+
+
+def tenants() -> list[str]:
+    """Tenants owning at least one document."""
+    with _lock:
+        rows = _connection().execute("SELECT DISTINCT tenant FROM documents WHERE tenant != ''").fetchall()
+    return [row["tenant"] for row in rows]
+
+
+def delete_document(doc_id: str):
+    """Forget a document and its chunk list."""
+    with _lock:
+        conn = _connection()
+        conn.execute("DELETE FROM chunks WHERE doc_id = ?", (doc_id,))
+        conn.execute("DELETE FROM documents WHERE doc_id = ?", (doc_id,))
+        conn.commit()
+
+
+def get_chunk_ids_by_hash(doc_id: str) -> dict[str, list[str]]:
+    """Map chunk hash -> chunk ids currently indexed for a document."""
+    with _lock:
+        rows = _connection().execute(
+            "SELECT chunk_hash, chunk_id FROM chunks WHERE doc_id = ? ORDER BY chunk_index",
+            (doc_id,),
+        ).fetchall()
+    by_hash: dict[str, list[str]] = {}
+    for row in rows:
+        by_hash.setdefault(row["chunk_hash"], []).append(row["chunk_id"])
+    return by_hash
+
+
+def replace_chunks(doc_id: str, chunks: list[tuple[str, str, int, int]]):
+    """Replace a document's chunk list with (chunk_id, chunk_hash, chunk_index, size) rows."""
+    with _lock:
+        conn = _connection()
+        conn.execute("DELETE FROM chunks WHERE doc_id = ?", (doc_id,))
+        conn.executemany(
+            "INSERT INTO chunks (chunk_id, doc_id, chunk_hash, chunk_index, size) VALUES (?, ?, ?, ?, ?)",
+            [(chunk_id, doc_id, chunk_hash, index, size) for chunk_id, chunk_hash, index, size in chunks],
+        )
+        conn.commit()
+
+
+def get_setting(key: str, default: str) -> str:
+    """Return a persisted index setting, storing ``default`` first if it is not set yet."""
+    with _lock:
+        conn = _connection()
+        conn.execute("INSERT OR IGNORE INTO settings (key, value) VALUES (?, ?)", (key, default))
+        conn.commit()
+        return conn.execute("SELECT value FROM settings WHERE key = ?", (key,)).fetchone()["value"]
+
+
+def get_collection(name: str) -> tuple[str, str] | None:
+    """(physical collection, embedding model) a logical collection points to, or None if never rebuilt."""
+    with _lock:
+        row = _connection().execute(
+            "SELECT physical, embedding_model FROM collections WHERE name = ?", (name,)
+        ).fetchone()
+    return (row["physical"], row["embedding_model"]) if row is not None else None
+
+
+def swap_collections(physical: dict[str, str], embedding_model: str, reembedded: bool):
+    """
+    Point logical collections at rebuilt physical ones, in one transaction.
+
+    Args:
+        physical: Logical collection name -> physical collection now holding its chunks
+        embedding_model: Model the rebuilt collections were embedded with, made the active model
+        reembedded: Whether every document's chunks were re-embedded with that model
+    """
+    with _lock:
+        conn = _connection()
+        conn.executemany(
+            "INSERT OR REPLACE INTO collections (name, physical, embedding_model) VALUES (?, ?, ?)",
+            [(name, target, embedding_model) for name, target in physical.items()],
+        )
+        conn.execute(
+            "INSERT OR REPLACE INTO settings (key, value) VALUES ('embedding_model', ?)", (embedding_model,)
+        )
+        if reembedded:
+            conn.execute(
+                "UPDATE documents SET embedding_model = ? WHERE status = 'ready'", (embedding_model,)
+            )
+        conn.commit()
+
+
+def next_index_version() -> int:
+    """Allocate the next version number for the physical collections of a rebuild."""
+    with _lock:
+        conn = _connection()
+        conn.execute("INSERT OR IGNORE INTO settings (key, value) VALUES ('index_version', '0')")
+        conn.execute("UPDATE settings SET value = CAST(value AS INTEGER) + 1 WHERE key = 'index_version'")
+        conn.commit()
+        return int(conn.execute("SELECT value FROM settings WHERE key = 'index_version'").fetchone()["value"])
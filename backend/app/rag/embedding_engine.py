@@ -0,0 +1,178 @@
+import queue
+import threading
+from typing import Callable, Iterable, Iterator, List, Sequence, TypeVar
+
+from app.config import (
+    INGEST_EMBED_BATCH_SIZE,
+    INGEST_EMBED_THREADS,
+    INGEST_EMBED_PROCESSES,
+    INGEST_PREFETCH_BATCHES,
+)
+from app.rag.embeddings import CachedEmbeddings, active_model_name, get_embedding_model
+from app.rag.metrics import StageTimer
+
+T = TypeVar("T")
+
+# Marks the end of the producer stream
+_DONE = object()
+
+
+class EmbeddingEngine:
+    """
+    Batched embedding engine for document ingestion.
+
+    Embeds chunks in fixed-size batches, optionally on a sentence-transformers
+    multi-process pool, while a producer thread keeps parsing and chunking
+    later pages. Goes through the shared embedding cache, so identical chunks
+    are never embedded twice.
+    """
+
+    def __init__(
+        self,
+        embeddings: CachedEmbeddings,
+        batch_size: int = 64,
+        threads: int = 0,
+        processes: int = 0,
+        prefetch: int = 4,
+    ):
+        self.embeddings = embeddings
+        self.batch_size = batch_size
+        self.processes = processes
+        self.prefetch = prefetch
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+        if threads > 0:
+            try:
+                import torch
+                # Process-wide setting: also applies to query embeddings
+                torch.set_num_threads(threads)
+            except ImportError:
+                pass
+
+    def _sentence_transformer(self):
+        """The SentenceTransformer behind the LangChain HuggingFace wrapper."""
+        model = self.embeddings.embeddings
+        return getattr(model, "_client", None) or getattr(model, "client")
+
+    def _embed_with_pool(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts across the multi-process pool, starting it on first use.
+
+        The pool has a single output queue and numbers each call's chunks from
+        0, so one call at a time: concurrent calls would take each other's results.
+        """
+        model = self._sentence_transformer()
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = model.start_multi_process_pool(
+                    target_devices=["cpu"] * self.processes
+                )
+            vectors = model.encode_multi_process(
+                texts, self._pool, batch_size=self.batch_size
+            )
+        return vectors.tolist()
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        """Embed a batch of document texts."""
+        if self.processes > 0:
+            return self.embeddings.embed_documents_with(texts, self._embed_with_pool)
+        return self.embeddings.embed_documents(texts)
+
+    def embed_pipelined(
+        self,
+        batches: Iterable[T],
+        texts_of: Callable[[T], Sequence[str]],
+        timer: StageTimer | None = None,
+    ) -> Iterator[tuple[T, List[List[float]]]]:
+        """
+        Embed batches while the next ones are still being produced.
+
+        ``batches`` is consumed on a background thread (typically PDF parsing
+        and chunking) through a bounded queue, so embedding of batch N
+        overlaps with producing batch N+1 and memory stays bounded.
+
+        Args:
+            batches: Iterable producing batch items
+            texts_of: Extracts the texts to embed from a batch item
+            timer: Optional timer collecting the "embed" time
+
+        Yields:
+            (batch item, embeddings) in production order
+        """
+        timer = timer or StageTimer()
+        pending: "queue.Queue" = queue.Queue(maxsize=max(1, self.prefetch))
+        stop = threading.Event()
+
+        def produce():
+            try:
+                for item in batches:
+                    if stop.is_set():
+                        return
+                    pending.put(item)
+                pending.put(_DONE)
+            except BaseException as exc:
+                pending.put(exc)
+
+        producer = threading.Thread(target=produce, name="ingest-producer", daemon=True)
+        producer.start()
+        try:
+            while True:
+                item = pending.get()
+                if item is _DONE:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                with timer.stage("embed"):
+                    vectors = self.embed(list(texts_of(item)))
+                yield item, vectors
+        finally:
+            stop.set()
+            # Unblock the producer if it is waiting on a full queue
+            while producer.is_alive():
+                try:
+                    pending.get_nowait()
+                except queue.Empty:
+                    producer.join(timeout=0.05)
+
+    def close(self):
+        """Stop the multi-process pool if one was started."""
+        with self._pool_lock:
+            if self._pool is not None:
+                self._sentence_transformer().stop_multi_process_pool(self._pool)
+                self._pool = None
+
+
+# Ingestion embedding engines by model name
+_engines: dict[str, EmbeddingEngine] = {}
+_engines_lock = threading.Lock()
+
+
+def get_ingest_engine(model_name: str | None = None) -> EmbeddingEngine:
+    """Get the process-wide ingestion embedding engine for a model (default: the active model).
+
+    Engines of other models are closed, so at most one multi-process pool
+    runs at a time.
+    """
+    model_name = model_name or active_model_name()
+    with _engines_lock:
+        engine = _engines.get(model_name)
+        if engine is None:
+            for stale in _engines.values():
+                stale.close()
+            _engines.clear()
+            engine = _engines[model_name] = EmbeddingEngine(
+                get_embedding_model(model_name),
+                batch_size=INGEST_EMBED_BATCH_SIZE,
+                threads=INGEST_EMBED_THREADS,
+                processes=INGEST_EMBED_PROCESSES,
+                prefetch=INGEST_PREFETCH_BATCHES,
+            )
+        return engine
+
+
+def shutdown():
+    """Release engine resources if an engine was created."""
+    with _engines_lock:
+        for engine in _engines.values():
+            engine.close()
+        _engines.clear()
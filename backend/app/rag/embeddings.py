@@ -1,17 +1,266 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from array import array
+from collections import OrderedDict
 from functools import lru_cache
+from typing import Callable, List
 
-try:
-    from langchain_huggingface import HuggingFaceEmbeddings
-except ImportError:
-    # Fallback to deprecated version if new package not available
-    from langchain_community.embeddings import HuggingFaceEmbeddings
+from langchain_core.embeddings import Embeddings
 
+from app.config import (
+    EMBEDDING_MODEL_NAME,
+    EMBEDDING_CACHE_SIZE,
+    EMBEDDING_CACHE_DIR,
+    INGEST_EMBED_BATCH_SIZE,
+)
+from app.rag import doc_registry, index_sync
 
-@lru_cache()
-def get_embedding_model():
-    """Get LangChain HuggingFace embeddings model."""
-    return HuggingFaceEmbeddings(
-        model_name="all-MiniLM-L6-v2",
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that skips the model forward pass for texts seen before.
+
+    Vectors are keyed by a SHA-256 of (model name, kind, text) and kept in a
+    bounded in-memory LRU, with an optional SQLite tier on disk that survives
+    restarts. Queries and documents are cached separately since some models
+    embed them differently.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        model_name: str,
+        max_entries: int = 20000,
+        cache_dir: str | None = None,
+    ):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self._lru: "OrderedDict[str, array]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._db = None
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            self._db = sqlite3.connect(
+                os.path.join(cache_dir, "embeddings.sqlite3"), check_same_thread=False, timeout=30
+            )
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+            )
+            self._db.commit()
+
+    def _key(self, kind: str, text: str) -> str:
+        digest = hashlib.sha256()
+        digest.update(self.model_name.encode("utf-8"))
+        digest.update(b"\0" + kind.encode("utf-8") + b"\0")
+        digest.update(text.encode("utf-8"))
+        return digest.hexdigest()
+
+    def _lookup(self, key: str) -> array | None:
+        """Find a vector in memory, then on disk. Caller holds the lock."""
+        vector = self._lru.get(key)
+        if vector is not None:
+            self._lru.move_to_end(key)
+            self.hits += 1
+            return vector
+        if self._db is not None:
+            row = self._db.execute(
+                "SELECT vector FROM embeddings WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None:
+                vector = array("f")
+                vector.frombytes(row[0])
+                self._remember(key, vector)
+                self.disk_hits += 1
+                return vector
+        self.misses += 1
+        return None
+
+    def _remember(self, key: str, vector: array):
+        """Insert into the in-memory LRU, evicting the oldest entries. Caller holds the lock."""
+        self._lru[key] = vector
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_entries:
+            self._lru.popitem(last=False)
+
+    def _store(self, items: list[tuple[str, List[float]]]):
+        """Cache freshly computed vectors in memory and on disk."""
+        with self._lock:
+            for key, values in items:
+                self._remember(key, array("f", values))
+            if self._db is not None and items:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                    [(key, array("f", values).tobytes()) for key, values in items],
+                )
+                self._db.commit()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed documents, running the model only on texts not cached yet."""
+        return self.embed_documents_with(texts, self.embeddings.embed_documents)
+
+    def embed_documents_with(
+        self,
+        texts: List[str],
+        embed_fn: Callable[[List[str]], List[List[float]]],
+    ) -> List[List[float]]:
+        """Like embed_documents, but computes cache misses with ``embed_fn``.
+
+        Lets callers such as the ingestion engine run the forward pass their
+        own way (batching, process pool) while still sharing the cache.
+        """
+        return self._embed_with("doc", texts, embed_fn)
+
+    def _embed_with(
+        self,
+        kind: str,
+        texts: List[str],
+        embed_fn: Callable[[List[str]], List[List[float]]],
+    ) -> List[List[float]]:
+        """Serve cached vectors and compute the misses with one ``embed_fn`` call."""
+        keys = [self._key(kind, text) for text in texts]
+        results: list[List[float] | None] = [None] * len(texts)
+        missing: dict[str, list[int]] = {}
+        with self._lock:
+            for i, key in enumerate(keys):
+                if key in missing:
+                    # Duplicate text within the same call: embed it once
+                    missing[key].append(i)
+                    continue
+                vector = self._lookup(key)
+                if vector is None:
+                    missing[key] = [i]
+                else:
+                    results[i] = vector.tolist()
+
+        if missing:
+            miss_keys = list(missing)
+            vectors = embed_fn([texts[missing[k][0]] for k in miss_keys])
+            self._store(list(zip(miss_keys, vectors)))
+            for key, vector in zip(miss_keys, vectors):
+                for i in missing[key]:
+                    results[i] = list(vector)
+        return results
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embed a query, serving repeated questions from the cache."""
+        key = self._key("query", text)
+        with self._lock:
+            vector = self._lookup(key)
+        if vector is not None:
+            return vector.tolist()
+        values = self.embeddings.embed_query(text)
+        self._store([(key, values)])
+        return list(values)
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Embed several queries with a single batched forward pass for the cache misses."""
+        return self._embed_with("query", texts, self._embed_query_batch)
+
+    def _embed_query_batch(self, texts: List[str]) -> List[List[float]]:
+        # sentence-transformers embeds a query like a document unless the
+        # wrapper has query-specific encode options
+        if getattr(self.embeddings, "query_encode_kwargs", None):
+            return [self.embeddings.embed_query(text) for text in texts]
+        return self.embeddings.embed_documents(texts)
+
+    def cached_query(self, text: str) -> List[float] | None:
+        """Return a query vector from the in-memory cache only, without touching the model."""
+        key = self._key("query", text)
+        with self._lock:
+            vector = self._lru.get(key)
+            if vector is None:
+                return None
+            self._lru.move_to_end(key)
+            self.hits += 1
+            return vector.tolist()
+
+    def stats(self) -> dict:
+        """Hit/miss counters and current size, for sizing the cache."""
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "model": self.model_name,
+                "entries": len(self._lru),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                "disk_enabled": self._db is not None,
+            }
+
+
+def _huggingface_embeddings(**kwargs) -> Embeddings:
+    """Build the HuggingFace embeddings model, importing its integration on first use."""
+    try:
+        from langchain_huggingface import HuggingFaceEmbeddings
+    except ImportError:
+        # Fallback to deprecated version if new package not available
+        from langchain_community.embeddings import HuggingFaceEmbeddings
+    return HuggingFaceEmbeddings(**kwargs)
+
+
+# Model the index was embedded with; read from the registry on first use
+_active_model: str | None = None
+
+
+def active_model_name() -> str:
+    """
+    Name of the embedding model queries and ingestion use.
+
+    This is the model the index was built with, recorded in the registry the
+    first time the app runs. Changing EDUQUILL_EMBEDDING_MODEL later does not
+    switch it: existing vectors would not match. The re-embed job rebuilds
+    the index with the new model and then makes it active.
+    """
+    global _active_model
+    if _active_model is None:
+        _active_model = doc_registry.get_setting("embedding_model", EMBEDDING_MODEL_NAME)
+    return _active_model
+
+
+def set_active_model(model_name: str):
+    """Switch to a model the index has just been re-embedded with."""
+    global _active_model
+    _active_model = model_name
+
+
+def _forget_active_model():
+    global _active_model
+    _active_model = None
+
+
+# Another worker may have re-embedded the index with a new model
+index_sync.on_change(_forget_active_model)
+
+
+# Two models live side by side while the index is re-embedded
+@lru_cache(maxsize=2)
+def _load_embedding_model(model_name: str) -> CachedEmbeddings:
+    model = _huggingface_embeddings(
+        model_name=model_name,
         model_kwargs={"device": "cpu"},
-        encode_kwargs={"normalize_embeddings": False}
+        encode_kwargs={"normalize_embeddings": False, "batch_size": INGEST_EMBED_BATCH_SIZE}
     )
+    return CachedEmbeddings(
+        model,
+        model_name=model_name,
+        max_entries=EMBEDDING_CACHE_SIZE,
+        cache_dir=EMBEDDING_CACHE_DIR or None,
+    )
+
+
+def get_embedding_model(model_name: str | None = None) -> CachedEmbeddings:
+    """Get LangChain HuggingFace embeddings model, wrapped with an embedding cache.
+
+    Defaults to the active model (see ``active_model_name``).
+    """
+    return _load_embedding_model(model_name or active_model_name())
@@ -0,0 +1,100 @@
+import os
+import threading
+import time
+from typing import Callable
+
+from app.config import INDEX_GENERATION_PATH, INDEX_REFRESH_SECONDS, MULTI_WORKER
+
+# Functions reloading this process's view of the index, run when another process wrote to it
+_listeners: list[Callable[[], None]] = []
+_lock = threading.Lock()
+_stop = threading.Event()
+_thread: threading.Thread | None = None
+
+
+def _read_generation() -> str:
+    try:
+        with open(INDEX_GENERATION_PATH, encoding="utf-8") as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return ""
+
+
+# Generation this process's view of the index is up to date with
+_seen = _read_generation() if MULTI_WORKER else ""
+
+
+def on_change(listener: Callable[[], None]):
+    """Register a function reloading in-process index state after another process's write."""
+    _listeners.append(listener)
+
+
+def bump():
+    """
+    Announce an index write to the other workers.
+
+    Called by the ingest leader, the only process writing to the index in
+    multi-worker mode, once a write is committed. A no-op with one worker.
+    """
+    global _seen
+    if not MULTI_WORKER:
+        return
+    generation = f"{os.getpid()}-{time.time_ns()}"
+    directory = os.path.dirname(INDEX_GENERATION_PATH)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temporary = f"{INDEX_GENERATION_PATH}.{os.getpid()}.tmp"
+    with open(temporary, "w", encoding="utf-8") as f:
+        f.write(generation)
+    os.replace(temporary, INDEX_GENERATION_PATH)
+    with _lock:
+        # This process made the write, its own view is current
+        _seen = generation
+
+
+def sync() -> bool:
+    """Run the registered listeners if the index changed since the last sync; True if it did."""
+    global _seen
+    if not MULTI_WORKER:
+        return False
+    with _lock:
+        generation = _read_generation()
+        if generation == _seen:
+            return False
+        for listener in _listeners:
+            listener()
+        _seen = generation
+    return True
+
+
+def _poll():
+    while not _stop.wait(INDEX_REFRESH_SECONDS):
+        try:
+            sync()
+        except Exception:
+            # Keep polling: a failed reload is retried on the next change check
+            pass
+
+
+def start():
+    """
+    Start following index writes made by other processes.
+
+    Readers reload at most ``INDEX_REFRESH_SECONDS`` after the ingest leader
+    bumped the generation. Polling happens on a background thread so no
+    request pays for a reload. A no-op with one worker.
+    """
+    global _thread
+    if not MULTI_WORKER or _thread is not None:
+        return
+    _stop.clear()
+    _thread = threading.Thread(target=_poll, name="index-sync", daemon=True)
+    _thread.start()
+
+
+def shutdown():
+    global _thread
+    _stop.set()
+    if _thread is not None:
+        _thread.join()
+        _thread = None
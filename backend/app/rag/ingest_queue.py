@@ -0,0 +1,449 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Iterator
+
+from app.config import (
+    INGEST_WORKERS,
+    INGEST_MAX_PENDING,
+    INGEST_JOB_RETENTION_SECONDS,
+    INGEST_JOB_DB_PATH,
+    INGEST_LEADER,
+    INGEST_POLL_SECONDS,
+    MULTI_WORKER,
+)
+from app.models.schemas import IngestJobStatus
+from app.rag import doc_registry, index_sync
+from app.rag.maintenance import compact_index, reembed_index
+from app.rag.pipeline import delete_document, ingest_document
+
+
+class IngestQueueFull(Exception):
+    """Raised when the ingestion queue has no free slot for a new job."""
+
+
+# Job kind -> function run by the worker, called with the job's params and a progress callback
+_JOBS = {
+    "ingest": ingest_document,
+    "delete": delete_document,
+    "compact": compact_index,
+    "reembed": reembed_index,
+}
+# Jobs rebuilding the whole index: nothing else may write to it meanwhile
+_EXCLUSIVE_JOBS = {"compact", "reembed"}
+
+
+class _IndexGate:
+    """
+    Shared/exclusive gate over index writes.
+
+    Document jobs run side by side; a rebuild waits for them to finish and
+    runs alone, and document jobs submitted meanwhile wait until it is done,
+    so no write is lost by being made to the old collections during a copy.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._shared = 0
+        self._exclusive = False
+        self._exclusive_waiting = 0
+
+    @contextmanager
+    def shared(self) -> Iterator[None]:
+        with self._cond:
+            self._cond.wait_for(lambda: not self._exclusive and not self._exclusive_waiting)
+            self._shared += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._shared -= 1
+                self._cond.notify_all()
+
+    @contextmanager
+    def exclusive(self) -> Iterator[None]:
+        with self._cond:
+            self._exclusive_waiting += 1
+            self._cond.wait_for(lambda: not self._exclusive and not self._shared)
+            self._exclusive_waiting -= 1
+            self._exclusive = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._exclusive = False
+                self._cond.notify_all()
+
+
+class InMemoryJobStore:
+    """Jobs tracked in this process; enough when one worker both accepts and runs them."""
+
+    def __init__(self):
+        self._jobs: dict[str, IngestJobStatus] = {}
+        self._lock = threading.Lock()
+
+    def _prune(self):
+        """Forget finished jobs older than the retention window. Caller holds _lock."""
+        cutoff = time.time() - INGEST_JOB_RETENTION_SECONDS
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.status in ("done", "failed") and job.updated_at < cutoff
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def add(self, job: IngestJobStatus, params: dict) -> bool:
+        # Capacity is enforced by the _slots semaphore in this mode
+        with self._lock:
+            self._prune()
+            self._jobs[job.job_id] = job.model_copy()
+        return True
+
+    def get(self, job_id: str) -> IngestJobStatus | None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return job.model_copy() if job is not None else None
+
+    def update(self, job_id: str, **fields):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            for key, value in fields.items():
+                setattr(job, key, value)
+            job.updated_at = time.time()
+
+    def active_doc_ids(self) -> set[str]:
+        """Documents with a queued or running job."""
+        with self._lock:
+            return {
+                job.doc_id for job in self._jobs.values()
+                if job.status in ("queued", "running") and job.doc_id is not None
+            }
+
+
+class SQLiteJobStore:
+    """
+    Jobs shared by every worker process through a SQLite file.
+
+    Any worker accepts uploads and answers status requests; the ingest
+    leader claims queued jobs in submission order and runs them, keeping
+    their progress up to date in the file.
+    """
+
+    _FIELDS = ("status", "pages_parsed", "chunks_total", "chunks_embedded", "error")
+
+    def __init__(self, path: str, capacity: int):
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Autocommit; multi-statement updates open their own write transaction
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # Progress is written often; losing the last update on power loss is harmless
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                doc_id TEXT,
+                filename TEXT,
+                status TEXT NOT NULL,
+                pages_parsed INTEGER NOT NULL DEFAULT 0,
+                chunks_total INTEGER NOT NULL DEFAULT 0,
+                chunks_embedded INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                params TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at);
+            """
+        )
+
+    def add(self, job: IngestJobStatus, params: dict) -> bool:
+        """Queue a job unless ``capacity`` jobs are already queued or running."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated_at < ?",
+                    (time.time() - INGEST_JOB_RETENTION_SECONDS,),
+                )
+                (active,) = self._conn.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'running')"
+                ).fetchone()
+                if active >= self.capacity:
+                    self._conn.execute("ROLLBACK")
+                    return False
+                self._conn.execute(
+                    """
+                    INSERT INTO jobs (job_id, kind, doc_id, filename, status, created_at, updated_at, params)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    (job.job_id, job.kind, job.doc_id, job.filename, job.status, job.created_at,
+                     job.updated_at, json.dumps(params)),
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return True
+
+    def get(self, job_id: str) -> IngestJobStatus | None:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        fields = dict(row)
+        del fields["params"]
+        return IngestJobStatus(**fields)
+
+    def update(self, job_id: str, **fields):
+        unknown = set(fields) - set(self._FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown job fields: {sorted(unknown)}")
+        assignments = ", ".join(f"{key} = ?" for key in fields)
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE jobs SET {assignments}, updated_at = ? WHERE job_id = ?",
+                (*fields.values(), time.time(), job_id),
+            )
+
+    def claim(self) -> tuple[str, str, dict] | None:
+        """Mark the oldest queued job as running and return (job_id, kind, params), or None."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT job_id, kind, params FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = 'running', updated_at = ? WHERE job_id = ?",
+                        (time.time(), row["job_id"]),
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return (row["job_id"], row["kind"], json.loads(row["params"])) if row is not None else None
+
+    def active_doc_ids(self) -> set[str]:
+        """Documents with a queued or running job."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT DISTINCT doc_id FROM jobs WHERE status IN ('queued', 'running') AND doc_id IS NOT NULL"
+            ).fetchall()
+        return {row["doc_id"] for row in rows}
+
+    def requeue_running(self):
+        """Queue again the jobs a previous leader was running when it stopped."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'queued', updated_at = ? WHERE status = 'running'", (time.time(),)
+            )
+
+
+# Bounded worker pool: ingestion runs off the event loop so chat queries keep flowing
+_executor = ThreadPoolExecutor(max_workers=INGEST_WORKERS, thread_name_prefix="ingest")
+
+if MULTI_WORKER:
+    # Every worker shares the queue; capacity is checked in the job file
+    _store = SQLiteJobStore(INGEST_JOB_DB_PATH, capacity=INGEST_WORKERS + INGEST_MAX_PENDING)
+    # Jobs the leader runs at once
+    _slots = threading.BoundedSemaphore(INGEST_WORKERS)
+else:
+    _store = InMemoryJobStore()
+    # Backpressure: at most INGEST_WORKERS running + INGEST_MAX_PENDING queued jobs
+    _slots = threading.BoundedSemaphore(INGEST_WORKERS + INGEST_MAX_PENDING)
+
+_gate = _IndexGate()
+
+_leader: threading.Thread | None = None
+_stop = threading.Event()
+# Wakes the leader when a job is submitted or finished in this process
+_wake = threading.Event()
+
+
+def _run_job(job_id: str, kind: str, params: dict):
+    """Worker entry point: run a job (ingest a document, delete one, rebuild the index) and record its progress."""
+    try:
+        with _gate.exclusive() if kind in _EXCLUSIVE_JOBS else _gate.shared():
+            _store.update(job_id, status="running")
+            _JOBS[kind](**params, progress=lambda **counters: _store.update(job_id, **counters))
+        _store.update(job_id, status="done")
+    except Exception as exc:
+        _store.update(job_id, status="failed", error=str(exc))
+    finally:
+        # Even a failed job may have written chunks: let the other workers reload
+        index_sync.bump()
+        _slots.release()
+        _wake.set()
+
+
+def _submit(kind: str, params: dict, doc_id: str | None = None, filename: str | None = None) -> IngestJobStatus:
+    """
+    Queue a job for the background workers.
+
+    With several workers the job goes to the shared queue and is run by
+    whichever process is the ingest leader.
+
+    Raises:
+        IngestQueueFull: If the queue is at capacity
+    """
+    now = time.time()
+    job = IngestJobStatus(
+        job_id=str(uuid.uuid4()),
+        kind=kind,
+        doc_id=doc_id,
+        filename=filename,
+        created_at=now,
+        updated_at=now,
+    )
+
+    if MULTI_WORKER:
+        if not _store.add(job, params):
+            raise IngestQueueFull("Ingestion queue is full, retry later")
+        _wake.set()
+        return job
+
+    if not _slots.acquire(blocking=False):
+        raise IngestQueueFull("Ingestion queue is full, retry later")
+    _store.add(job, params)
+    try:
+        _executor.submit(_run_job, job.job_id, kind, params)
+    except RuntimeError:
+        # Executor already shut down
+        _slots.release()
+        _store.update(job.job_id, status="failed", error="Ingestion queue is shut down")
+        raise
+    return job
+
+
+def submit_ingest(
+    file_path: str,
+    doc_id: str,
+    title: str,
+    tenant: str | None = None,
+    tags: list[str] | None = None,
+) -> IngestJobStatus:
+    """
+    Queue a document for background ingestion.
+
+    Args:
+        file_path: Path of the saved PDF
+        doc_id: Document identifier
+        title: Original filename, stored as the document title
+        tenant: Optional tenant owning the document
+        tags: Optional tags stored on the document's chunks
+
+    Returns:
+        Snapshot of the newly created job
+
+    Raises:
+        IngestQueueFull: If the queue is at capacity
+    """
+    params = {"file_path": file_path, "doc_id": doc_id, "title": title, "tenant": tenant, "tags": tags}
+    return _submit("ingest", params, doc_id=doc_id, filename=title)
+
+
+def submit_delete(doc_id: str, title: str | None = None) -> IngestJobStatus:
+    """Queue the removal of a document from the index, the uploads and the registry."""
+    return _submit("delete", {"doc_id": doc_id}, doc_id=doc_id, filename=title)
+
+
+def submit_compact() -> IngestJobStatus:
+    """Queue a compaction: every collection is rebuilt without its deleted chunks."""
+    return _submit("compact", {})
+
+
+def submit_reembed(model_name: str | None = None) -> IngestJobStatus:
+    """Queue re-embedding of every chunk with a new model (default: EDUQUILL_EMBEDDING_MODEL)."""
+    return _submit("reembed", {"model_name": model_name})
+
+
+def get_job(job_id: str) -> IngestJobStatus | None:
+    """Return a snapshot of a job's status, or None if unknown."""
+    return _store.get(job_id)
+
+
+def _lead():
+    """
+    Run shared jobs while holding the ingest lock.
+
+    An exclusive file lock makes this process the single index writer; the
+    other workers keep polling for it and take over if it exits.
+    """
+    # POSIX only, like uvicorn's and gunicorn's worker processes
+    import fcntl
+
+    directory = os.path.dirname(INGEST_JOB_DB_PATH)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(f"{INGEST_JOB_DB_PATH}.lock", "a") as lock_file:
+        leading = False
+        while not _stop.is_set():
+            if not leading:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    pass
+                else:
+                    leading = True
+                    # The lock proves no other process still runs these jobs
+                    _store.requeue_running()
+                    doc_registry.fail_interrupted(_store.active_doc_ids())
+                    # Catch up on what the previous leader wrote before writing ourselves
+                    index_sync.sync()
+            while leading and _slots.acquire(blocking=False):
+                claimed = _store.claim()
+                if claimed is None:
+                    _slots.release()
+                    break
+                job_id, kind, params = claimed
+                _executor.submit(_run_job, job_id, kind, params)
+            _wake.wait(INGEST_POLL_SECONDS)
+            _wake.clear()
+        # Keep the lock until running jobs are done, so a new leader never writes alongside them
+        _executor.shutdown(wait=True)
+
+
+def start():
+    """
+    Start running jobs.
+
+    With one worker, jobs do not survive a restart: documents they left
+    pending or deleting are marked failed, so they can be uploaded, rebuilt
+    or deleted again. In multi-worker mode (unless INGEST_LEADER is off)
+    this process competes for the ingest leadership instead.
+    """
+    global _leader
+    if not MULTI_WORKER:
+        doc_registry.fail_interrupted(_store.active_doc_ids())
+        return
+    if not INGEST_LEADER or _leader is not None:
+        return
+    _stop.clear()
+    _leader = threading.Thread(target=_lead, name="ingest-leader", daemon=True)
+    _leader.start()
+
+
+def shutdown(wait: bool = True):
+    """Stop accepting jobs and optionally wait for running ones to finish."""
+    _stop.set()
+    _wake.set()
+    if not wait:
+        _executor.shutdown(wait=False, cancel_futures=True)
+    elif _leader is not None:
+        _leader.join()
+    _executor.shutdown(wait=wait, cancel_futures=not wait)
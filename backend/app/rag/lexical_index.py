@@ -0,0 +1,171 @@
+import heapq
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+from typing import Iterable, List
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text: str) -> list[str]:
+    """Lowercased word tokens; keeps codes and formulas like 'c6h12o6' or '3b' intact."""
+    return _TOKEN_RE.findall(text.lower())
+
+
+class BM25Index:
+    """
+    Incremental BM25 inverted index, held in memory and persisted to SQLite.
+
+    Postings live in memory for sub-millisecond lookups; every add/delete is
+    also written through to the SQLite file so the index is reloaded, not
+    rebuilt, on restart.
+    """
+
+    def __init__(self, path: str, k1: float = 1.5, b: float = 0.75, max_df: float = 0.5):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.max_df = max_df
+        self._lock = threading.RLock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS docs (chunk_id TEXT PRIMARY KEY, length INTEGER NOT NULL);
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT NOT NULL,
+                chunk_id TEXT NOT NULL,
+                tf INTEGER NOT NULL,
+                PRIMARY KEY (term, chunk_id)
+            );
+            CREATE INDEX IF NOT EXISTS postings_chunk_id ON postings (chunk_id);
+            """
+        )
+        self._conn.commit()
+        self._postings, self._lengths, self._total_length = self._load(self._conn)
+
+    @staticmethod
+    def _load(conn: sqlite3.Connection) -> tuple[dict, dict, int]:
+        postings: dict[str, dict[str, int]] = {}
+        lengths: dict[str, int] = {}
+        total_length = 0
+        for chunk_id, length in conn.execute("SELECT chunk_id, length FROM docs"):
+            lengths[chunk_id] = length
+            total_length += length
+        for term, chunk_id, tf in conn.execute("SELECT term, chunk_id, tf FROM postings"):
+            postings.setdefault(term, {})[chunk_id] = tf
+        return postings, lengths, total_length
+
+    def reload(self):
+        """Re-read the index from SQLite, picking up writes made by another process.
+
+        The file is read on a separate connection, so searches keep using the
+        old postings until the new ones are swapped in.
+        """
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            loaded = self._load(conn)
+        finally:
+            conn.close()
+        with self._lock:
+            self._postings, self._lengths, self._total_length = loaded
+
+    def __len__(self) -> int:
+        return len(self._lengths)
+
+    def add(self, ids: List[str], texts: List[str]):
+        """Index chunks, replacing any previous version of the same ids."""
+        with self._lock:
+            self._delete_locked([chunk_id for chunk_id in ids if chunk_id in self._lengths])
+            doc_rows = []
+            posting_rows = []
+            for chunk_id, text in zip(ids, texts):
+                counts = Counter(tokenize(text))
+                length = sum(counts.values())
+                self._lengths[chunk_id] = length
+                self._total_length += length
+                doc_rows.append((chunk_id, length))
+                for term, tf in counts.items():
+                    self._postings.setdefault(term, {})[chunk_id] = tf
+                    posting_rows.append((term, chunk_id, tf))
+            self._conn.executemany("INSERT OR REPLACE INTO docs VALUES (?, ?)", doc_rows)
+            self._conn.executemany("INSERT OR REPLACE INTO postings VALUES (?, ?, ?)", posting_rows)
+            self._conn.commit()
+
+    def _delete_locked(self, ids: Iterable[str]):
+        ids = list(ids)
+        if not ids:
+            return
+        for start in range(0, len(ids), 500):
+            batch = ids[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            terms = self._conn.execute(
+                f"SELECT term, chunk_id FROM postings WHERE chunk_id IN ({placeholders})", batch
+            ).fetchall()
+            for term, chunk_id in terms:
+                postings = self._postings.get(term)
+                if postings is not None:
+                    postings.pop(chunk_id, None)
+                    if not postings:
+                        del self._postings[term]
+            for chunk_id in batch:
+                self._total_length -= self._lengths.pop(chunk_id, 0)
+            self._conn.execute(f"DELETE FROM postings WHERE chunk_id IN ({placeholders})", batch)
+            self._conn.execute(f"DELETE FROM docs WHERE chunk_id IN ({placeholders})", batch)
+        self._conn.commit()
+
+    def delete(self, ids: List[str]):
+        """Remove chunks from the index."""
+        with self._lock:
+            self._delete_locked(ids)
+
+    def search(self, query: str, k: int = 10) -> list[tuple[str, float]]:
+        """Return the top-k (chunk_id, BM25 score) pairs for a query.
+
+        Terms found in more than ``max_df`` of the chunks add little to the
+        ranking but dominate the scoring cost, so they are skipped unless the
+        query has nothing rarer.
+        """
+        with self._lock:
+            n_docs = len(self._lengths)
+            if not n_docs:
+                return []
+            lengths = self._lengths
+            avg_length = self._total_length / n_docs
+            matched = [
+                postings
+                for postings in (self._postings.get(term) for term in set(tokenize(query)))
+                if postings
+            ]
+            rare = [postings for postings in matched if len(postings) <= self.max_df * n_docs]
+            # Writers update postings in place: score a snapshot, outside the lock
+            snapshot = [(len(postings), list(postings.items())) for postings in rare or matched]
+
+        scores: dict[str, float] = {}
+        for df, postings in snapshot:
+            idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+            for chunk_id, tf in postings:
+                # A chunk deleted since the snapshot falls back to the average length
+                norm = self.k1 * (1 - self.b + self.b * lengths.get(chunk_id, avg_length) / avg_length)
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> list[str]:
+    """Fuse several ranked id lists: score(id) = sum of 1 / (k + rank)."""
+    scores: dict[str, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=lambda item: scores[item], reverse=True)
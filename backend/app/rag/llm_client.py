@@ -1,18 +1,17 @@
-try:
-    from langchain_community.chat_models import ChatOllama
-except ImportError:
-    from langchain_ollama import ChatOllama
-
-try:
-    from langchain_groq import ChatGroq
-except ImportError:
-    ChatGroq = None
-
-from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
 from langchain_core.language_models.chat_models import BaseChatModel
-from typing import List, Literal
-from app.rag.session_memory import get_memory, get_history_messages
-import asyncio
+from langchain_core.messages import BaseMessage
+from typing import AsyncIterator, Callable, ContextManager, Hashable, List, Literal
+from app.config import (
+    OLLAMA_BASE_URL,
+    HTTP_MAX_KEEPALIVE_CONNECTIONS,
+    HTTP_KEEPALIVE_EXPIRY_SECONDS,
+)
+from app.rag import resources
+from app.rag.llm_gateway import LLMGateway, LLMTarget
+from app.rag.metrics import StageTimer
+from app.rag.prompt_builder import PromptBuild, build_prompt, get_context_window
+from app.rag.session_memory import get_history_messages
+import httpx
 import os
 
 # --- System prompt / persona ---
@@ -66,79 +65,156 @@ IMPORTANT:
 """
 
 
+def _http_limits() -> httpx.Limits:
+    """Connection limits for pooled, keep-alive HTTP clients."""
+    return httpx.Limits(
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY_SECONDS,
+    )
+
+
+def _chat_model_class(provider_type: Literal["ollama", "groq"]) -> type[BaseChatModel]:
+    """Import a provider's LangChain integration on first use; they are slow to import."""
+    if provider_type == "groq":
+        try:
+            from langchain_groq import ChatGroq
+        except ImportError:
+            raise ImportError(
+                "langchain-groq is not installed. Install it with: pip install langchain-groq"
+            ) from None
+        return ChatGroq
+    # Prefer langchain-ollama: it has native async streaming over the Ollama HTTP API
+    try:
+        from langchain_ollama import ChatOllama
+    except ImportError:
+        from langchain_community.chat_models import ChatOllama
+    return ChatOllama
+
+
+def _create_llm(
+    model: str,
+    provider_type: Literal["ollama", "groq"],
+    api_key: str | None,
+    base_url: str | None = None,
+) -> BaseChatModel:
+    """Build a new LLM client with its own keep-alive HTTP connection pool."""
+    chat_model = _chat_model_class(provider_type)
+    if provider_type == "groq":
+        return chat_model(
+            model=model,
+            groq_api_key=api_key,
+            temperature=0.7,
+            http_client=httpx.Client(limits=_http_limits()),
+            http_async_client=httpx.AsyncClient(limits=_http_limits()),
+        )
+    else:  # ollama
+        return chat_model(
+            model=model,
+            base_url=base_url or OLLAMA_BASE_URL,
+            temperature=0.7,
+            # Match Ollama's context size to the prompt budget so nothing is silently truncated
+            num_ctx=get_context_window(model),
+            client_kwargs={"limits": _http_limits()},
+        )
+
+
+async def _close_llm(llm: BaseChatModel):
+    """Release the HTTP connections held by an LLM client."""
+    # ChatGroq exposes the httpx clients it was given
+    for attr in ("http_client", "http_async_client"):
+        client = getattr(llm, attr, None)
+        if isinstance(client, httpx.Client):
+            client.close()
+        elif isinstance(client, httpx.AsyncClient):
+            await client.aclose()
+    # ChatOllama wraps httpx clients in ollama.Client / ollama.AsyncClient
+    for attr in ("_client", "_async_client"):
+        client = getattr(getattr(llm, attr, None), "_client", None)
+        if isinstance(client, httpx.Client):
+            client.close()
+        elif isinstance(client, httpx.AsyncClient):
+            await client.aclose()
+
+
+def _pool_entry(
+    model: str,
+    provider_type: Literal["ollama", "groq"],
+    api_key: str | None,
+    base_url: str | None,
+) -> tuple[Hashable, Callable[[], BaseChatModel]]:
+    """Pool key and factory of the client for a provider, model and server."""
+    if provider_type == "groq":
+        _chat_model_class("groq")  # fail early if langchain-groq is missing
+        # Use provided API key or fallback to environment variable
+        api_key = api_key or os.getenv("GROQ_API_KEY")
+        if not api_key:
+            raise ValueError(
+                "Groq API key is required. Please provide it in the request or set GROQ_API_KEY environment variable."
+            )
+    else:
+        # Ollama does not use an API key; keep it out of the pool key
+        api_key = None
+        base_url = base_url or OLLAMA_BASE_URL
+
+    key = (provider_type, model, resources.hash_api_key(api_key), base_url)
+    return key, lambda: _create_llm(model, provider_type, api_key, base_url)
+
+
 def get_llm(
     model: str = "llama3", 
     provider_type: Literal["ollama", "groq"] = "ollama",
-    api_key: str | None = None
+    api_key: str | None = None,
+    base_url: str | None = None,
 ) -> BaseChatModel:
     """
-    Get LangChain LLM instance based on provider type.
+    Get a pooled LangChain LLM instance based on provider type.
+
+    Clients are shared across requests, keyed by (provider, model, api-key hash,
+    Ollama server), so their HTTP connections stay alive between calls.
     
     Args:
         model: Model name (e.g., "llama3", "mistral", "llama-3.1-8b-instant", etc.)
         provider_type: Either "ollama" for local or "groq" for API
         api_key: Optional API key for Groq. If not provided, will use GROQ_API_KEY env var.
+        base_url: Ollama server; defaults to OLLAMA_BASE_URL
     
     Returns:
         BaseChatModel instance (ChatOllama or ChatGroq)
     """
-    if provider_type == "groq":
-        if ChatGroq is None:
-            raise ImportError(
-                "langchain-groq is not installed. Install it with: pip install langchain-groq"
-            )
-        # Use provided API key or fallback to environment variable
-        groq_api_key = api_key or os.getenv("GROQ_API_KEY")
-        if not groq_api_key:
-            raise ValueError(
-                "Groq API key is required. Please provide it in the request or set GROQ_API_KEY environment variable."
-            )
-        return ChatGroq(
-            model=model,
-            groq_api_key=groq_api_key,
-            temperature=0.7,
-        )
-    else:  # ollama
-        return ChatOllama(
-            model=model,
-            base_url="http://localhost:11434",
-            temperature=0.7,
-        )
+    key, factory = _pool_entry(model, provider_type, api_key, base_url)
+    return resources.get_llm_client(key, factory, closer=_close_llm)
 
 
-async def generate_answer(
-    query: str,
-    contexts: List[str],
-    session_id: str | None = None,
+def lease_llm(
     model: str = "llama3",
     provider_type: Literal["ollama", "groq"] = "ollama",
     api_key: str | None = None,
-) -> str:
-    """Generate answer using LangChain ChatOllama LLM with conversation memory.
-    
-    STRICT MODE: Only answers questions related to the provided context.
-    Refuses to answer questions outside the application context.
-    """
-    # Join context chunks into a single block
-    if contexts:
-        context_text = "\n\n".join(
-            f"[Source {i+1}]\n{chunk}" for i, chunk in enumerate(contexts)
-        )
-    else:
-        # Empty context - model should refuse to answer
-        context_text = "No external context was retrieved for this question. This means no relevant documents were found."
+    base_url: str | None = None,
+) -> ContextManager[BaseChatModel]:
+    """Like get_llm, but keeps the client open until the ``with`` block exits."""
+    key, factory = _pool_entry(model, provider_type, api_key, base_url)
+    return resources.lease_llm_client(key, factory, closer=_close_llm)
+
+
+def _connect(target: LLMTarget) -> ContextManager[BaseChatModel]:
+    return lease_llm(
+        model=target.model,
+        provider_type=target.provider_type,
+        api_key=target.api_key,
+        base_url=target.base_url,
+    )
+
+
+# Every generation goes through the gateway: fair queueing, retries and fallback
+gateway = LLMGateway(_connect)
+
+
+NO_CONTEXT_TEXT = "No external context was retrieved for this question. This means no relevant documents were found."
 
-    # Build messages list with system prompt and conversation history
-    messages = [SystemMessage(content=EDUQUILL_SYSTEM_PROMPT)]
-    
-    # Add conversation history from LangChain memory if session exists
-    if session_id:
-        history_messages = get_history_messages(session_id)
-        # Add previous conversation messages
-        messages.extend(history_messages)
-    
-    # Add context and current query as a formatted user message
-    user_prompt = f"""You are continuing a tutoring session.
+
+def _render_user_prompt(context_text: str, query: str) -> str:
+    """Format the context and current query as the final user message."""
+    return f"""You are continuing a tutoring session.
 
 CONTEXT (retrieved from the knowledge base):
 {context_text}
@@ -158,13 +234,103 @@ CRITICAL INSTRUCTIONS - READ CAREFULLY:
    - Do NOT add information from your general knowledge that is not in the CONTEXT.
 4. **Remember: You are STRICTLY limited to the uploaded documents. Questions outside this scope must be refused.**
 """
-    
-    messages.append(HumanMessage(content=user_prompt))
 
-    llm = get_llm(model=model, provider_type=provider_type, api_key=api_key)
-    
-    # Run the synchronous invoke in a thread pool to avoid blocking
-    loop = asyncio.get_event_loop()
-    response = await loop.run_in_executor(None, lambda: llm.invoke(messages))
+
+def build_messages(
+    query: str,
+    contexts: List[str],
+    session_id: str | None = None,
+    model: str = "llama3",
+    metadatas: List[dict] | None = None,
+    scores: List[float] | None = None,
+    history: List[BaseMessage] | None = None,
+) -> PromptBuild:
+    """
+    Build the system prompt, conversation history and context-grounded user message.
+
+    The prompt is fitted to the model's context window; see build_prompt for
+    how the token budget is split. Pass ``history`` when it is already loaded,
+    otherwise it is read from the session memory of ``session_id``.
+
+    Returns:
+        PromptBuild with the messages and per-part token usage
+    """
+    # Add conversation history from session memory if session exists
+    if history is not None:
+        history_messages = history
+    else:
+        history_messages = get_history_messages(session_id) if session_id else []
+
+    return build_prompt(
+        EDUQUILL_SYSTEM_PROMPT,
+        query,
+        contexts,
+        render_user_prompt=_render_user_prompt,
+        empty_context_text=NO_CONTEXT_TEXT,
+        history=history_messages,
+        metadatas=metadatas,
+        scores=scores,
+        context_window=get_context_window(model),
+    )
+
+
+async def generate_answer(
+    query: str,
+    contexts: List[str],
+    session_id: str | None = None,
+    model: str = "llama3",
+    provider_type: Literal["ollama", "groq"] = "ollama",
+    api_key: str | None = None,
+    prompt: PromptBuild | None = None,
+    timer: StageTimer | None = None,
+    queue_key: Hashable | None = None,
+) -> str:
+    """Generate answer using LangChain ChatOllama LLM with conversation memory.
     
-    return response.content if hasattr(response, 'content') else str(response)
+    STRICT MODE: Only answers questions related to the provided context.
+    Refuses to answer questions outside the application context.
+
+    Pass ``prompt`` (from build_messages) to reuse an already assembled prompt,
+    and ``timer`` to collect the LLM's queueing, prefill and generation times.
+    The call goes through the provider gateway (see LLMGateway); ``queue_key``
+    identifies the client for fair queueing and defaults to the session.
+    """
+    if prompt is None:
+        prompt = build_messages(query, contexts, session_id=session_id, model=model)
+    return await gateway.generate(
+        prompt,
+        model,
+        provider_type,
+        api_key=api_key,
+        timer=timer,
+        queue_key=queue_key or session_id,
+    )
+
+
+async def stream_answer(
+    query: str,
+    contexts: List[str],
+    session_id: str | None = None,
+    model: str = "llama3",
+    provider_type: Literal["ollama", "groq"] = "ollama",
+    api_key: str | None = None,
+    prompt: PromptBuild | None = None,
+    timer: StageTimer | None = None,
+    queue_key: Hashable | None = None,
+) -> AsyncIterator[str]:
+    """Stream the answer token by token using the LLM's native async streaming.
+
+    Same prompt and STRICT MODE rules as generate_answer; yields text
+    fragments as soon as the provider emits them.
+    """
+    if prompt is None:
+        prompt = build_messages(query, contexts, session_id=session_id, model=model)
+    async for content in gateway.stream(
+        prompt,
+        model,
+        provider_type,
+        api_key=api_key,
+        timer=timer,
+        queue_key=queue_key or session_id,
+    ):
+        yield content
@@ -0,0 +1,401 @@
+import asyncio
+import hashlib
+import json
+import os
+import random
+import time
+from collections import OrderedDict, deque
+from typing import AsyncIterator, Callable, ContextManager, Hashable
+
+import httpx
+from langchain_core.language_models.chat_models import BaseChatModel
+
+from app.config import (
+    OLLAMA_BASE_URLS,
+    OLLAMA_MAX_CONCURRENCY,
+    GROQ_MAX_CONCURRENCY,
+    LLM_FALLBACK_GROQ_MODEL,
+    LLM_FIRST_TOKEN_TIMEOUT_SECONDS,
+    LLM_TIMEOUT_SECONDS,
+    LLM_MAX_RETRIES,
+    LLM_RETRY_BACKOFF_SECONDS,
+    LLM_SINGLE_FLIGHT,
+)
+from app.rag import metrics, rate_limit
+from app.rag.metrics import StageTimer
+from app.rag.prompt_builder import PromptBuild
+from app.rag.resources import hash_api_key
+
+# HTTP statuses worth retrying: timeouts, rate limits and server-side failures
+_RETRYABLE_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+_MAX_BACKOFF_SECONDS = 30.0
+
+
+class LLMTarget:
+    """One place a generation can run: a provider, a model and, for Ollama, a server."""
+
+    def __init__(self, provider_type: str, model: str, base_url: str | None = None, api_key: str | None = None):
+        self.provider_type = provider_type
+        self.model = model
+        self.base_url = base_url
+        self.api_key = api_key
+
+    @property
+    def name(self) -> str:
+        """Metric label and limiter key: the Ollama server, or Groq plus a hash of the API key."""
+        if self.provider_type == "ollama":
+            return f"ollama@{self.base_url}"
+        return f"groq@{hash_api_key(self.api_key or os.getenv('GROQ_API_KEY'))}"
+
+
+class FairLimiter:
+    """
+    Async concurrency limit whose waiters are served round-robin by key.
+
+    Each key (a chat session, a batch request) has its own FIFO queue and a
+    freed slot goes to the next key in turn, so one client with many queued
+    requests cannot starve the others.
+    """
+
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = max(1, limit)
+        self.active = 0
+        self._queues: "OrderedDict[Hashable, deque[asyncio.Future]]" = OrderedDict()
+        self.acquired = 0
+        self.waited_seconds = 0.0
+
+    @property
+    def waiting(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    def load(self) -> float:
+        return (self.active + self.waiting) / self.limit
+
+    def _update_gauges(self):
+        metrics.LLM_QUEUE_DEPTH.labels(self.name).set(self.waiting)
+        metrics.LLM_IN_FLIGHT.labels(self.name).set(self.active)
+
+    async def acquire(self, key: Hashable | None = None):
+        # Requests without a key each count as their own client
+        key = object() if key is None else key
+        started = time.perf_counter()
+        if self.active < self.limit and not self._queues:
+            self.active += 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            self._queues.setdefault(key, deque()).append(future)
+            self._update_gauges()
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    # The slot was handed over just as we were cancelled
+                    self.release()
+                else:
+                    queue = self._queues.get(key)
+                    if queue is not None and future in queue:
+                        queue.remove(future)
+                        if not queue:
+                            del self._queues[key]
+                    self._update_gauges()
+                raise
+        waited = time.perf_counter() - started
+        self.acquired += 1
+        self.waited_seconds += waited
+        metrics.LLM_QUEUE_WAIT_SECONDS.labels(self.name).observe(waited)
+        self._update_gauges()
+
+    def release(self):
+        """Hand the slot to the next waiting key, or free it."""
+        while self._queues:
+            key, queue = next(iter(self._queues.items()))
+            future = queue.popleft()
+            if queue:
+                self._queues.move_to_end(key)
+            else:
+                del self._queues[key]
+            if not future.done():
+                future.set_result(None)
+                self._update_gauges()
+                return
+        self.active -= 1
+        self._update_gauges()
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.limit,
+            "active": self.active,
+            "waiting": self.waiting,
+            "acquired": self.acquired,
+            "waited_seconds": self.waited_seconds,
+        }
+
+
+def _is_retryable(exc: BaseException) -> bool:
+    """Transient failures: timeouts, connection errors, rate limits and 5xx, anywhere in the cause chain."""
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        if isinstance(exc, (asyncio.TimeoutError, ConnectionError, httpx.TransportError)):
+            return True
+        status = getattr(exc, "status_code", None) or getattr(getattr(exc, "response", None), "status_code", None)
+        if status in _RETRYABLE_STATUSES:
+            return True
+        exc = exc.__cause__ or exc.__context__
+    return False
+
+
+def _retry_after(exc: BaseException) -> float | None:
+    """Seconds from a Retry-After header on the error's response, if any."""
+    headers = getattr(getattr(exc, "response", None), "headers", None)
+    try:
+        return float(headers.get("retry-after")) if headers else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _backoff(attempt: int, exc: BaseException) -> float:
+    """Exponential backoff with jitter, or the provider's Retry-After when it sent one."""
+    delay = _retry_after(exc)
+    if delay is None:
+        delay = LLM_RETRY_BACKOFF_SECONDS * 2 ** (attempt - 1) * random.uniform(0.5, 1.5)
+    return min(delay, _MAX_BACKOFF_SECONDS)
+
+
+async def _timed_stream(
+    llm: BaseChatModel,
+    prompt: PromptBuild,
+    model: str,
+    provider_type: str,
+    timer: StageTimer,
+) -> AsyncIterator[str]:
+    """
+    Stream the LLM's reply, timing prefill and generation separately.
+
+    ``llm_prefill`` runs until the first token arrives (network and prompt
+    processing); ``llm_generate`` covers the rest of the reply. Token
+    counts come from the provider's usage metadata when it reports them.
+    """
+    started = time.perf_counter()
+    first_token_at = None
+    chars = 0
+    usage = None
+    try:
+        async for chunk in llm.astream(prompt.messages):
+            usage = getattr(chunk, "usage_metadata", None) or usage
+            content = chunk.content if hasattr(chunk, 'content') else str(chunk)
+            if not content:
+                continue
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+                timer.add("llm_prefill", first_token_at - started)
+            chars += len(content)
+            yield content
+    finally:
+        if first_token_at is not None:
+            generation_seconds = time.perf_counter() - first_token_at
+            timer.add("llm_generate", generation_seconds)
+            usage = usage or {}
+            metrics.record_llm_call(
+                provider_type,
+                model,
+                prompt_tokens=usage.get("input_tokens") or prompt.usage.get("total", 0),
+                completion_tokens=usage.get("output_tokens") or (chars + 3) // 4,
+                generation_seconds=generation_seconds,
+            )
+
+
+class LLMGateway:
+    """
+    Runs every LLM generation through per-target concurrency limits.
+
+    For each request the gateway:
+    - picks targets in order: the least busy Ollama server first, the other
+      servers next, then the Groq fallback model if one is configured;
+    - waits for a slot in the target's fair queue;
+    - retries transient errors with backoff, then fails over to the next
+      target. Errors after the first token has been streamed are not
+      retried, since the client has already seen part of the answer;
+    - enforces a first-token timeout and an overall timeout per attempt.
+
+    ``generate`` also coalesces identical prompts that are in flight at the
+    same time into one generation (single-flight).
+    """
+
+    def __init__(self, connect: Callable[[LLMTarget], ContextManager[BaseChatModel]]):
+        self._connect = connect
+        self._limiters: dict[str, FairLimiter] = {}
+        # flight key -> [task, number of callers waiting on it]
+        self._in_flight: dict[str, list] = {}
+        self.coalesced = 0
+        self.retries = 0
+        self.fallbacks = 0
+
+    def _limiter(self, target: LLMTarget) -> FairLimiter:
+        limiter = self._limiters.get(target.name)
+        if limiter is None:
+            limit = OLLAMA_MAX_CONCURRENCY if target.provider_type == "ollama" else GROQ_MAX_CONCURRENCY
+            limiter = self._limiters[target.name] = FairLimiter(target.name, limit)
+        return limiter
+
+    def _targets(self, model: str, provider_type: str, api_key: str | None) -> list[LLMTarget]:
+        if provider_type != "ollama":
+            return [LLMTarget(provider_type, model, api_key=api_key)]
+        servers = [LLMTarget("ollama", model, base_url=url) for url in OLLAMA_BASE_URLS]
+        # Stable sort: equally busy servers keep their configured order
+        servers.sort(key=lambda target: self._limiter(target).load())
+        if LLM_FALLBACK_GROQ_MODEL and os.getenv("GROQ_API_KEY"):
+            servers.append(LLMTarget("groq", LLM_FALLBACK_GROQ_MODEL))
+        return servers
+
+    async def _attempt(self, target: LLMTarget, prompt: PromptBuild, timer: StageTimer) -> AsyncIterator[str]:
+        """
+        One generation on one target, under the first-token and overall timeouts.
+
+        A single timeout is rescheduled around each wait for the next chunk,
+        rather than wrapping every chunk in ``wait_for`` (a task and a timer
+        per token). It is disarmed while the caller handles a chunk, so it
+        never cancels the caller's own code; an expired deadline is raised at
+        the next wait instead.
+        """
+        # Checked out for the whole attempt, so pool eviction cannot close it mid-stream
+        with self._connect(target) as llm:
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + LLM_TIMEOUT_SECONDS if LLM_TIMEOUT_SECONDS > 0 else None
+            first_token_deadline = (
+                loop.time() + LLM_FIRST_TOKEN_TIMEOUT_SECONDS if LLM_FIRST_TOKEN_TIMEOUT_SECONDS > 0 else None
+            )
+            if first_token_deadline is not None and deadline is not None:
+                first_token_deadline = min(first_token_deadline, deadline)
+            stream = _timed_stream(llm, prompt, target.model, target.provider_type, timer)
+            try:
+                async with asyncio.timeout(None) as timeout:
+                    when = first_token_deadline or deadline
+                    while True:
+                        timeout.reschedule(when)
+                        try:
+                            content = await stream.__anext__()
+                        except StopAsyncIteration:
+                            return
+                        timeout.reschedule(None)
+                        when = deadline
+                        yield content
+            finally:
+                await stream.aclose()
+
+    async def stream(
+        self,
+        prompt: PromptBuild,
+        model: str,
+        provider_type: str,
+        api_key: str | None = None,
+        timer: StageTimer | None = None,
+        queue_key: Hashable | None = None,
+    ) -> AsyncIterator[str]:
+        """
+        Stream a generation with queueing, retries and fallback.
+
+        ``queue_key`` identifies the client for fair queueing (e.g. the chat
+        session); requests sharing a key are served in order, different keys
+        take turns. Time spent queueing is recorded as ``llm_queue``.
+        """
+        timer = timer or StageTimer()
+        last_error: BaseException | None = None
+        for index, target in enumerate(self._targets(model, provider_type, api_key)):
+            if index:
+                self.fallbacks += 1
+                metrics.LLM_FALLBACKS.labels(target.name).inc()
+            limiter = self._limiter(target)
+            for attempt in range(LLM_MAX_RETRIES + 1):
+                if attempt:
+                    self.retries += 1
+                    metrics.LLM_RETRIES.labels(target.name).inc()
+                    await asyncio.sleep(_backoff(attempt, last_error))
+                await rate_limit.throttle(target.provider_type, target.api_key, tokens=prompt.usage.get("total", 0))
+                with timer.stage("llm_queue"):
+                    await limiter.acquire(queue_key)
+                started = False
+                try:
+                    async for content in self._attempt(target, prompt, timer):
+                        started = True
+                        yield content
+                    return
+                except Exception as exc:
+                    if started or not _is_retryable(exc):
+                        raise
+                    last_error = exc
+                finally:
+                    limiter.release()
+        raise last_error or RuntimeError("No LLM target is configured")
+
+    def _flight_key(self, prompt: PromptBuild, model: str, provider_type: str, api_key: str | None) -> str:
+        messages = [(message.type, message.content) for message in prompt.messages]
+        payload = json.dumps([provider_type, model, hash_api_key(api_key), messages])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    async def _collect(self, *args) -> str:
+        return "".join([content async for content in self.stream(*args)])
+
+    async def generate(
+        self,
+        prompt: PromptBuild,
+        model: str,
+        provider_type: str,
+        api_key: str | None = None,
+        timer: StageTimer | None = None,
+        queue_key: Hashable | None = None,
+    ) -> str:
+        """
+        Generate a full answer; identical prompts in flight share one generation.
+
+        The first caller runs the shared generation with its own queue key and
+        timer. Callers joining it take no provider slot, so they are not
+        queued; their wait is timed as ``llm_coalesced``. If the shared
+        generation fails or is cancelled, each joined caller runs its own
+        generation, with its own retries and fallback.
+        """
+        timer = timer or StageTimer()
+        args = (prompt, model, provider_type, api_key, timer, queue_key)
+        if not LLM_SINGLE_FLIGHT:
+            return await self._collect(*args)
+
+        key = self._flight_key(prompt, model, provider_type, api_key)
+        flight = self._in_flight.get(key)
+        leader = flight is None
+        if leader:
+            task = asyncio.ensure_future(self._collect(*args))
+            flight = self._in_flight[key] = [task, 0]
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        else:
+            self.coalesced += 1
+            metrics.LLM_COALESCED.inc()
+        task = flight[0]
+        flight[1] += 1
+        try:
+            if leader:
+                return await asyncio.shield(task)
+            with timer.stage("llm_coalesced"):
+                return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if not task.cancelled() or asyncio.current_task().cancelling():
+                # This caller was cancelled: stop generating once nobody is waiting for the answer
+                flight[1] -= 1
+                if flight[1] == 0:
+                    task.cancel()
+                raise
+            if leader:
+                raise
+        except Exception:
+            if leader:
+                raise
+        return await self._collect(*args)
+
+    def stats(self) -> dict:
+        return {
+            "targets": {name: limiter.stats() for name, limiter in self._limiters.items()},
+            "in_flight_prompts": len(self._in_flight),
+            "coalesced": self.coalesced,
+            "retries": self.retries,
+            "fallbacks": self.fallbacks,
+        }
@@ -0,0 +1,105 @@
+import time
+
+from app.config import EMBEDDING_MODEL_NAME, REBUILD_BATCH_SIZE, REBUILD_PAUSE_MS
+from app.rag import doc_registry, resources, semantic_cache
+from app.rag.chunking import ProgressCallback
+from app.rag.embedding_engine import get_ingest_engine
+from app.rag.embeddings import active_model_name, set_active_model
+
+
+def collection_names() -> list[str]:
+    """Logical collections: the shared one plus one per tenant with documents."""
+    return [resources.DEFAULT_COLLECTION] + [
+        resources.collection_for_tenant(tenant) for tenant in doc_registry.tenants()
+    ]
+
+
+def index_stats() -> dict:
+    """Per-collection chunk and row counts, and the active and configured embedding models."""
+    collections = {}
+    for name in collection_names():
+        store = resources.get_vector_store(name)
+        collections[name] = {"physical": store.collection_name, **store.stats()}
+    active = active_model_name()
+    return {
+        "embedding_model": active,
+        "configured_embedding_model": EMBEDDING_MODEL_NAME,
+        "reembed_needed": active != EMBEDDING_MODEL_NAME,
+        "collections": collections,
+    }
+
+
+def _rebuild(embedding_model: str, reembed: bool, progress: ProgressCallback | None):
+    """
+    Copy every collection into a fresh physical collection, then swap them in.
+
+    Only live chunks are copied, so deleted chunks stop taking space and scan
+    time. With ``reembed`` the chunk texts are embedded again with
+    ``embedding_model`` (in bounded batches, on the ingestion engine's
+    threads); otherwise the stored vectors are copied. Queries keep using the
+    current collections until every copy is complete.
+    """
+    names = collection_names()
+    sources = {name: resources.get_vector_store(name) for name in names}
+    if progress:
+        progress(chunks_total=sum(len(store) for store in sources.values()))
+    engine = get_ingest_engine(embedding_model) if reembed else None
+    version = doc_registry.next_index_version()
+    built = {}
+    done = 0
+    try:
+        for name, source in sources.items():
+            target = resources.open_vector_store(
+                resources.physical_collection_name(name, version), embedding_model
+            )
+            built[name] = target
+            for ids, documents, metadatas, vectors in source.iter_chunks(REBUILD_BATCH_SIZE, embeddings=not reembed):
+                if reembed:
+                    vectors = engine.embed(documents)
+                # add_chunks writes one document at a time
+                by_doc: dict[str, list[int]] = {}
+                for i, metadata in enumerate(metadatas):
+                    by_doc.setdefault(metadata.get("doc_id", ""), []).append(i)
+                for doc_id, positions in by_doc.items():
+                    target.add_chunks(
+                        doc_id=doc_id,
+                        chunks=[documents[i] for i in positions],
+                        metadatas=[metadatas[i] for i in positions],
+                        embeddings=[vectors[i] for i in positions],
+                        ids=[ids[i] for i in positions],
+                    )
+                done += len(ids)
+                if progress:
+                    progress(chunks_embedded=done)
+                if REBUILD_PAUSE_MS:
+                    time.sleep(REBUILD_PAUSE_MS / 1000)
+    except BaseException:
+        for target in built.values():
+            target.drop()
+        raise
+
+    doc_registry.swap_collections(
+        {name: target.collection_name for name, target in built.items()}, embedding_model, reembedded=reembed
+    )
+    set_active_model(embedding_model)
+    resources.swap_vector_stores(built)
+    # Cached answers were computed with query vectors of the old model
+    if reembed:
+        cache = semantic_cache.get_semantic_cache()
+        if cache is not None:
+            cache.clear()
+
+
+def compact_index(progress: ProgressCallback | None = None):
+    """Rebuild every collection without its deleted chunks, keeping the stored vectors."""
+    _rebuild(active_model_name(), reembed=False, progress=progress)
+
+
+def reembed_index(model_name: str | None = None, progress: ProgressCallback | None = None):
+    """
+    Re-embed every chunk with ``model_name`` (default: EDUQUILL_EMBEDDING_MODEL) and make it active.
+
+    Runs after EDUQUILL_EMBEDDING_MODEL was changed; until the swap, queries
+    keep being embedded with the old model and searched in the old index.
+    """
+    _rebuild(model_name or EMBEDDING_MODEL_NAME, reembed=True, progress=progress)
@@ -0,0 +1,144 @@
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator
+
+from prometheus_client import Counter, Gauge, Histogram
+
+_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "eduquill_http_request_seconds",
+    "Time until the response starts, per route",
+    ["method", "route", "status"],
+    buckets=_LATENCY_BUCKETS,
+)
+STAGE_SECONDS = Histogram(
+    "eduquill_stage_seconds",
+    "Time spent per pipeline stage (query, batch or ingest)",
+    ["pipeline", "stage"],
+    buckets=_LATENCY_BUCKETS,
+)
+LLM_PROMPT_TOKENS = Histogram(
+    "eduquill_llm_prompt_tokens",
+    "Prompt tokens per LLM call",
+    ["provider", "model"],
+    buckets=(128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768),
+)
+LLM_COMPLETION_TOKENS = Histogram(
+    "eduquill_llm_completion_tokens",
+    "Generated tokens per LLM call",
+    ["provider", "model"],
+    buckets=(16, 32, 64, 128, 256, 512, 1024, 2048, 4096),
+)
+LLM_TOKENS_PER_SECOND = Histogram(
+    "eduquill_llm_tokens_per_second",
+    "Generation speed after the first token",
+    ["provider", "model"],
+    buckets=(1, 2, 5, 10, 20, 30, 50, 75, 100, 150, 200, 300, 500, 1000),
+)
+LLM_QUEUE_DEPTH = Gauge(
+    "eduquill_llm_queue_depth",
+    "LLM requests waiting for a provider slot",
+    ["target"],
+    multiprocess_mode="livesum",
+)
+LLM_IN_FLIGHT = Gauge(
+    "eduquill_llm_in_flight",
+    "LLM requests holding a provider slot",
+    ["target"],
+    multiprocess_mode="livesum",
+)
+LLM_QUEUE_WAIT_SECONDS = Histogram(
+    "eduquill_llm_queue_wait_seconds",
+    "Time spent waiting for a provider slot",
+    ["target"],
+    buckets=_LATENCY_BUCKETS,
+)
+LLM_RETRIES = Counter("eduquill_llm_retries", "LLM attempts retried after a transient error", ["target"])
+LLM_FALLBACKS = Counter("eduquill_llm_fallbacks", "LLM requests moved to a fallback target", ["target"])
+LLM_COALESCED = Counter("eduquill_llm_coalesced", "LLM requests answered by an identical in-flight request")
+INGEST_PAGES = Counter("eduquill_ingest_pages", "PDF pages parsed")
+INGEST_CHUNKS = Counter(
+    "eduquill_ingest_chunks",
+    "Chunks ingested, by whether they were embedded or reused unchanged",
+    ["kind"],
+)
+
+# Stage timings of the current HTTP request, when timing headers are enabled
+_request_timings: ContextVar[dict | None] = ContextVar("eduquill_request_timings", default=None)
+
+
+class StageTimer:
+    """
+    Accumulates time per stage over one pipeline run.
+
+    ``observe()`` reports every stage (plus the run's ``total``) to the
+    stage histogram and to the current request's timing headers. A timer
+    created without a pipeline name only accumulates, so functions can take
+    an optional timer and always time their stages.
+    """
+
+    def __init__(self, pipeline: str | None = None):
+        self.pipeline = pipeline
+        self.durations: dict[str, float] = {}
+        self._started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float):
+        with self._lock:
+            self.durations[stage] = self.durations.get(stage, 0.0) + seconds
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def observe(self, total: bool = True):
+        """Report the accumulated stages; ``total`` adds the time since the timer was created."""
+        if self.pipeline is None:
+            return
+        with self._lock:
+            durations = dict(self.durations)
+        if total:
+            durations["total"] = time.perf_counter() - self._started
+        for stage, seconds in durations.items():
+            STAGE_SECONDS.labels(self.pipeline, stage).observe(seconds)
+        request_timings = _request_timings.get()
+        if request_timings is not None:
+            for stage, seconds in durations.items():
+                request_timings[stage] = request_timings.get(stage, 0.0) + seconds
+
+
+def record_llm_call(
+    provider_type: str,
+    model: str,
+    prompt_tokens: int,
+    completion_tokens: int,
+    generation_seconds: float,
+):
+    """Record token counts and generation speed of one LLM call."""
+    LLM_PROMPT_TOKENS.labels(provider_type, model).observe(prompt_tokens)
+    LLM_COMPLETION_TOKENS.labels(provider_type, model).observe(completion_tokens)
+    if generation_seconds > 0 and completion_tokens > 1:
+        LLM_TOKENS_PER_SECOND.labels(provider_type, model).observe(completion_tokens / generation_seconds)
+
+
+@contextmanager
+def collect_request_timings() -> Iterator[dict]:
+    """Collect the stage timings observed while handling the current request."""
+    timings: dict[str, float] = {}
+    token = _request_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _request_timings.reset(token)
+
+
+def server_timing_header(timings: dict[str, float]) -> str:
+    """Format timings (seconds) as a Server-Timing header value (milliseconds)."""
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.items())
@@ -0,0 +1,679 @@
+import json
+import os
+import shutil
+import sqlite3
+import threading
+from typing import Any, Dict, Iterator, List
+
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from app.config import (
+    HYBRID_CANDIDATE_FACTOR,
+    RETRIEVAL_MODE,
+    VECTOR_INDEX_DIR,
+    VECTOR_QUANTIZATION,
+    VECTOR_IVF_MIN_ROWS,
+    VECTOR_IVF_LISTS,
+    VECTOR_IVF_NPROBE,
+    VECTOR_RERANK_FACTOR,
+)
+from app.rag.embeddings import get_embedding_model
+from app.rag.lexical_index import BM25Index
+from app.rag.vector_store import RetrievalMode, format_results, fuse_results
+
+QUANTIZATIONS = ("none", "float16", "int8")
+
+_SQL_OPERATORS = {"$eq": "=", "$ne": "!=", "$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<="}
+
+
+def _where_sql(where: Dict) -> tuple[str, list]:
+    """Translate a Chroma-style ``where`` clause into SQL over the JSON metadata column."""
+    for operator, joiner in (("$and", " AND "), ("$or", " OR ")):
+        if operator in where:
+            parts = [_where_sql(condition) for condition in where[operator]]
+            sql = joiner.join(part for part, _ in parts) or "1"
+            return f"({sql})", [param for _, params in parts for param in params]
+
+    clauses = []
+    params: list = []
+    for field, condition in where.items():
+        path = '$."' + field.replace('"', '\\"') + '"'
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        for operator, value in condition.items():
+            if operator in ("$in", "$nin"):
+                negate = "NOT " if operator == "$nin" else ""
+                placeholders = ", ".join("?" * len(value))
+                clauses.append(f"json_extract(metadata, ?) {negate}IN ({placeholders})")
+                params.extend([path, *value])
+            elif operator in _SQL_OPERATORS:
+                clauses.append(f"json_extract(metadata, ?) {_SQL_OPERATORS[operator]} ?")
+                params.extend([path, value])
+            else:
+                raise ValueError(f"Unsupported where operator: {operator}")
+    return "(" + (" AND ".join(clauses) or "1") + ")", params
+
+
+def _inverted_lists(assign: np.ndarray, n_lists: int) -> list[np.ndarray]:
+    """Rows of each IVF partition, in ascending order."""
+    order = np.argsort(assign, kind="stable")
+    bounds = np.searchsorted(assign[order], np.arange(n_lists + 1))
+    return [order[bounds[i]:bounds[i + 1]] for i in range(n_lists)]
+
+
+def _nearest(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Index of the nearest centroid (squared L2) for each vector."""
+    scores = np.einsum("ij,ij->i", centroids, centroids)[None, :] - 2 * vectors @ centroids.T
+    return np.argmin(scores, axis=1).astype(np.int32)
+
+
+class NumpyRetriever(BaseRetriever):
+    """LangChain retriever over a NumpyVectorStore (dense search)."""
+
+    store: Any
+    k: int = 5
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        embedding = self.store.embeddings.embed_query(query)
+        return [doc for doc, _ in self.store._search(embedding, self.k)]
+
+
+class NumpyVectorStore:
+    """
+    Vector store on memory-mapped NumPy matrices, a drop-in for ChromaVectorStore.
+
+    Full-precision vectors live in ``vectors.f32`` and a compact copy (int8
+    with a per-row scale, or float16) next to it. Both are mapped, not
+    loaded, so opening a large collection is instant and only the pages a
+    search touches are read. Small collections are scanned exhaustively on
+    the compact codes; from ``VECTOR_IVF_MIN_ROWS`` rows on they are
+    partitioned with k-means (IVF) and only the ``VECTOR_IVF_NPROBE``
+    nearest partitions are scanned. The best candidates are then re-ranked
+    on the full-precision vectors. Texts and metadata live in SQLite, which
+    also evaluates ``where`` filters. Distances are squared L2, like
+    Chroma's default space.
+    """
+
+    # Rows scored per step of a scan, bounding temporary memory
+    SCAN_BLOCK = 16384
+    INITIAL_CAPACITY = 1024
+    KMEANS_ITERATIONS = 10
+    # Training sample size per IVF partition
+    KMEANS_SAMPLE_PER_LIST = 64
+
+    def __init__(
+        self,
+        collection_name: str = "eduquill_docs",
+        quantization: str = VECTOR_QUANTIZATION,
+        embedding_model: str | None = None,
+    ):
+        """Open (or create) the collection's files and its BM25 lexical index.
+
+        ``embedding_model`` embeds queries passed as text; defaults to the active model.
+        """
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unknown vector quantization: {quantization!r} (expected one of {QUANTIZATIONS})")
+        self.collection_name = collection_name
+        self.quantization = quantization
+        self.directory = os.path.join(VECTOR_INDEX_DIR, collection_name)
+        os.makedirs(self.directory, exist_ok=True)
+        self.embeddings = get_embedding_model(embedding_model)
+        self._lock = threading.RLock()
+
+        self._conn = sqlite3.connect(
+            os.path.join(self.directory, "meta.sqlite3"), check_same_thread=False, timeout=30
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS chunks (
+                row INTEGER PRIMARY KEY,
+                chunk_id TEXT NOT NULL UNIQUE,
+                document TEXT NOT NULL,
+                metadata TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+            """
+        )
+        self._conn.commit()
+
+        state = dict(self._conn.execute("SELECT key, value FROM state"))
+        self.dim = int(state.get("dim", 0))
+        self._count = int(state.get("count", 0))
+        self._ivf_rows = int(state.get("ivf_rows", 0))
+        self._capacity = 0
+        self._vectors = self._codes = self._scales = self._norms = self._alive = self._assign = None
+        self._centroids = None
+        # Rows of each IVF partition, so a search reads only the probed ones
+        self._lists: list[np.ndarray] | None = None
+
+        if self.dim:
+            capacity = os.path.getsize(os.path.join(self.directory, "alive.u1"))
+            self._map(max(capacity, self._count, self.INITIAL_CAPACITY))
+            if state.get("quantization") != quantization:
+                # Quantization setting changed: rebuild the codes from full-precision vectors
+                self._encode_range(0, self._count)
+                self._flush()
+                self._set_state(quantization=quantization)
+            centroids_path = os.path.join(self.directory, "centroids.npy")
+            if self._ivf_rows and os.path.exists(centroids_path):
+                self._centroids = np.load(centroids_path)
+                self._lists = _inverted_lists(np.asarray(self._assign[:self._count]), len(self._centroids))
+
+        self.lexical = BM25Index(os.path.join(self.directory, "lexical.sqlite3"))
+
+    # --- Storage ---
+
+    def _matrix(self, name: str, dtype, capacity: int, cols: int | None = None) -> np.memmap:
+        """Map a file as a (capacity[, cols]) array, growing the file if needed."""
+        path = os.path.join(self.directory, name)
+        shape = (capacity, cols) if cols else (capacity,)
+        size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        with open(path, "ab") as f:
+            if os.path.getsize(path) < size:
+                f.truncate(size)
+        return np.memmap(path, dtype=dtype, mode="r+", shape=shape)
+
+    def _map(self, capacity: int):
+        """(Re)map every matrix with room for ``capacity`` rows. Caller holds the lock."""
+        self._vectors = self._matrix("vectors.f32", np.float32, capacity, self.dim)
+        if self.quantization == "int8":
+            self._codes = self._matrix("codes.i8", np.int8, capacity, self.dim)
+            self._scales = self._matrix("scales.f32", np.float32, capacity)
+        elif self.quantization == "float16":
+            self._codes = self._matrix("codes.f16", np.float16, capacity, self.dim)
+        else:
+            self._codes = self._vectors
+        self._norms = self._matrix("norms.f32", np.float32, capacity)
+        self._alive = self._matrix("alive.u1", np.uint8, capacity)
+        self._assign = self._matrix("assign.i32", np.int32, capacity)
+        self._capacity = capacity
+
+    def _flush(self):
+        for matrix in (self._vectors, self._codes, self._scales, self._norms, self._alive, self._assign):
+            if matrix is not None:
+                matrix.flush()
+
+    def _set_state(self, **values):
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)",
+            [(key, str(value)) for key, value in values.items()],
+        )
+        self._conn.commit()
+
+    def _encode(self, rows, vectors: np.ndarray):
+        """Write the quantized codes of ``vectors`` at ``rows``, with their squared norms."""
+        if self.quantization == "int8":
+            scales = np.abs(vectors).max(axis=1) / 127.0
+            scales[scales == 0] = 1.0
+            codes = np.rint(vectors / scales[:, None]).astype(np.int8)
+            self._codes[rows] = codes
+            self._scales[rows] = scales
+            decoded = codes.astype(np.float32) * scales[:, None]
+        elif self.quantization == "float16":
+            codes = vectors.astype(np.float16)
+            self._codes[rows] = codes
+            decoded = codes.astype(np.float32)
+        else:
+            decoded = vectors
+        # Norms of the decoded vectors keep the scan to one matrix-vector product
+        self._norms[rows] = np.einsum("ij,ij->i", decoded, decoded)
+
+    def _encode_range(self, start: int, end: int):
+        for lo in range(start, end, self.SCAN_BLOCK):
+            hi = min(end, lo + self.SCAN_BLOCK)
+            self._encode(slice(lo, hi), np.asarray(self._vectors[lo:hi]))
+
+    def _rows_for_ids(self, ids: List[str]) -> dict[str, int]:
+        rows = {}
+        for start in range(0, len(ids), 500):
+            batch = ids[start:start + 500]
+            placeholders = ", ".join("?" * len(batch))
+            rows.update(
+                self._conn.execute(
+                    f"SELECT chunk_id, row FROM chunks WHERE chunk_id IN ({placeholders})", batch
+                ).fetchall()
+            )
+        return rows
+
+    # --- IVF partitioning ---
+
+    def _maybe_train(self):
+        """Partition the collection once it is large, and again each time it doubles."""
+        if self._count >= VECTOR_IVF_MIN_ROWS and self._count >= 2 * self._ivf_rows:
+            self._train_ivf()
+
+    def _train_ivf(self):
+        """k-means over a sample of live vectors, then assign every row. Caller holds the lock."""
+        live = np.flatnonzero(self._alive[:self._count])
+        n_lists = min(VECTOR_IVF_LISTS or int(np.sqrt(len(live))), len(live))
+        if n_lists < 2:
+            return
+        rng = np.random.default_rng(0)
+        sample_size = min(len(live), n_lists * self.KMEANS_SAMPLE_PER_LIST)
+        sample = np.asarray(self._vectors[np.sort(rng.choice(live, size=sample_size, replace=False))])
+        centroids = sample[rng.choice(len(sample), size=n_lists, replace=False)].copy()
+        for _ in range(self.KMEANS_ITERATIONS):
+            labels = _nearest(sample, centroids)
+            counts = np.bincount(labels, minlength=n_lists)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            filled = counts > 0
+            centroids[filled] = sums[filled] / counts[filled, None]
+
+        for lo in range(0, self._count, self.SCAN_BLOCK):
+            hi = min(self._count, lo + self.SCAN_BLOCK)
+            self._assign[lo:hi] = _nearest(np.asarray(self._vectors[lo:hi]), centroids)
+        self._assign.flush()
+        np.save(os.path.join(self.directory, "centroids.npy"), centroids)
+        self._centroids = centroids
+        self._lists = _inverted_lists(np.asarray(self._assign[:self._count]), n_lists)
+        self._ivf_rows = self._count
+        self._set_state(ivf_rows=self._count)
+
+    def _move_to_lists(self, rows: np.ndarray, labels: np.ndarray):
+        """Put written rows in the inverted list of their (new) partition. Caller holds the lock."""
+        previous = np.full(len(rows), -1, dtype=np.int64)
+        existing = rows < self._count
+        previous[existing] = self._assign[rows[existing]]
+        changed = previous != labels
+        # Searches keep using the lists they snapshotted, so build new ones
+        lists = list(self._lists)
+        for partition in np.unique(previous[changed & existing]):
+            leaving = rows[changed & (previous == partition)]
+            lists[partition] = lists[partition][~np.isin(lists[partition], leaving)]
+        for partition in np.unique(labels[changed]):
+            lists[partition] = np.union1d(lists[partition], rows[changed & (labels == partition)])
+        self._lists = lists
+
+    # --- Writes ---
+
+    def add_chunks(
+        self,
+        doc_id: str,
+        chunks: List[str],
+        metadatas: List[Dict],
+        start_index: int = 0,
+        embeddings: List[List[float]] | None = None,
+        ids: List[str] | None = None,
+    ):
+        """Add document chunks to the store, same contract as ChromaVectorStore.add_chunks.
+
+        Existing ids are overwritten in place (upsert).
+        """
+        if ids is None:
+            ids = [f"{doc_id}_{i}" for i in range(start_index, start_index + len(chunks))]
+        if not ids:
+            return
+        if embeddings is None:
+            embeddings = self.embeddings.embed_documents(list(chunks))
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        metadatas = [{**meta, "doc_id": doc_id} for meta in metadatas]
+
+        with self._lock:
+            if not self.dim:
+                self.dim = matrix.shape[1]
+                self._map(self.INITIAL_CAPACITY)
+                self._set_state(dim=self.dim, quantization=self.quantization)
+            if matrix.shape[1] != self.dim:
+                raise ValueError(
+                    f"Embedding dimension {matrix.shape[1]} does not match collection dimension {self.dim}"
+                )
+
+            row_of = self._rows_for_ids(ids)
+            next_row = self._count
+            rows = np.empty(len(ids), dtype=np.int64)
+            for i, chunk_id in enumerate(ids):
+                if chunk_id not in row_of:
+                    row_of[chunk_id] = next_row
+                    next_row += 1
+                rows[i] = row_of[chunk_id]
+            if next_row > self._capacity:
+                self._map(max(next_row, 2 * self._capacity))
+
+            self._vectors[rows] = matrix
+            self._encode(rows, matrix)
+            self._alive[rows] = 1
+            if self._centroids is not None:
+                labels = _nearest(matrix, self._centroids)
+                self._move_to_lists(rows, labels)
+                self._assign[rows] = labels
+            else:
+                self._assign[rows] = 0
+            # Vectors reach the disk before the rows become visible in SQLite
+            self._flush()
+
+            self._conn.executemany(
+                """
+                INSERT INTO chunks (row, chunk_id, document, metadata) VALUES (?, ?, ?, ?)
+                ON CONFLICT(chunk_id) DO UPDATE SET
+                    document = excluded.document,
+                    metadata = excluded.metadata
+                """,
+                [
+                    (int(row), chunk_id, chunk, json.dumps(meta))
+                    for row, chunk_id, chunk, meta in zip(rows, ids, chunks, metadatas)
+                ],
+            )
+            self._count = next_row
+            self._set_state(count=next_row)
+            self._maybe_train()
+        self.lexical.add(ids, chunks)
+
+    def update_metadatas(self, ids: List[str], metadatas: List[Dict]):
+        """Replace the metadata of existing chunks without re-embedding them."""
+        if ids:
+            with self._lock:
+                self._conn.executemany(
+                    "UPDATE chunks SET metadata = ? WHERE chunk_id = ?",
+                    [(json.dumps(meta), chunk_id) for chunk_id, meta in zip(ids, metadatas)],
+                )
+                self._conn.commit()
+
+    def delete_chunks(self, ids: List[str]):
+        """Delete chunks by id; their rows stay allocated but are never returned."""
+        if not ids:
+            return
+        with self._lock:
+            rows = list(self._rows_for_ids(ids).values())
+            if rows:
+                self._alive[rows] = 0
+                self._alive.flush()
+            self._conn.executemany("DELETE FROM chunks WHERE chunk_id = ?", [(chunk_id,) for chunk_id in ids])
+            self._conn.commit()
+        self.lexical.delete(ids)
+
+    def refresh(self):
+        """Pick up rows written by another process (the ingest leader in multi-worker mode).
+
+        Matrices are shared file mappings, so only the row count, the IVF
+        partitioning and the lexical index need reloading.
+        """
+        with self._lock:
+            state = dict(self._conn.execute("SELECT key, value FROM state"))
+            dim = int(state.get("dim", 0))
+            if dim:
+                count = int(state.get("count", 0))
+                self.dim = dim
+                if self._vectors is None or count > self._capacity:
+                    capacity = os.path.getsize(os.path.join(self.directory, "alive.u1"))
+                    self._map(max(capacity, count, self.INITIAL_CAPACITY))
+                ivf_rows = int(state.get("ivf_rows", 0))
+                if ivf_rows != self._ivf_rows:
+                    self._centroids = np.load(os.path.join(self.directory, "centroids.npy")) if ivf_rows else None
+                    self._ivf_rows = ivf_rows
+                self._count = count
+                # The writer may have added or moved rows in any partition
+                self._lists = (
+                    _inverted_lists(np.asarray(self._assign[:count]), len(self._centroids))
+                    if self._centroids is not None
+                    else None
+                )
+        self.lexical.reload()
+
+    # --- Search ---
+
+    def _rows_matching(self, where: Dict) -> np.ndarray:
+        sql, params = _where_sql(where)
+        with self._lock:
+            rows = self._conn.execute(f"SELECT row FROM chunks WHERE {sql}", params).fetchall()
+        return np.fromiter((row for (row,) in rows), dtype=np.int64, count=len(rows))
+
+    def _ids_matching(self, ids: List[str], where: Dict) -> set[str]:
+        sql, params = _where_sql(where)
+        matching = set()
+        with self._lock:
+            for start in range(0, len(ids), 500):
+                batch = ids[start:start + 500]
+                placeholders = ", ".join("?" * len(batch))
+                matching.update(
+                    chunk_id
+                    for (chunk_id,) in self._conn.execute(
+                        f"SELECT chunk_id FROM chunks WHERE chunk_id IN ({placeholders}) AND {sql}",
+                        batch + params,
+                    )
+                )
+        return matching
+
+    def _fetch_rows(self, rows: List[int]) -> dict[int, Document]:
+        """Documents stored at rows; deleted rows are left out."""
+        documents = {}
+        with self._lock:
+            for start in range(0, len(rows), 500):
+                batch = [int(row) for row in rows[start:start + 500]]
+                placeholders = ", ".join("?" * len(batch))
+                for row, chunk_id, document, metadata in self._conn.execute(
+                    f"SELECT row, chunk_id, document, metadata FROM chunks WHERE row IN ({placeholders})",
+                    batch,
+                ):
+                    documents[row] = Document(page_content=document, metadata=json.loads(metadata), id=chunk_id)
+        return documents
+
+    def _approximate_scores(self, rows, queries: np.ndarray, codes, scales, norms) -> np.ndarray:
+        """(rows, queries) squared L2 from the codes of ``rows``, minus the constant |query|^2."""
+        products = codes[rows].astype(np.float32, copy=False) @ queries.T
+        if self.quantization == "int8":
+            products *= scales[rows][:, None]
+        return norms[rows][:, None] - 2 * products
+
+    def _shortlist(self, candidates: np.ndarray, queries: np.ndarray, size: int, codes, scales, norms) -> list:
+        """Best ``size`` candidate rows per query by approximate distance."""
+        # Contiguous candidates (no deletions, filter or partitioning) are read as slices
+        contiguous = candidates[-1] - candidates[0] + 1 == len(candidates)
+        best_rows = [[] for _ in queries]
+        best_scores = [[] for _ in queries]
+        for lo in range(0, len(candidates), self.SCAN_BLOCK):
+            block_rows = candidates[lo:lo + self.SCAN_BLOCK]
+            selector = slice(block_rows[0], block_rows[-1] + 1) if contiguous else block_rows
+            scores = self._approximate_scores(selector, queries, codes, scales, norms)
+            for j in range(len(queries)):
+                rows, column = block_rows, scores[:, j]
+                if len(column) > size:
+                    keep = np.argpartition(column, size - 1)[:size]
+                    rows, column = rows[keep], column[keep]
+                best_rows[j].append(rows)
+                best_scores[j].append(column)
+
+        shortlists = []
+        for rows, scores in zip(best_rows, best_scores):
+            rows = np.concatenate(rows)
+            scores = np.concatenate(scores)
+            if len(rows) > size:
+                rows = rows[np.argpartition(scores, size - 1)[:size]]
+            shortlists.append(rows)
+        return shortlists
+
+    def _search_many(self, embeddings: List[List[float]], k: int, where: Dict | None = None) -> list:
+        """Top-k (Document, distance) pairs per query: quantized scan, then full-precision re-rank.
+
+        The filter is evaluated once, exhaustive scans score all queries in
+        one matrix product per block, and chunks shared by several results
+        are fetched once.
+        """
+        queries = np.asarray(embeddings, dtype=np.float32).reshape(len(embeddings), -1)
+        with self._lock:
+            count = self._count
+            if not count or k <= 0 or not len(queries):
+                return [[] for _ in queries]
+            # Snapshot the mappings: a concurrent write may remap them
+            vectors, codes, scales, norms, alive = self._vectors, self._codes, self._scales, self._norms, self._alive
+            centroids, lists = self._centroids, self._lists
+
+        allowed = None
+        if where:
+            allowed = np.zeros(count, dtype=bool)
+            matching = self._rows_matching(where)
+            allowed[matching[matching < count]] = True
+
+        def selectable(rows: np.ndarray) -> np.ndarray:
+            """The live rows among ``rows`` that pass the filter."""
+            keep = np.asarray(alive[rows]) != 0
+            if allowed is not None:
+                keep &= allowed[rows]
+            return rows[keep]
+
+        candidates = None
+
+        def all_candidates() -> np.ndarray:
+            nonlocal candidates
+            if candidates is None:
+                candidates = selectable(np.arange(count))
+            return candidates
+
+        shortlist_size = k if self.quantization == "none" else k * max(1, VECTOR_RERANK_FACTOR)
+        if centroids is None:
+            if not len(all_candidates()):
+                return [[] for _ in queries]
+            shortlists = self._shortlist(all_candidates(), queries, shortlist_size, codes, scales, norms)
+        else:
+            n_probe = min(VECTOR_IVF_NPROBE, len(centroids))
+            centroid_distances = np.einsum("ij,ij->i", centroids, centroids)[None, :] - 2 * queries @ centroids.T
+            shortlists = []
+            for query, distances in zip(queries, centroid_distances):
+                probes = np.argpartition(distances, n_probe - 1)[:n_probe]
+                # Only the probed partitions' rows are read, not the whole collection
+                probed = selectable(np.sort(np.concatenate([lists[probe] for probe in probes])))
+                if len(probed) < shortlist_size:
+                    # Too few rows in the probed partitions (e.g. a narrow filter): scan all of them
+                    probed = all_candidates()
+                if not len(probed):
+                    shortlists.append(np.empty(0, dtype=np.int64))
+                    continue
+                shortlists += self._shortlist(probed, query[None, :], shortlist_size, codes, scales, norms)
+
+        # Re-rank each shortlist on full-precision vectors
+        ranked = []
+        for query, rows in zip(queries, shortlists):
+            rows = np.sort(rows)
+            exact = np.sum((np.asarray(vectors[rows]) - query) ** 2, axis=1)
+            order = np.argsort(exact, kind="stable")[:k]
+            ranked.append((rows[order], exact[order]))
+
+        documents = self._fetch_rows(sorted({int(row) for rows, _ in ranked for row in rows}))
+        return [
+            [(documents[int(row)], float(distance)) for row, distance in zip(rows, distances) if int(row) in documents]
+            for rows, distances in ranked
+        ]
+
+    def _search(self, embedding: List[float], k: int, where: Dict | None = None) -> list:
+        """Top-k (Document, distance) pairs for one query."""
+        return self._search_many([embedding], k, where=where)[0]
+
+    def query(
+        self,
+        query: str,
+        top_k: int = 5,
+        embedding: List[float] | None = None,
+        mode: RetrievalMode | None = None,
+        where: Dict | None = None,
+    ):
+        """Query the store; same arguments and result shape as ChromaVectorStore.query."""
+        if embedding is None:
+            embedding = self.embeddings.embed_query(query)
+        return self.query_batch([query], [embedding], top_k=top_k, mode=mode, where=where)[0]
+
+    def query_batch(
+        self,
+        queries: List[str],
+        embeddings: List[List[float]],
+        top_k: int = 5,
+        mode: RetrievalMode | None = None,
+        where: Dict | None = None,
+    ) -> List[Dict]:
+        """Run several queries together; same contract as ChromaVectorStore.query_batch."""
+        mode = mode or RETRIEVAL_MODE
+        if mode != "hybrid":
+            return [format_results(results) for results in self._search_many(embeddings, top_k, where=where)]
+
+        n_candidates = top_k * HYBRID_CANDIDATE_FACTOR
+        dense_lists = self._search_many(embeddings, n_candidates, where=where)
+        lexical_lists = [self.lexical.search(query, k=n_candidates) for query in queries]
+        if where:
+            # The lexical index has no metadata: keep only candidates matching the filter
+            allowed = self._ids_matching(
+                sorted({chunk_id for lexical in lexical_lists for chunk_id, _ in lexical}), where
+            )
+            lexical_lists = [
+                [(chunk_id, score) for chunk_id, score in lexical if chunk_id in allowed]
+                for lexical in lexical_lists
+            ]
+
+        # Chunks found only lexically, shared by every query of the batch
+        known = {doc.id: doc for dense in dense_lists for doc, _ in dense}
+
+        def fetcher(embedding: List[float]):
+            query_vector = np.asarray(embedding, dtype=np.float32)
+
+            def fetch(missing: List[str]) -> list:
+                with self._lock:
+                    row_of = self._rows_for_ids(missing)
+                    vectors = self._vectors
+                unknown = [row_of[chunk_id] for chunk_id in missing if chunk_id in row_of and chunk_id not in known]
+                known.update({doc.id: doc for doc in self._fetch_rows(unknown).values()})
+                found = [chunk_id for chunk_id in missing if chunk_id in row_of and chunk_id in known]
+                if not found:
+                    return []
+                exact = np.asarray(vectors[np.asarray([row_of[chunk_id] for chunk_id in found])])
+                distances = np.sum((exact - query_vector) ** 2, axis=1)
+                return [(known[chunk_id], float(distance)) for chunk_id, distance in zip(found, distances)]
+
+            return fetch
+
+        return [
+            format_results(fuse_results(dense, lexical, top_k, fetcher(embedding)))
+            for dense, lexical, embedding in zip(dense_lists, lexical_lists, embeddings)
+        ]
+
+    def as_retriever(self, k: int = 5):
+        """Get a LangChain retriever for use in chains."""
+        return NumpyRetriever(store=self, k=k)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def iter_chunks(self, batch_size: int = 256, embeddings: bool = True) -> Iterator[tuple]:
+        """Yield (ids, documents, metadatas, vectors or None) for every live chunk, in row order."""
+        last_row = -1
+        while True:
+            with self._lock:
+                page = self._conn.execute(
+                    "SELECT row, chunk_id, document, metadata FROM chunks WHERE row > ? ORDER BY row LIMIT ?",
+                    (last_row, batch_size),
+                ).fetchall()
+                if not page:
+                    return
+                rows = [row for row, _, _, _ in page]
+                vectors = np.asarray(self._vectors[rows]).tolist() if embeddings else None
+            last_row = rows[-1]
+            yield (
+                [chunk_id for _, chunk_id, _, _ in page],
+                [document for _, _, document, _ in page],
+                [json.loads(metadata) for _, _, _, metadata in page],
+                vectors,
+            )
+
+    def stats(self) -> dict:
+        """Live chunks and allocated rows; deleted chunks keep their rows until the index is compacted."""
+        live = len(self)
+        with self._lock:
+            rows = self._count
+        return {"chunks": live, "rows": rows, "dead_rows": rows - live}
+
+    def drop(self):
+        """Close the store and delete its files."""
+        self.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def close(self):
+        """Flush and unmap the matrices and close SQLite and the lexical index."""
+        with self._lock:
+            self._flush()
+            self._vectors = self._codes = self._scales = self._norms = self._alive = self._assign = None
+            self._conn.close()
+        self.lexical.close()
@@ -1,37 +1,248 @@
-from typing import List, Dict, Tuple
-from langchain_community.document_loaders import PyPDFLoader
-try:
-    from langchain_text_splitters import RecursiveCharacterTextSplitter
-except ImportError:
-    from langchain.text_splitter import RecursiveCharacterTextSplitter
-from app.rag.vector_store import ChromaVectorStore
-from app.rag.llm_client import generate_answer
+import asyncio
+import os
+from typing import AsyncIterator, Iterator, List, Dict, Tuple
+from langchain_core.documents import Document
+from langchain_core.messages import BaseMessage
+from app.config import INGEST_WRITE_BATCH_SIZE, BATCH_CONCURRENCY, RERANK_ENABLED, RERANK_CANDIDATE_FACTOR
+from app.rag import doc_registry, semantic_cache
+from app.rag.chunking import ProgressCallback, iter_pdf_chunks
+from app.rag.embeddings import get_embedding_model
+from app.rag.embedding_engine import get_ingest_engine
+from app.rag.resources import collection_for_tenant, get_vector_store
+from app.rag.llm_client import build_messages, generate_answer, stream_answer
+from app.rag.metrics import INGEST_CHUNKS, StageTimer
+from app.rag.prompt_builder import PromptBuild
+from app.rag.query_batcher import embed_query
+from app.rag.reranker import rerank_results
+from app.rag.semantic_cache import SemanticAnswerCache, get_semantic_cache
+from app.rag.session_memory import get_history_messages
+from app.rag.vector_store import RetrievalMode, build_where, tag_metadata
+
+
+def _batched(chunks: Iterator[Document], batch_size: int) -> Iterator[List[Document]]:
+    """Group a chunk stream into lists of at most ``batch_size``."""
+    batch: List[Document] = []
+    for chunk in chunks:
+        batch.append(chunk)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def new_chunk_id(doc_id: str, chunk_hash: str, used_ids: set[str]) -> str:
+    """Id for a new chunk of ``doc_id`` with ``chunk_hash``, not clashing with ``used_ids``.
+
+    Identical text may appear several times in one document: later copies
+    get the first free ``_<n>`` suffix, skipping ids already taken by reused
+    chunks of the previous revision.
+    """
+    base = f"{doc_id}_{chunk_hash[:16]}"
+    chunk_id, n = base, 0
+    while chunk_id in used_ids:
+        n += 1
+        chunk_id = f"{base}_{n}"
+    return chunk_id
 
 
 def pdf_to_chunks(file_path: str, chunk_size: int = 400, overlap: int = 50) -> List[str]:
     """Load PDF and split into chunks using LangChain."""
-    loader = PyPDFLoader(file_path)
-    documents = loader.load()
-    
-    # Use LangChain's RecursiveCharacterTextSplitter
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=chunk_size,
-        chunk_overlap=overlap,
-        length_function=len,
-        separators=["\n\n", "\n", " ", ""]
+    return [
+        chunk.page_content
+        for chunk in iter_pdf_chunks(file_path, chunk_size=chunk_size, overlap=overlap)
+    ]
+
+
+def ingest_document(
+    file_path: str,
+    doc_id: str,
+    title: str,
+    progress: ProgressCallback | None = None,
+    tenant: str | None = None,
+    tags: List[str] | None = None,
+):
+    """Ingest document into vector store using LangChain.
+
+    Chunks are streamed page by page, so memory grows with a window of pages
+    rather than the whole document. Parsing and chunking of later pages
+    overlaps with embedding of earlier batches; embedded chunks are written
+    to Chroma in bulk batches.
+
+    Ingestion is incremental: chunks are identified by a hash of their text,
+    so re-ingesting a revised document only embeds and inserts the chunks
+    that changed, re-labels unchanged ones, and deletes chunks that are gone.
+
+    Args:
+        file_path: Path of the PDF to ingest
+        doc_id: Document identifier used as chunk id prefix
+        title: Human readable title stored in chunk metadata
+        progress: Optional callback receiving keyword counters
+            (pages_parsed, chunks_total, chunks_embedded) as ingestion advances
+        tenant: Optional tenant; its documents go to a dedicated collection
+        tags: Optional tags stored on every chunk, usable as retrieval filters
+    """
+    store = get_vector_store(collection_for_tenant(tenant))
+    engine = get_ingest_engine()
+    # load/split/embed run in overlapping threads, so their times may add up to more than total
+    timer = StageTimer("ingest")
+
+    # Chunks already indexed for this document, by content hash
+    existing = doc_registry.get_chunk_ids_by_hash(doc_id)
+    previous_ids = {chunk_id for ids in existing.values() for chunk_id in ids}
+    document = doc_registry.get_document(doc_id)
+    if document and document["embedding_model"] not in (None, store.embeddings.model_name):
+        # Vectors of another model cannot be reused: embed every chunk again
+        existing = {}
+    # Every chunk id assigned so far, reused or new
+    used_ids: set[str] = set()
+    chunk_rows: list[tuple[str, str, int, int]] = []
+
+    def plan(batches: Iterator[List[Document]]) -> Iterator[list[tuple]]:
+        """Assign chunk ids, reusing existing ones for unchanged content (producer thread)."""
+        index = 0
+        for batch in batches:
+            planned = []
+            for chunk in batch:
+                chunk_hash = doc_registry.hash_text(chunk.page_content)
+                reusable = existing.get(chunk_hash)
+                if reusable:
+                    chunk_id, is_new = reusable.pop(0), False
+                else:
+                    chunk_id, is_new = new_chunk_id(doc_id, chunk_hash, used_ids), True
+                used_ids.add(chunk_id)
+                chunk.metadata.update(
+                    {"doc_id": doc_id, "title": title, "chunk_index": index, "chunk_hash": chunk_hash}
+                )
+                chunk.metadata.update(tag_metadata(tags))
+                chunk_rows.append((chunk_id, chunk_hash, index, len(chunk.page_content)))
+                planned.append((chunk, chunk_id, is_new))
+                index += 1
+            yield planned
+
+    new_chunks: List[Document] = []
+    new_ids: List[str] = []
+    new_vectors: List[List[float]] = []
+    kept_ids: List[str] = []
+    kept_metadatas: List[Dict] = []
+    processed = 0
+    # New chunk ids already written to the store, removed again if ingestion fails
+    written_ids: set[str] = set()
+
+    def flush():
+        nonlocal new_chunks, new_ids, new_vectors, kept_ids, kept_metadatas
+        INGEST_CHUNKS.labels("embedded").inc(len(new_chunks))
+        INGEST_CHUNKS.labels("reused").inc(len(kept_ids))
+        if new_chunks:
+            written_ids.update(new_ids)
+            # Page number and char offsets from the chunker are kept in metadata
+            store.add_chunks(
+                doc_id=doc_id,
+                chunks=[chunk.page_content for chunk in new_chunks],
+                metadatas=[chunk.metadata for chunk in new_chunks],
+                embeddings=new_vectors,
+                ids=new_ids,
+            )
+        # Unchanged chunks keep their vectors; only positions/offsets are refreshed
+        store.update_metadatas(kept_ids, kept_metadatas)
+        new_chunks, new_ids, new_vectors, kept_ids, kept_metadatas = [], [], [], [], []
+
+    try:
+        batches = plan(
+            _batched(iter_pdf_chunks(file_path, progress=progress, timer=timer), engine.batch_size)
+        )
+        for planned, vectors in engine.embed_pipelined(
+            batches,
+            texts_of=lambda items: [chunk.page_content for chunk, _, is_new in items if is_new],
+            timer=timer,
+        ):
+            vector_iter = iter(vectors)
+            for chunk, chunk_id, is_new in planned:
+                if is_new:
+                    new_chunks.append(chunk)
+                    new_ids.append(chunk_id)
+                    new_vectors.append(next(vector_iter))
+                else:
+                    kept_ids.append(chunk_id)
+                    kept_metadatas.append(chunk.metadata)
+            processed += len(planned)
+            if progress:
+                progress(chunks_embedded=processed)
+            if len(new_chunks) + len(kept_ids) >= INGEST_WRITE_BATCH_SIZE:
+                with timer.stage("write"):
+                    flush()
+        with timer.stage("write"):
+            flush()
+            current_ids = {chunk_id for chunk_id, _, _, _ in chunk_rows}
+            store.delete_chunks(sorted(previous_ids - current_ids))
+            doc_registry.replace_chunks(doc_id, chunk_rows)
+        doc_registry.set_status(doc_id, "ready", embedding_model=store.embeddings.model_name)
+        # Cached answers citing the previous content are no longer valid
+        semantic_cache.invalidate_document(doc_id)
+    except Exception:
+        # The registry only lists the previous chunks: remove the partial new ones, or
+        # they would stay searchable with no way to delete them
+        try:
+            store.delete_chunks(sorted(written_ids - previous_ids))
+        finally:
+            doc_registry.set_status(doc_id, "failed")
+        raise
+    finally:
+        timer.observe()
+
+
+def delete_document(doc_id: str, progress: ProgressCallback | None = None):
+    """Remove a document's chunks from the index, its uploaded file and its registry entry.
+
+    Args:
+        doc_id: Document to delete
+        progress: Optional callback receiving the number of deleted chunks (chunks_total)
+    """
+    document = doc_registry.get_document(doc_id)
+    if document is None:
+        return
+    store = get_vector_store(collection_for_tenant(document["tenant"]))
+    chunk_ids = sorted(
+        chunk_id for ids in doc_registry.get_chunk_ids_by_hash(doc_id).values() for chunk_id in ids
     )
-    
-    chunks = text_splitter.split_documents(documents)
-    return [chunk.page_content for chunk in chunks]
+    try:
+        store.delete_chunks(chunk_ids)
+    except Exception:
+        # Leave the document listed so the deletion can be retried
+        doc_registry.set_status(doc_id, "failed")
+        raise
+    if progress:
+        progress(chunks_total=len(chunk_ids))
+    try:
+        os.remove(document["file_path"])
+    except FileNotFoundError:
+        pass
+    doc_registry.delete_document(doc_id)
+    semantic_cache.invalidate_document(doc_id)
+
 
+async def _load_history(session_id: str | None) -> List[BaseMessage]:
+    """Conversation history of ``session_id``, read off the event loop."""
+    if not session_id:
+        return []
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, get_history_messages, session_id)
 
-def ingest_document(file_path: str, doc_id: str, title: str):
-    """Ingest document into vector store using LangChain."""
-    store = ChromaVectorStore()
-    chunks = pdf_to_chunks(file_path)
-    metadatas: List[Dict] = [{"doc_id": doc_id, "title": title, "chunk_index": i}
-                             for i in range(len(chunks))]
-    store.add_chunks(doc_id=doc_id, chunks=chunks, metadatas=metadatas)
+
+def _build_prompt(query: str, data: dict, history: List[BaseMessage], model: str) -> PromptBuild:
+    """Assemble the token-budgeted prompt and record its token usage in ``data``."""
+    prompt = build_messages(
+        query,
+        data["docs"],
+        history=history,
+        model=model,
+        metadatas=data["metadatas"],
+        # Results are best first in every mode (by distance, fused rank or re-ranker
+        # score); distances alone would push lexical-only hybrid hits to the back
+        scores=list(range(len(data["docs"]))),
+    )
+    data["prompt_usage"] = prompt.usage
+    return prompt
 
 
 async def rag_answer(
@@ -40,27 +251,328 @@ async def rag_answer(
     session_id: str | None = None,
     model: str = "llama3",
     provider_type: str = "ollama",
-    api_key: str | None = None
+    api_key: str | None = None,
+    retrieval_mode: RetrievalMode | None = None,
+    doc_ids: List[str] | None = None,
+    titles: List[str] | None = None,
+    tags: List[str] | None = None,
+    tenant: str | None = None,
+    rerank: bool | None = None,
 ) -> Tuple[str, dict]:
-    """Perform RAG query using LangChain components."""
-    store = ChromaVectorStore()
-    result = store.query(query, top_k=k)
+    """Perform RAG query using LangChain components.
+
+    ``doc_ids``, ``titles`` and ``tags`` restrict retrieval to matching
+    chunks and ``tenant`` selects the tenant's own collection. ``rerank``
+    turns cross-encoder re-ranking on or off (see retrieve).
 
-    docs: List[str] = result["documents"][0]
-    metadatas = result["metadatas"][0]
-    distances = result["distances"][0]
+    When the semantic answer cache is enabled, a near-identical earlier
+    question in the same scope is answered from the cache without searching
+    or calling the LLM.
+
+    Stage timings (embed, cache, search, rerank, prompt, llm_queue,
+    llm_prefill, llm_generate) are reported to the ``query`` pipeline metrics.
+    """
+    rerank = RERANK_ENABLED if rerank is None else rerank
+    retrieval = {
+        "k": k,
+        "mode": retrieval_mode,
+        "doc_ids": doc_ids,
+        "titles": titles,
+        "tags": tags,
+        "tenant": tenant,
+        "rerank": rerank,
+    }
+    timer = StageTimer("query")
+    with timer.stage("embed"):
+        embedding = await embed_query(query)
+    history = await _load_history(session_id)
+    cache = get_semantic_cache()
+    if cache is not None:
+        with timer.stage("cache"):
+            # Follow-ups only match answers given with the same history
+            scope = cache.scope_key(model, provider_type, retrieval, history)
+            cached = cache.lookup(embedding, scope)
+        if cached is not None:
+            timer.observe()
+            return cached
+
+    loop = asyncio.get_running_loop()
+    data = await loop.run_in_executor(
+        None, lambda: retrieve(query, embedding=embedding, timer=timer, **retrieval)
+    )
+    with timer.stage("prompt"):
+        prompt = _build_prompt(query, data, history, model)
 
     answer = await generate_answer(
         query, 
-        docs, 
+        data["docs"], 
         session_id=session_id,
         model=model,
         provider_type=provider_type,
-        api_key=api_key
+        api_key=api_key,
+        prompt=prompt,
+        timer=timer,
     )
 
-    return answer, {
-        "docs": docs,
-        "metadatas": metadatas,
-        "scores": distances,
-    }
\ No newline at end of file
+    if cache is not None:
+        cache.store(query, embedding, scope, answer, data)
+    timer.observe()
+    return answer, data
+
+
+def retrieve(
+    query: str,
+    k: int = 5,
+    embedding: List[float] | None = None,
+    mode: RetrievalMode | None = None,
+    doc_ids: List[str] | None = None,
+    titles: List[str] | None = None,
+    tags: List[str] | None = None,
+    tenant: str | None = None,
+    rerank: bool | None = None,
+    timer: StageTimer | None = None,
+) -> dict:
+    """Retrieve the top-k chunks for a query (dense or hybrid, see ChromaVectorStore.query).
+
+    Filters are pushed down into the Chroma ``where`` clause, and only the
+    tenant's collection is searched. With ``rerank`` (default
+    EDUQUILL_RERANK), RERANK_CANDIDATE_FACTOR times more candidates are
+    fetched and the cross-encoder keeps the best k above the relevance
+    threshold. Pass ``timer`` to collect the search and rerank times.
+    """
+    rerank = RERANK_ENABLED if rerank is None else rerank
+    timer = timer or StageTimer()
+    store = get_vector_store(collection_for_tenant(tenant))
+    with timer.stage("search"):
+        result = store.query(
+            query,
+            top_k=_candidate_count(k, rerank),
+            embedding=embedding,
+            mode=mode,
+            where=build_where(doc_ids=doc_ids, titles=titles, tags=tags),
+        )
+
+    data = _result_data(result)
+    if rerank:
+        with timer.stage("rerank"):
+            data = rerank_results([query], [data], top_n=k)[0]
+    return data
+
+
+def _candidate_count(k: int, rerank: bool) -> int:
+    """Chunks to fetch from the vector store: over-fetch when re-ranking."""
+    return k * max(1, RERANK_CANDIDATE_FACTOR) if rerank else k
+
+
+def _result_data(result: dict) -> dict:
+    """Flatten a single-query vector store result into the pipeline's data dict."""
+    return {
+        "ids": result["ids"][0],
+        "docs": result["documents"][0],
+        "metadatas": result["metadatas"][0],
+        "scores": result["distances"][0],
+    }
+
+
+async def rag_answer_stream(
+    query: str,
+    k: int = 5,
+    session_id: str | None = None,
+    model: str = "llama3",
+    provider_type: str = "ollama",
+    api_key: str | None = None,
+    retrieval_mode: RetrievalMode | None = None,
+    doc_ids: List[str] | None = None,
+    titles: List[str] | None = None,
+    tags: List[str] | None = None,
+    tenant: str | None = None,
+    rerank: bool | None = None,
+) -> AsyncIterator[Tuple[str, object]]:
+    """Streaming variant of rag_answer.
+
+    Yields ("sources", data) once retrieval is done, then ("token", text)
+    for every fragment produced by the LLM. A semantic cache hit is sent
+    as a single token.
+    """
+    rerank = RERANK_ENABLED if rerank is None else rerank
+    retrieval = {
+        "k": k,
+        "mode": retrieval_mode,
+        "doc_ids": doc_ids,
+        "titles": titles,
+        "tags": tags,
+        "tenant": tenant,
+        "rerank": rerank,
+    }
+    timer = StageTimer("query")
+    with timer.stage("embed"):
+        embedding = await embed_query(query)
+    history = await _load_history(session_id)
+    cache = get_semantic_cache()
+    if cache is not None:
+        with timer.stage("cache"):
+            # Follow-ups only match answers given with the same history
+            scope = cache.scope_key(model, provider_type, retrieval, history)
+            cached = cache.lookup(embedding, scope)
+        if cached is not None:
+            timer.observe()
+            answer, data = cached
+            yield "sources", data
+            yield "token", answer
+            return
+
+    loop = asyncio.get_running_loop()
+    data = await loop.run_in_executor(
+        None, lambda: retrieve(query, embedding=embedding, timer=timer, **retrieval)
+    )
+    with timer.stage("prompt"):
+        prompt = _build_prompt(query, data, history, model)
+    yield "sources", data
+
+    parts: List[str] = []
+    async for token in stream_answer(
+        query,
+        data["docs"],
+        session_id=session_id,
+        model=model,
+        provider_type=provider_type,
+        api_key=api_key,
+        prompt=prompt,
+        timer=timer,
+    ):
+        parts.append(token)
+        yield "token", token
+
+    timer.observe()
+    if cache is not None:
+        cache.store(query, embedding, scope, "".join(parts), data)
+
+
+async def rag_answer_batch(
+    queries: List[str],
+    k: int = 5,
+    model: str = "llama3",
+    provider_type: str = "ollama",
+    api_key: str | None = None,
+    retrieval_mode: RetrievalMode | None = None,
+    doc_ids: List[str] | None = None,
+    titles: List[str] | None = None,
+    tags: List[str] | None = None,
+    tenant: str | None = None,
+    rerank: bool | None = None,
+    concurrency: int = BATCH_CONCURRENCY,
+) -> AsyncIterator[Tuple[int, str | None, dict | None, str | None]]:
+    """Answer a list of independent questions (no session history).
+
+    All queries are embedded in one batched forward pass and searched with a
+    single vector store call, in which chunks shared by several questions
+    are fetched once. Identical questions are answered once. Answers are
+    generated with at most ``concurrency`` LLM calls in flight, subject to
+    the provider's rate limits and the gateway's fair queue.
+
+    The shared stages (embed, cache, search, rerank) are timed once per
+    batch and prompt/LLM stages once per answer, under the ``batch``
+    pipeline metrics.
+
+    Yields:
+        (index, answer, data, error) for every query, in completion order;
+        ``error`` is set and ``answer`` is None when that query failed
+    """
+    rerank = RERANK_ENABLED if rerank is None else rerank
+    retrieval = {
+        "k": k,
+        "mode": retrieval_mode,
+        "doc_ids": doc_ids,
+        "titles": titles,
+        "tags": tags,
+        "tenant": tenant,
+        "rerank": rerank,
+    }
+    loop = asyncio.get_running_loop()
+    positions: Dict[str, List[int]] = {}
+    for index, query in enumerate(queries):
+        positions.setdefault(query, []).append(index)
+    unique = list(positions)
+    timer = StageTimer("batch")
+
+    with timer.stage("embed"):
+        embeddings = await loop.run_in_executor(None, get_embedding_model().embed_queries, unique)
+    embedding_of = dict(zip(unique, embeddings))
+
+    cache = get_semantic_cache()
+    scope = cache.scope_key(model, provider_type, retrieval, []) if cache is not None else None
+    cached = {}
+    if cache is not None:
+        with timer.stage("cache"):
+            for query in unique:
+                hit = cache.lookup(embedding_of[query], scope)
+                if hit is not None:
+                    cached[query] = hit
+    to_search = [query for query in unique if query not in cached]
+
+    store = get_vector_store(collection_for_tenant(tenant))
+    where = build_where(doc_ids=doc_ids, titles=titles, tags=tags)
+    with timer.stage("search"):
+        results = await loop.run_in_executor(
+            None,
+            lambda: store.query_batch(
+                to_search,
+                [embedding_of[query] for query in to_search],
+                top_k=_candidate_count(k, rerank),
+                mode=retrieval_mode,
+                where=where,
+            ),
+        )
+    datas = [_result_data(result) for result in results]
+    if rerank and to_search:
+        # One cross-encoder pass over the candidates of every query
+        with timer.stage("rerank"):
+            datas = await loop.run_in_executor(None, lambda: rerank_results(to_search, datas, top_n=k))
+    data_of = dict(zip(to_search, datas))
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    # The whole batch queues as one client, taking turns with interactive chats
+    queue_key = object()
+
+    async def answer(query: str) -> Tuple[str, dict]:
+        if query in cached:
+            return cached[query]
+        data = data_of[query]
+        answer_timer = StageTimer("batch")
+        async with semaphore:
+            with answer_timer.stage("prompt"):
+                prompt = _build_prompt(query, data, [], model)
+            text = await generate_answer(
+                query,
+                data["docs"],
+                model=model,
+                provider_type=provider_type,
+                api_key=api_key,
+                prompt=prompt,
+                timer=answer_timer,
+                queue_key=queue_key,
+            )
+        answer_timer.observe(total=False)
+        if cache is not None:
+            cache.store(query, embedding_of[query], scope, text, data)
+        return text, data
+
+    tasks = {asyncio.ensure_future(answer(query)): query for query in unique}
+    pending = set(tasks)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                query = tasks[task]
+                try:
+                    text, data = task.result()
+                except Exception as exc:
+                    for index in positions[query]:
+                        yield index, None, data_of.get(query), str(exc)
+                    continue
+                for index in positions[query]:
+                    yield index, text, data, None
+    finally:
+        # The client went away: stop generating the remaining answers
+        for task in pending:
+            task.cancel()
+        timer.observe()
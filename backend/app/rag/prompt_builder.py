@@ -0,0 +1,233 @@
+import json
+import re
+from typing import Callable, List
+
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from app.config import (
+    DEFAULT_CONTEXT_WINDOW,
+    MODEL_CONTEXT_WINDOWS,
+    RESERVED_OUTPUT_TOKENS,
+    HISTORY_BUDGET_SHARE,
+)
+from app.rag.tokens import count_tokens
+
+# Context windows of models offered in the UI that differ from the default
+_KNOWN_CONTEXT_WINDOWS = {
+    "phi3": 4096,
+    "gemma-7b-it": 8192,
+    "llama3": 8192,
+    "mistral": 8192,
+    "mixtral-8x7b-32768": 32768,
+}
+
+# Tokens of older turns kept as a summary when history is cut
+_SUMMARY_BUDGET = 128
+
+
+def get_context_window(model: str) -> int:
+    """Context window (in tokens) used to budget prompts for a model."""
+    overrides = json.loads(MODEL_CONTEXT_WINDOWS) if MODEL_CONTEXT_WINDOWS else {}
+    if model in overrides:
+        return int(overrides[model])
+    return _KNOWN_CONTEXT_WINDOWS.get(model, DEFAULT_CONTEXT_WINDOW)
+
+
+class PromptBuild:
+    """Messages ready for the LLM plus the number of tokens each part used."""
+
+    def __init__(self, messages: list, usage: dict[str, int]):
+        self.messages = messages
+        self.usage = usage
+
+
+def _first_sentence(text: str, max_tokens: int = 24) -> str:
+    sentence = re.split(r"(?<=[.!?])\s", text.strip(), maxsplit=1)[0]
+    max_chars = max_tokens * 4
+    return sentence if len(sentence) <= max_chars else sentence[:max_chars].rstrip() + "…"
+
+
+def _fit_history(history: list, budget: int) -> tuple[list, int]:
+    """
+    Keep the newest exchanges that fit ``budget``, summarising older ones.
+
+    Older user questions are condensed into a single short system note so the
+    model still knows what was covered, without paying for full transcripts.
+    """
+    if not history:
+        return [], 0
+
+    kept: list = []
+    used = 0
+    summary_budget = min(_SUMMARY_BUDGET, budget // 4)
+    cut = len(history)
+    # Walk back one (user, assistant) exchange at a time, newest first
+    for end in range(len(history), 0, -2):
+        exchange = history[max(0, end - 2):end]
+        cost = sum(count_tokens(str(m.content)) for m in exchange)
+        if used + cost > budget - summary_budget:
+            break
+        kept[:0] = exchange
+        used += cost
+        cut = max(0, end - 2)
+
+    older = [m for m in history[:cut] if isinstance(m, HumanMessage)]
+    if older and summary_budget > 0:
+        topics = []
+        summary_used = 0
+        for message in reversed(older):
+            topic = _first_sentence(str(message.content))
+            cost = count_tokens(topic) + 1
+            if summary_used + cost > summary_budget:
+                break
+            topics.insert(0, topic)
+            summary_used += cost
+        if topics:
+            summary = SystemMessage(
+                content="Summary of earlier turns - the student previously asked about: "
+                + "; ".join(topics)
+            )
+            kept.insert(0, summary)
+            used += count_tokens(summary.content)
+    return kept, used
+
+
+def _merge_contexts(
+    contexts: List[str],
+    metadatas: List[dict] | None,
+    scores: List[float] | None,
+) -> list[tuple[str, list[int]]]:
+    """
+    Rank chunks by score, drop duplicates and merge overlapping chunks.
+
+    Returns (text, source numbers) pairs, best first. Source numbers are the
+    1-based positions in the original retrieval results, so citations still
+    match the sources shown to the user.
+    """
+    metadatas = metadatas or [{} for _ in contexts]
+    scores = scores if scores is not None else list(range(len(contexts)))
+    # Lower distance is better
+    order = sorted(range(len(contexts)), key=lambda i: scores[i])
+
+    merged: list[dict] = []
+    seen_texts: set[str] = set()
+    for i in order:
+        text = contexts[i]
+        if text in seen_texts:
+            continue
+        seen_texts.add(text)
+        meta = metadatas[i] or {}
+        start, end = meta.get("start_index"), meta.get("end_index")
+        span_key = (meta.get("doc_id"), meta.get("page"))
+
+        target = None
+        if start is not None and end is not None and span_key != (None, None):
+            for candidate in merged:
+                if (
+                    candidate["key"] == span_key
+                    and candidate["start"] is not None
+                    and start <= candidate["end"]
+                    and end >= candidate["start"]
+                ):
+                    target = candidate
+                    break
+
+        if target is None:
+            merged.append({"key": span_key, "start": start, "end": end, "text": text, "sources": [i + 1]})
+            continue
+
+        # Stitch overlapping spans of the same page together
+        if start <= target["start"] and end >= target["end"]:
+            # The chunk covers the whole merged span
+            target["text"], target["start"], target["end"] = text, start, end
+        elif start < target["start"]:
+            overlap = end - target["start"]
+            target["text"] = text + target["text"][max(0, overlap):]
+            target["start"] = start
+        elif end > target["end"]:
+            overlap = target["end"] - start
+            target["text"] = target["text"] + text[max(0, overlap):]
+            target["end"] = end
+        target["sources"].append(i + 1)
+
+    return [(item["text"], sorted(item["sources"])) for item in merged]
+
+
+def build_prompt(
+    system_prompt: str,
+    query: str,
+    contexts: List[str],
+    render_user_prompt: Callable[[str, str], str],
+    empty_context_text: str,
+    history: list | None = None,
+    metadatas: List[dict] | None = None,
+    scores: List[float] | None = None,
+    context_window: int = DEFAULT_CONTEXT_WINDOW,
+) -> PromptBuild:
+    """
+    Assemble a prompt that fits the model's context window.
+
+    The budget (context window minus tokens reserved for the answer) goes to
+    the system prompt and the instruction block first, then history gets up
+    to HISTORY_BUDGET_SHARE of what is left (newest turns first, older ones
+    summarised) and retrieved chunks get the remainder (best score first,
+    duplicates and overlapping chunks merged).
+
+    Args:
+        system_prompt: System persona and rules
+        query: Student question
+        contexts: Retrieved chunk texts
+        render_user_prompt: Builds the user message from (context text, query)
+        empty_context_text: Context text used when nothing fits or was retrieved
+        history: Conversation history messages, oldest first
+        metadatas: Chunk metadata, used to merge overlapping chunks
+        scores: Chunk distances (lower is better), used for ranking
+        context_window: Model context window in tokens
+
+    Returns:
+        PromptBuild with the messages and per-part token usage
+    """
+    budget = max(0, context_window - RESERVED_OUTPUT_TOKENS)
+    system_tokens = count_tokens(system_prompt)
+    instruction_tokens = count_tokens(render_user_prompt("", query))
+    available = max(0, budget - system_tokens - instruction_tokens)
+
+    history_messages, history_tokens = _fit_history(
+        history or [], int(available * HISTORY_BUDGET_SHARE)
+    )
+
+    context_budget = available - history_tokens
+    blocks: list[str] = []
+    context_tokens = 0
+    for text, sources in _merge_contexts(contexts, metadatas, scores):
+        label = ", ".join(f"Source {n}" for n in sources)
+        block = f"[{label}]\n{text}"
+        cost = count_tokens(block) + 1
+        if context_tokens + cost > context_budget:
+            if blocks:
+                continue
+            # Always keep part of the best chunk
+            block = block[: max(0, context_budget - context_tokens) * 4]
+            cost = count_tokens(block)
+            if not block:
+                break
+        blocks.append(block)
+        context_tokens += cost
+
+    context_text = "\n\n".join(blocks) if blocks else empty_context_text
+    if not blocks:
+        context_tokens = count_tokens(empty_context_text)
+
+    messages = [SystemMessage(content=system_prompt), *history_messages]
+    messages.append(HumanMessage(content=render_user_prompt(context_text, query)))
+
+    usage = {
+        "budget": budget,
+        "system": system_tokens,
+        "history": history_tokens,
+        "context": context_tokens,
+        "instructions": instruction_tokens,
+        "total": system_tokens + history_tokens + context_tokens + instruction_tokens,
+        "chunks_used": len(blocks),
+    }
+    return PromptBuild(messages, usage)
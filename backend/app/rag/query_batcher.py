@@ -0,0 +1,151 @@
+import asyncio
+import threading
+from typing import List
+
+from app.config import QUERY_BATCH_MAX_WAIT_MS, QUERY_BATCH_MAX_SIZE
+from app.rag.embeddings import CachedEmbeddings, get_embedding_model
+
+
+class QueryEmbeddingBatcher:
+    """
+    Async micro-batcher for query embeddings.
+
+    Concurrent ``embed`` calls are queued; a collector task takes the first
+    waiting query, gathers whatever else arrives within ``max_wait_ms`` (up
+    to ``max_batch_size`` queries) and embeds them in one forward pass on a
+    worker thread, while the next batch is already being collected. Queries
+    found in the in-memory embedding cache skip the queue entirely.
+    """
+
+    def __init__(self, embeddings: CachedEmbeddings, max_wait_ms: float = 5.0, max_batch_size: int = 32):
+        self.embeddings = embeddings
+        self.max_wait = max_wait_ms / 1000
+        self.max_batch_size = max(1, max_batch_size)
+        self._queue: asyncio.Queue | None = None
+        self._task: asyncio.Task | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._stats_lock = threading.Lock()
+        # Batch size upper bound (powers of two) -> number of batches
+        self._histogram: dict[int, int] = {}
+        self._batches = 0
+        self._queries = 0
+        self._cached = 0
+
+    def _ensure_started(self):
+        """Start the collector on the running loop (restarting it if the loop changed)."""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._task is None or self._task.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._task = loop.create_task(self._collect())
+
+    async def embed(self, text: str) -> List[float]:
+        """Embed a query, sharing the forward pass with concurrent callers."""
+        vector = self.embeddings.cached_query(text)
+        if vector is not None:
+            with self._stats_lock:
+                self._cached += 1
+            return vector
+
+        self._ensure_started()
+        future = self._loop.create_future()
+        await self._queue.put((text, future, self._loop.time()))
+        return await future
+
+    async def _collect(self):
+        queue = self._queue
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await queue.get()]
+            # The window opens when the oldest query arrived: queries that
+            # queued up during the previous forward pass go out immediately
+            deadline = batch[0][2] + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                try:
+                    if timeout <= 0:
+                        batch.append(queue.get_nowait())
+                    else:
+                        batch.append(await asyncio.wait_for(queue.get(), timeout))
+                except (asyncio.QueueEmpty, asyncio.TimeoutError):
+                    break
+
+            pending = [(text, future) for text, future, _ in batch if not future.cancelled()]
+            if not pending:
+                continue
+            self._record(len(pending))
+            try:
+                vectors = await loop.run_in_executor(
+                    None, self.embeddings.embed_queries, [text for text, _ in pending]
+                )
+            except Exception as exc:
+                for _, future in pending:
+                    if not future.done():
+                        future.set_exception(exc)
+                continue
+            for (_, future), vector in zip(pending, vectors):
+                if not future.done():
+                    future.set_result(vector)
+
+    def _record(self, size: int):
+        bucket = 1
+        while bucket < size:
+            bucket *= 2
+        with self._stats_lock:
+            self._histogram[bucket] = self._histogram.get(bucket, 0) + 1
+            self._batches += 1
+            self._queries += size
+
+    async def close(self):
+        """Stop the collector task."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, RuntimeError):
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        """Batch counters and the batch-size histogram (keyed by power-of-two upper bound)."""
+        with self._stats_lock:
+            return {
+                "max_wait_ms": self.max_wait * 1000,
+                "max_batch_size": self.max_batch_size,
+                "batches": self._batches,
+                "queries": self._queries,
+                "cached": self._cached,
+                "mean_batch_size": self._queries / self._batches if self._batches else 0.0,
+                "batch_size_histogram": {f"<={size}": count for size, count in sorted(self._histogram.items())},
+            }
+
+
+_batcher: QueryEmbeddingBatcher | None = None
+_lock = threading.Lock()
+
+
+def get_query_batcher() -> QueryEmbeddingBatcher:
+    """Get the process-wide query embedding batcher."""
+    global _batcher
+    if _batcher is None:
+        with _lock:
+            if _batcher is None:
+                _batcher = QueryEmbeddingBatcher(
+                    get_embedding_model(),
+                    max_wait_ms=QUERY_BATCH_MAX_WAIT_MS,
+                    max_batch_size=QUERY_BATCH_MAX_SIZE,
+                )
+    # Follow the active model once the index was re-embedded with a new one
+    _batcher.embeddings = get_embedding_model()
+    return _batcher
+
+
+async def embed_query(text: str) -> List[float]:
+    """Embed a chat query through the shared micro-batcher."""
+    return await get_query_batcher().embed(text)
+
+
+async def shutdown():
+    """Stop the batcher if it was created."""
+    if _batcher is not None:
+        await _batcher.close()
@@ -0,0 +1,113 @@
+import asyncio
+import os
+import threading
+import time
+
+from app.config import (
+    GROQ_REQUESTS_PER_MINUTE,
+    GROQ_TOKENS_PER_MINUTE,
+    OLLAMA_REQUESTS_PER_MINUTE,
+)
+from app.rag.resources import hash_api_key
+
+# provider -> (requests per minute, prompt tokens per minute); 0 means unlimited
+PROVIDER_LIMITS = {
+    "groq": (GROQ_REQUESTS_PER_MINUTE, GROQ_TOKENS_PER_MINUTE),
+    "ollama": (OLLAMA_REQUESTS_PER_MINUTE, 0),
+}
+
+
+class RateLimiter:
+    """
+    Async token bucket refilling ``per_minute`` units per minute.
+
+    Bursts of up to one minute's allowance pass immediately; beyond that
+    callers sleep until enough units have been refilled.
+    """
+
+    def __init__(self, per_minute: float):
+        self.per_minute = per_minute
+        self._rate = per_minute / 60
+        self._available = float(per_minute)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.waits = 0
+        self.waited_seconds = 0.0
+
+    def _take(self, amount: float) -> float:
+        """Take ``amount`` units if available; otherwise return the seconds to wait."""
+        with self._lock:
+            now = time.monotonic()
+            self._available = min(self.per_minute, self._available + (now - self._updated) * self._rate)
+            self._updated = now
+            if self._available >= amount:
+                self._available -= amount
+                return 0.0
+            return (amount - self._available) / self._rate
+
+    async def acquire(self, amount: float = 1):
+        # A single request larger than the whole allowance would wait forever
+        amount = min(amount, self.per_minute)
+        while True:
+            wait = self._take(amount)
+            if wait <= 0:
+                return
+            with self._lock:
+                self.waits += 1
+                self.waited_seconds += wait
+            await asyncio.sleep(wait)
+
+
+# (provider, kind, api-key hash) -> limiter
+_limiters: dict[tuple[str, str, str], RateLimiter] = {}
+_lock = threading.Lock()
+
+
+def _limiter(provider_type: str, kind: str, key_hash: str, per_minute: int) -> RateLimiter:
+    key = (provider_type, kind, key_hash)
+    with _lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            limiter = _limiters[key] = RateLimiter(per_minute)
+        return limiter
+
+
+async def throttle(provider_type: str, api_key: str | None = None, tokens: int = 0):
+    """
+    Wait until a request to the provider fits its configured rate limits.
+
+    Limits apply per API key, since that is how providers enforce them.
+
+    Args:
+        provider_type: "ollama" or "groq"
+        api_key: API key of the request (Groq falls back to GROQ_API_KEY)
+        tokens: Estimated prompt tokens, counted against the tokens-per-minute limit
+    """
+    requests_per_minute, tokens_per_minute = PROVIDER_LIMITS.get(provider_type, (0, 0))
+    if provider_type == "groq":
+        api_key = api_key or os.getenv("GROQ_API_KEY")
+    key_hash = hash_api_key(api_key)
+    if requests_per_minute > 0:
+        await _limiter(provider_type, "requests", key_hash, requests_per_minute).acquire()
+    if tokens_per_minute > 0 and tokens > 0:
+        await _limiter(provider_type, "tokens", key_hash, tokens_per_minute).acquire(tokens)
+
+
+def stats() -> dict:
+    """Configured limits and time spent waiting on them, per provider."""
+    with _lock:
+        limiters = list(_limiters.items())
+    result = {
+        provider: {
+            "requests_per_minute": requests_per_minute,
+            "tokens_per_minute": tokens_per_minute,
+            "waits": 0,
+            "waited_seconds": 0.0,
+        }
+        for provider, (requests_per_minute, tokens_per_minute) in PROVIDER_LIMITS.items()
+    }
+    for (provider, _, _), limiter in limiters:
+        entry = result[provider]
+        entry["waits"] += limiter.waits
+        entry["waited_seconds"] += limiter.waited_seconds
+    return result
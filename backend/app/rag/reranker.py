@@ -0,0 +1,146 @@
+import hashlib
+import math
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import List
+
+from app.config import (
+    RERANK_ENABLED,
+    RERANK_MODEL,
+    RERANK_MIN_SCORE,
+    RERANK_BATCH_SIZE,
+    RERANK_CACHE_SIZE,
+)
+
+# Keys of the retrieval data dict that hold one entry per chunk
+_CHUNK_FIELDS = ("ids", "docs", "metadatas", "scores")
+
+
+class CrossEncoderReranker:
+    """
+    Re-ranks retrieved chunks with a small CPU cross-encoder.
+
+    Each (query, chunk) pair is scored jointly, which judges relevance far
+    better than embedding distance. Raw model outputs are squashed to 0-1
+    with a sigmoid so one threshold works across queries. Scores are kept in
+    a bounded LRU, so repeated questions and chunks shared between questions
+    are scored once. The model is loaded on first use.
+    """
+
+    def __init__(self, model_name: str, batch_size: int = 32, cache_size: int = 20000):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.cache_size = cache_size
+        self._model = None
+        self._model_lock = threading.Lock()
+        self._cache: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _get_model(self):
+        with self._model_lock:
+            if self._model is None:
+                from sentence_transformers import CrossEncoder
+
+                self._model = CrossEncoder(self.model_name, device="cpu", max_length=512)
+            return self._model
+
+    def _key(self, query: str, text: str) -> str:
+        digest = hashlib.sha256()
+        digest.update(self.model_name.encode("utf-8") + b"\0")
+        digest.update(query.encode("utf-8") + b"\0")
+        digest.update(text.encode("utf-8"))
+        return digest.hexdigest()
+
+    def score(self, pairs: List[tuple[str, str]]) -> List[float]:
+        """Relevance (0-1) of each (query, text) pair, running the model in batches on cache misses."""
+        keys = [self._key(query, text) for query, text in pairs]
+        scores: list[float | None] = [None] * len(pairs)
+        missing: dict[str, list[int]] = {}
+        with self._lock:
+            for i, key in enumerate(keys):
+                if key in missing:
+                    missing[key].append(i)
+                    continue
+                value = self._cache.get(key)
+                if value is None:
+                    missing[key] = [i]
+                    self.misses += 1
+                else:
+                    self._cache.move_to_end(key)
+                    scores[i] = value
+                    self.hits += 1
+
+        if missing:
+            miss_keys = list(missing)
+            logits = self._get_model().predict(
+                [pairs[missing[key][0]] for key in miss_keys],
+                batch_size=self.batch_size,
+                show_progress_bar=False,
+            )
+            with self._lock:
+                for key, logit in zip(miss_keys, logits):
+                    value = 1 / (1 + math.exp(-float(logit)))
+                    self._cache[key] = value
+                    self._cache.move_to_end(key)
+                    for i in missing[key]:
+                        scores[i] = value
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return scores
+
+    def rerank_many(
+        self,
+        queries: List[str],
+        datas: List[dict],
+        top_n: int,
+        threshold: float = 0.0,
+    ) -> List[dict]:
+        """
+        Re-rank the retrieval data of several queries with one scoring pass.
+
+        Each data dict is reordered best first, cut to ``top_n`` chunks
+        scoring at least ``threshold``, and gets a ``rerank_scores`` list.
+        Distances in ``scores`` are kept for display.
+        """
+        pairs = [(query, text) for query, data in zip(queries, datas) for text in data["docs"]]
+        scores = iter(self.score(pairs))
+        reranked = []
+        for data in datas:
+            relevance = [next(scores) for _ in data["docs"]]
+            order = sorted(range(len(relevance)), key=lambda i: relevance[i], reverse=True)
+            keep = [i for i in order if relevance[i] >= threshold][:top_n]
+            result = {**data}
+            for field in _CHUNK_FIELDS:
+                result[field] = [data[field][i] for i in keep]
+            result["rerank_scores"] = [relevance[i] for i in keep]
+            reranked.append(result)
+        return reranked
+
+    def rerank(self, query: str, data: dict, top_n: int, threshold: float = 0.0) -> dict:
+        """Re-rank one query's retrieval data; see rerank_many."""
+        return self.rerank_many([query], [data], top_n, threshold)[0]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": RERANK_ENABLED,
+                "model": self.model_name,
+                "loaded": self._model is not None,
+                "cache_entries": len(self._cache),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+@lru_cache()
+def get_reranker() -> CrossEncoderReranker:
+    """Get the process-wide cross-encoder re-ranker (the model loads on first use)."""
+    return CrossEncoderReranker(RERANK_MODEL, batch_size=RERANK_BATCH_SIZE, cache_size=RERANK_CACHE_SIZE)
+
+
+def rerank_results(queries: List[str], datas: List[dict], top_n: int) -> List[dict]:
+    """Re-rank retrieval data with the configured model and relevance threshold."""
+    return get_reranker().rerank_many(queries, datas, top_n, threshold=RERANK_MIN_SCORE)
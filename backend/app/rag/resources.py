@@ -0,0 +1,272 @@
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Awaitable, Callable, Hashable, Iterator
+
+from app.config import LLM_POOL_MAX_CLIENTS, REBUILD_RETIRE_SECONDS, VECTOR_BACKEND
+from app.rag import doc_registry, index_sync
+
+if TYPE_CHECKING:
+    from app.rag.numpy_store import NumpyVectorStore
+    from app.rag.vector_store import ChromaVectorStore
+
+    VectorStore = ChromaVectorStore | NumpyVectorStore
+
+DEFAULT_COLLECTION = "eduquill_docs"
+
+# One vector store handle per collection, shared by every request and ingestion job
+_vector_stores: "dict[str, VectorStore]" = {}
+
+# Keyed pool of LLM clients, most recently used last
+_llm_clients: "OrderedDict[Hashable, _PooledClient]" = OrderedDict()
+
+# Clients evicted from the pool while still in use, closed when released
+_draining: "set[_PooledClient]" = set()
+
+# Stores replaced by a rebuild, waiting to be deleted: id -> (timer, store)
+_retired: "dict[int, tuple[threading.Timer, VectorStore]]" = {}
+
+_lock = threading.Lock()
+
+
+def hash_api_key(api_key: str | None) -> str:
+    """Hash an API key so it can be used in a pool key without keeping it in clear."""
+    return hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()[:16]
+
+
+def collection_for_tenant(tenant: str | None = None) -> str:
+    """Collection holding a tenant's documents; the shared collection when no tenant is given."""
+    return f"{DEFAULT_COLLECTION}__{tenant}" if tenant else DEFAULT_COLLECTION
+
+
+def open_vector_store(physical_name: str, embedding_model: str | None = None) -> "VectorStore":
+    """Open a physical collection directly, bypassing the shared handles (used by index rebuilds)."""
+    # Only the configured backend's dependencies are imported
+    if VECTOR_BACKEND == "numpy":
+        from app.rag.numpy_store import NumpyVectorStore
+
+        return NumpyVectorStore(collection_name=physical_name, embedding_model=embedding_model)
+    if VECTOR_BACKEND == "chroma":
+        from app.rag.vector_store import ChromaVectorStore
+
+        return ChromaVectorStore(collection_name=physical_name, embedding_model=embedding_model)
+    raise ValueError(f"Unknown vector backend: {VECTOR_BACKEND!r} (expected 'chroma' or 'numpy')")
+
+
+def _create_vector_store(collection_name: str) -> "VectorStore":
+    # A rebuilt collection lives under a versioned physical name; others under their own name
+    physical, embedding_model = doc_registry.get_collection(collection_name) or (collection_name, None)
+    return open_vector_store(physical, embedding_model)
+
+
+def physical_collection_name(collection_name: str, version: int) -> str:
+    """Name of a collection's rebuilt copy, within Chroma's 63-character limit."""
+    name = f"{collection_name}_v{version}"
+    if len(name) > 63:
+        name = f"eduquill_{hashlib.sha256(collection_name.encode('utf-8')).hexdigest()[:16]}_v{version}"
+    return name
+
+
+def _drop_retired(store: "VectorStore"):
+    with _lock:
+        _retired.pop(id(store), None)
+    store.drop()
+
+
+def _retire(store: "VectorStore"):
+    """Delete a replaced collection once in-flight queries and other workers are done with it."""
+    timer = threading.Timer(REBUILD_RETIRE_SECONDS, _drop_retired, (store,))
+    timer.daemon = True
+    with _lock:
+        _retired[id(store)] = (timer, store)
+    timer.start()
+
+
+def swap_vector_stores(stores: "dict[str, VectorStore]"):
+    """Serve rebuilt stores in place of the current handles; the replaced ones are retired.
+
+    The registry must already point the collections at the new stores.
+    """
+    with _lock:
+        replaced = [_vector_stores.get(name) for name in stores]
+        _vector_stores.update(stores)
+    for store in replaced:
+        if store is not None:
+            _retire(store)
+
+
+def get_vector_store(collection_name: str = DEFAULT_COLLECTION) -> "VectorStore":
+    """Return the process-wide vector store handle for a collection, opening it once."""
+    store = _vector_stores.get(collection_name)
+    if store is not None:
+        return store
+    with _lock:
+        store = _vector_stores.get(collection_name)
+        if store is None:
+            store = _create_vector_store(collection_name)
+            _vector_stores[collection_name] = store
+        return store
+
+
+def _refresh_vector_stores():
+    """Reload open stores after the ingest leader (another process) wrote to the index.
+
+    Collections the leader rebuilt are reopened under their new physical name;
+    the old handles are left to in-flight queries and garbage collection.
+    """
+    with _lock:
+        stores = dict(_vector_stores)
+    for name, store in stores.items():
+        physical, embedding_model = doc_registry.get_collection(name) or (name, None)
+        if physical != store.collection_name:
+            with _lock:
+                _vector_stores[name] = open_vector_store(physical, embedding_model)
+        else:
+            store.refresh()
+
+
+index_sync.on_change(_refresh_vector_stores)
+
+
+class _PooledClient:
+    """A pooled LLM client and the number of callers currently using it."""
+
+    __slots__ = ("client", "closer", "users", "evicted")
+
+    def __init__(self, client, closer: Callable[[object], Awaitable[None]] | None):
+        self.client = client
+        self.closer = closer
+        self.users = 0
+        self.evicted = False
+
+
+def _checkout(key: Hashable, factory: Callable[[], object], closer, users: int) -> _PooledClient:
+    with _lock:
+        entry = _llm_clients.get(key)
+        if entry is not None:
+            _llm_clients.move_to_end(key)
+            entry.users += users
+            return entry
+
+    # Build outside the lock: creating a client must not stall every other lookup
+    built = _PooledClient(factory(), closer)
+    with _lock:
+        entry = _llm_clients.get(key)
+        if entry is not None:
+            # Another caller pooled the same key meanwhile: use theirs
+            _llm_clients.move_to_end(key)
+            entry.users += users
+            duplicate = built
+        else:
+            entry = _llm_clients[key] = built
+            entry.users += users
+            duplicate = None
+        evicted = []
+        while len(_llm_clients) > LLM_POOL_MAX_CLIENTS:
+            old = _llm_clients.popitem(last=False)[1]
+            old.evicted = True
+            if old.users:
+                # Still streaming: closed by the last user's release
+                _draining.add(old)
+            else:
+                evicted.append(old)
+
+    if duplicate is not None:
+        _schedule_close(duplicate)
+    for old in evicted:
+        _schedule_close(old)
+    return entry
+
+
+def get_llm_client(
+    key: Hashable,
+    factory: Callable[[], object],
+    closer: Callable[[object], Awaitable[None]] | None = None,
+):
+    """
+    Return a pooled LLM client, creating it with ``factory`` on first use.
+
+    The client is not checked out: it may be closed once evicted from the
+    pool. Use lease_llm_client to hold a client for the length of a call.
+
+    Args:
+        key: Pool key, e.g. (provider, model, api-key hash)
+        factory: Builds a new client when the key is not pooled yet
+        closer: Optional coroutine function releasing the client's HTTP connections
+
+    Returns:
+        The pooled client
+    """
+    return _checkout(key, factory, closer, users=0).client
+
+
+@contextmanager
+def lease_llm_client(
+    key: Hashable,
+    factory: Callable[[], object],
+    closer: Callable[[object], Awaitable[None]] | None = None,
+) -> Iterator[object]:
+    """Check a pooled client out for the length of the block (see get_llm_client).
+
+    A client evicted while checked out is closed when its last user releases it.
+    """
+    entry = _checkout(key, factory, closer, users=1)
+    try:
+        yield entry.client
+    finally:
+        with _lock:
+            entry.users -= 1
+            close = entry.evicted and not entry.users
+            if close:
+                _draining.discard(entry)
+        if close:
+            _schedule_close(entry)
+
+
+def _schedule_close(entry: _PooledClient):
+    """Close an evicted client in the background if an event loop is running."""
+    if entry.closer is None:
+        return
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        # No loop: let garbage collection release the connections
+        return
+    loop.create_task(entry.closer(entry.client))
+
+
+def startup():
+    """Open long-lived resources before the app starts serving.
+
+    With the numpy backend this only maps the index files; pages are read on demand.
+    """
+    get_vector_store(DEFAULT_COLLECTION)
+
+
+async def shutdown():
+    """Close pooled LLM clients and drop vector store handles."""
+    with _lock:
+        clients = list(_llm_clients.values()) + list(_draining)
+        _llm_clients.clear()
+        _draining.clear()
+        stores = list(_vector_stores.values())
+        _vector_stores.clear()
+        retired = list(_retired.values())
+        _retired.clear()
+
+    for entry in clients:
+        if entry.closer is not None:
+            try:
+                await entry.closer(entry.client)
+            except Exception:
+                pass
+
+    # Nothing queries the replaced collections any more
+    for timer, store in retired:
+        timer.cancel()
+        store.drop()
+
+    for store in stores:
+        store.close()
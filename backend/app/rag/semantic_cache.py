@@ -0,0 +1,154 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import List
+
+import numpy as np
+
+from app.config import (
+    SEMANTIC_CACHE_ENABLED,
+    SEMANTIC_CACHE_THRESHOLD,
+    SEMANTIC_CACHE_TTL_SECONDS,
+    SEMANTIC_CACHE_MAX_ENTRIES,
+)
+from app.rag import index_sync
+
+
+class _Entry:
+    __slots__ = ("query", "vector", "scope", "answer", "data", "doc_ids", "expires_at")
+
+    def __init__(self, query, vector, scope, answer, data, doc_ids, expires_at):
+        self.query = query
+        self.vector = vector
+        self.scope = scope
+        self.answer = answer
+        self.data = data
+        self.doc_ids = doc_ids
+        self.expires_at = expires_at
+
+
+class SemanticAnswerCache:
+    """
+    Cache of RAG answers looked up by query-embedding similarity.
+
+    An entry only matches requests with the same scope (model, provider,
+    retrieval options and conversation history fingerprint) and a cosine
+    similarity of at least ``threshold``. Entries expire after
+    ``ttl_seconds``, the least recently used ones are evicted beyond
+    ``max_entries``, and every entry citing a document is dropped when that
+    document changes.
+    """
+
+    def __init__(self, threshold: float = 0.95, ttl_seconds: int = 3600, max_entries: int = 2000):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def scope_key(model: str, provider_type: str, retrieval: dict, history: list) -> str:
+        """Fingerprint of everything besides the query that shapes the answer.
+
+        ``retrieval`` holds the retrieval options (k, mode, filters...).
+        """
+        options = json.dumps(retrieval, sort_keys=True, default=str)
+        digest = hashlib.sha256(f"{provider_type}\0{model}\0{options}".encode("utf-8"))
+        for message in history:
+            digest.update(b"\0" + type(message).__name__.encode("utf-8"))
+            digest.update(b"\0" + str(message.content).encode("utf-8"))
+        return digest.hexdigest()
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _purge_expired(self, now: float):
+        """Drop expired entries. Caller holds the lock."""
+        expired = [key for key, entry in self._entries.items() if entry.expires_at <= now]
+        for key in expired:
+            del self._entries[key]
+
+    def lookup(self, embedding: List[float], scope: str) -> tuple[str, dict] | None:
+        """Return (answer, data) of the most similar live entry in scope, if above threshold."""
+        vector = self._normalize(embedding)
+        with self._lock:
+            self._purge_expired(time.time())
+            candidates = [(key, entry) for key, entry in self._entries.items() if entry.scope == scope]
+            if candidates:
+                matrix = np.stack([entry.vector for _, entry in candidates])
+                similarities = matrix @ vector
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    key, entry = candidates[best]
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry.answer, entry.data
+            self.misses += 1
+            return None
+
+    def store(self, query: str, embedding: List[float], scope: str, answer: str, data: dict):
+        """Remember an answer together with the documents it cites."""
+        doc_ids = {meta.get("doc_id", "") for meta in data.get("metadatas", [])}
+        entry = _Entry(
+            query=query,
+            vector=self._normalize(embedding),
+            scope=scope,
+            answer=answer,
+            data=data,
+            doc_ids=doc_ids,
+            expires_at=time.time() + self.ttl_seconds,
+        )
+        with self._lock:
+            self._entries[self._next_id] = entry
+            self._next_id += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate_document(self, doc_id: str):
+        """Drop every entry that cites a document."""
+        with self._lock:
+            stale = [key for key, entry in self._entries.items() if doc_id in entry.doc_ids]
+            for key in stale:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": SEMANTIC_CACHE_ENABLED,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+_cache = SemanticAnswerCache(
+    threshold=SEMANTIC_CACHE_THRESHOLD,
+    ttl_seconds=SEMANTIC_CACHE_TTL_SECONDS,
+    max_entries=SEMANTIC_CACHE_MAX_ENTRIES,
+)
+
+# Another worker's ingest may have changed any cited document
+index_sync.on_change(_cache.clear)
+
+
+def get_semantic_cache() -> SemanticAnswerCache | None:
+    """Return the process-wide answer cache, or None when it is disabled."""
+    return _cache if SEMANTIC_CACHE_ENABLED else None
+
+
+def invalidate_document(doc_id: str):
+    """Drop cached answers citing a re-ingested or deleted document."""
+    _cache.invalidate_document(doc_id)
@@ -1,118 +1,310 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, List, Union
+
 from langchain_core.messages import HumanMessage, AIMessage
-from typing import Optional, Union, List
-from collections import defaultdict
-
-# Try to import LangChain's memory classes, fallback to custom implementation
-try:
-    from langchain.memory import ConversationBufferMemory, ConversationSummaryMemory
-    _USE_LANGCHAIN_MEMORY = True
-except ImportError:
-    try:
-        from langchain_classic.memory import ConversationBufferMemory, ConversationSummaryMemory
-        _USE_LANGCHAIN_MEMORY = True
-    except ImportError:
-        _USE_LANGCHAIN_MEMORY = False
-        
-        # Custom implementation that mimics LangChain's memory interface
-        class ChatMemory:
-            """Simple chat memory that mimics LangChain's ChatMessageHistory interface."""
-            def __init__(self):
-                self.messages: List[Union[HumanMessage, AIMessage]] = []
-            
-            def add_user_message(self, content: str):
-                """Add a user message to the memory."""
-                self.messages.append(HumanMessage(content=content))
-            
-            def add_ai_message(self, content: str):
-                """Add an AI message to the memory."""
-                self.messages.append(AIMessage(content=content))
-            
-            def clear(self):
-                """Clear all messages."""
-                self.messages = []
-
-        class ConversationBufferMemory:
-            """Simple memory class that mimics LangChain's ConversationBufferMemory interface."""
-            def __init__(self, return_messages=True, memory_key="chat_history"):
-                self.return_messages = return_messages
-                self.memory_key = memory_key
-                self.chat_memory = ChatMemory()
-            
-            def clear(self):
-                """Clear the conversation memory."""
-                self.chat_memory.clear()
-
-        # Alias for compatibility
-        ConversationSummaryMemory = ConversationBufferMemory
-
-# Store memory instances per session
-_memories: dict[str, Optional[Union[ConversationBufferMemory, ConversationSummaryMemory]]] = {}
-
-
-def get_memory(session_id: str, use_summary: bool = False, max_token_limit: int = 2000, llm=None) -> Union[ConversationBufferMemory, ConversationSummaryMemory]:
-    """
-    Get or create a LangChain memory instance for a session.
-    
-    Args:
-        session_id: Unique session identifier
-        use_summary: If True, use ConversationSummaryMemory (for longer conversations)
-        max_token_limit: Max tokens before summarizing (only for ConversationSummaryMemory)
-        llm: LLM instance required for ConversationSummaryMemory (optional)
-    
-    Returns:
-        ConversationBufferMemory or ConversationSummaryMemory instance
-    """
-    if session_id not in _memories or _memories[session_id] is None:
-        if use_summary:
-            if llm is None:
-                # Fallback to BufferMemory if no LLM provided for summary
-                _memories[session_id] = ConversationBufferMemory(
-                    return_messages=True,
-                    memory_key="chat_history"
+
+from app.config import (
+    SESSION_BACKEND,
+    SESSION_DB_PATH,
+    SESSION_MAX_SESSIONS,
+    SESSION_IDLE_TTL_SECONDS,
+    SESSION_TOKEN_BUDGET,
+    SESSION_MAX_MESSAGES,
+)
+from app.rag.tokens import count_tokens
+
+# A stored message is a (role, content) pair, role being "human" or "ai"
+StoredMessage = tuple[str, str]
+
+
+class InMemorySessionBackend:
+    """Sessions kept in this process, least recently used first."""
+
+    name = "memory"
+
+    def __init__(self):
+        self._sessions: "OrderedDict[str, tuple[list[StoredMessage], float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def load(self, session_id: str) -> list[StoredMessage]:
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            return list(entry[0]) if entry is not None else []
+
+    def save(self, session_id: str, messages: list[StoredMessage]):
+        with self._lock:
+            self._sessions[session_id] = (list(messages), time.time())
+            self._sessions.move_to_end(session_id)
+
+    def append(
+        self,
+        session_id: str,
+        messages: list[StoredMessage],
+        trim: Callable[[list[StoredMessage]], list[StoredMessage]],
+    ):
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            history = entry[0] if entry is not None else []
+            self._sessions[session_id] = (trim(history + messages), time.time())
+            self._sessions.move_to_end(session_id)
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def evict(self, max_sessions: int, idle_ttl: float):
+        with self._lock:
+            cutoff = time.time() - idle_ttl
+            # Oldest sessions come first, so stop at the first live one
+            while self._sessions:
+                session_id, (_, last_access) = next(iter(self._sessions.items()))
+                if last_access >= cutoff and len(self._sessions) <= max_sessions:
+                    break
+                self._sessions.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            size = sum(
+                len(role) + len(content.encode("utf-8"))
+                for messages, _ in self._sessions.values()
+                for role, content in messages
+            )
+            return {"backend": self.name, "sessions": len(self._sessions), "bytes": size}
+
+
+class SQLiteSessionBackend:
+    """Sessions persisted in SQLite so they survive restarts and are shared by workers."""
+
+    name = "sqlite"
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT PRIMARY KEY,
+                messages TEXT NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS sessions_last_access ON sessions (last_access)"
+        )
+        self._conn.commit()
+        self._lock = threading.Lock()
+
+    def load(self, session_id: str) -> list[StoredMessage]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT messages FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        if row is None:
+            return []
+        return [tuple(message) for message in json.loads(row[0])]
+
+    def save(self, session_id: str, messages: list[StoredMessage]):
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT INTO sessions (session_id, messages, last_access) VALUES (?, ?, ?)
+                ON CONFLICT(session_id) DO UPDATE SET
+                    messages = excluded.messages,
+                    last_access = excluded.last_access
+                """,
+                (session_id, json.dumps(messages), time.time()),
+            )
+            self._conn.commit()
+
+    def append(
+        self,
+        session_id: str,
+        messages: list[StoredMessage],
+        trim: Callable[[list[StoredMessage]], list[StoredMessage]],
+    ):
+        with self._lock:
+            # Take the write lock before reading, so concurrent appends from other workers cannot lose an exchange
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT messages FROM sessions WHERE session_id = ?", (session_id,)
+                ).fetchone()
+                history = [tuple(message) for message in json.loads(row[0])] if row is not None else []
+                self._conn.execute(
+                    """
+                    INSERT INTO sessions (session_id, messages, last_access) VALUES (?, ?, ?)
+                    ON CONFLICT(session_id) DO UPDATE SET
+                        messages = excluded.messages,
+                        last_access = excluded.last_access
+                    """,
+                    (session_id, json.dumps(trim(history + messages)), time.time()),
                 )
-            else:
-                _memories[session_id] = ConversationSummaryMemory(
-                    llm=llm,
-                    return_messages=True,
-                    memory_key="chat_history",
-                    max_token_limit=max_token_limit
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+            self._conn.commit()
+
+    def evict(self, max_sessions: int, idle_ttl: float):
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM sessions WHERE last_access < ?", (time.time() - idle_ttl,)
+            )
+            self._conn.execute(
+                """
+                DELETE FROM sessions WHERE session_id IN (
+                    SELECT session_id FROM sessions ORDER BY last_access DESC LIMIT -1 OFFSET ?
                 )
-        else:
-            _memories[session_id] = ConversationBufferMemory(
-                return_messages=True,
-                memory_key="chat_history"
+                """,
+                (max_sessions,),
             )
-    return _memories[session_id]
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            count, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(messages)), 0) FROM sessions"
+            ).fetchone()
+        return {"backend": self.name, "sessions": count, "bytes": size}
+
+
+class SessionStore:
+    """
+    Bounded conversation store on top of a pluggable backend.
+
+    Keeps at most ``max_sessions`` sessions, forgets sessions idle for longer
+    than ``idle_ttl`` seconds (a session is active when an exchange is
+    appended; reads never write), and windows each session's history to the
+    newest ``max_messages`` messages that fit in ``token_budget`` tokens.
+    """
+
+    # Minimum seconds between two eviction passes
+    EVICT_INTERVAL = 30.0
+
+    def __init__(
+        self,
+        backend,
+        max_sessions: int = 10000,
+        idle_ttl: float = 21600,
+        token_budget: int = 2000,
+        max_messages: int = 40,
+    ):
+        self.backend = backend
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.token_budget = token_budget
+        self.max_messages = max_messages
+        self._last_evict = 0.0
+
+    def _maybe_evict(self):
+        now = time.time()
+        if now - self._last_evict >= self.EVICT_INTERVAL:
+            self._last_evict = now
+            self.backend.evict(self.max_sessions, self.idle_ttl)
+
+    def _trim(self, messages: list[StoredMessage]) -> list[StoredMessage]:
+        """Keep the newest whole exchanges that fit the message window and token budget."""
+        # Window on whole exchanges so history never starts with an assistant reply
+        window = self.max_messages - self.max_messages % 2
+        messages = messages[-window:] if window else []
+        kept: list[StoredMessage] = []
+        used = 0
+        # Walk back one (user, assistant) exchange at a time
+        for end in range(len(messages), 0, -2):
+            exchange = messages[max(0, end - 2):end]
+            cost = sum(count_tokens(content) for _, content in exchange)
+            if kept and used + cost > self.token_budget:
+                break
+            kept[:0] = exchange
+            used += cost
+        return kept
+
+    def append(self, session_id: str, messages: list[StoredMessage]):
+        self._maybe_evict()
+        # Load, trim and save in one step of the backend, atomic across threads and workers
+        self.backend.append(session_id, messages, self._trim)
+
+    def load(self, session_id: str) -> list[StoredMessage]:
+        return self.backend.load(session_id)
+
+    def clear(self, session_id: str):
+        self.backend.delete(session_id)
+
+    def stats(self) -> dict:
+        return {
+            **self.backend.stats(),
+            "max_sessions": self.max_sessions,
+            "idle_ttl_seconds": self.idle_ttl,
+            "token_budget": self.token_budget,
+        }
+
+
+def _create_backend():
+    if SESSION_BACKEND == "sqlite":
+        return SQLiteSessionBackend(SESSION_DB_PATH)
+    if SESSION_BACKEND == "memory":
+        return InMemorySessionBackend()
+    raise ValueError(f"Unknown session backend: {SESSION_BACKEND!r} (expected 'memory' or 'sqlite')")
+
+
+# Store conversations per session
+_store = SessionStore(
+    _create_backend(),
+    max_sessions=SESSION_MAX_SESSIONS,
+    idle_ttl=SESSION_IDLE_TTL_SECONDS,
+    token_budget=SESSION_TOKEN_BUDGET,
+    max_messages=SESSION_MAX_MESSAGES,
+)
+
+
+def get_session_store() -> SessionStore:
+    """Get the process-wide session store."""
+    return _store
 
 
 def add_message(session_id: str, user_message: str, assistant_message: str):
     """Add a user-assistant message pair to the conversation memory."""
-    memory = get_memory(session_id)
-    memory.chat_memory.add_user_message(user_message)
-    memory.chat_memory.add_ai_message(assistant_message)
+    _store.append(session_id, [("human", user_message), ("ai", assistant_message)])
 
 
-def get_history_messages(session_id: str) -> list:
+def get_history_messages(session_id: str) -> List[Union[HumanMessage, AIMessage]]:
     """
     Get conversation history as LangChain message objects.
-    
+
+    History is already windowed to the session token budget.
+
     Returns:
         List of HumanMessage and AIMessage objects
     """
-    memory = get_memory(session_id)
-    return memory.chat_memory.messages
+    return [
+        HumanMessage(content=content) if role == "human" else AIMessage(content=content)
+        for role, content in _store.load(session_id)
+    ]
 
 
 def get_history(session_id: str) -> list[tuple[str, str]]:
     """
     Get conversation history as tuples (for backward compatibility).
-    
+
     Returns:
         List of (user_message, assistant_message) tuples
     """
     messages = get_history_messages(session_id)
     pairs = []
-    
+
     # Group messages into pairs
     i = 0
     while i < len(messages):
@@ -121,12 +313,10 @@ def get_history(session_id: str) -> list[tuple[str, str]]:
             i += 2
         else:
             i += 1
-    
+
     return pairs
 
 
 def clear_memory(session_id: str):
     """Clear conversation history for a session."""
-    if session_id in _memories and _memories[session_id] is not None:
-        _memories[session_id].clear()
-    _memories[session_id] = None
+    _store.clear(session_id)
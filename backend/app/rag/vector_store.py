@@ -1,61 +1,449 @@
-from langchain_chroma import Chroma
-from typing import List, Dict
+import os
+from typing import Callable, Iterator, List, Dict, Literal
+from urllib.parse import urlsplit
 from langchain_core.documents import Document
+import numpy as np
 
+from app.config import (
+    CHROMA_DIR, CHROMA_URL, LEXICAL_INDEX_DIR, MULTI_WORKER, RETRIEVAL_MODE, HYBRID_CANDIDATE_FACTOR, RRF_K
+)
 from app.rag.embeddings import get_embedding_model
+from app.rag.lexical_index import BM25Index, reciprocal_rank_fusion
+
+RetrievalMode = Literal["dense", "hybrid"]
+
+# Chroma metadata values must be scalars, so each tag is stored as its own boolean key
+TAG_PREFIX = "tag:"
+
+
+def tag_metadata(tags: List[str] | None) -> Dict[str, bool]:
+    """Chunk metadata entries marking a document's tags."""
+    return {f"{TAG_PREFIX}{tag}": True for tag in tags or []}
+
+
+def build_where(
+    doc_ids: List[str] | None = None,
+    titles: List[str] | None = None,
+    tags: List[str] | None = None,
+) -> Dict | None:
+    """
+    Build a Chroma ``where`` clause from retrieval filters.
+
+    Conditions on different fields are ANDed; several values for one field
+    are ORed (a chunk matches if it has any of the given tags).
+    """
+    conditions = []
+    if doc_ids:
+        conditions.append({"doc_id": {"$in": list(doc_ids)}})
+    if titles:
+        conditions.append({"title": {"$in": list(titles)}})
+    if tags:
+        tag_conditions = [{f"{TAG_PREFIX}{tag}": True} for tag in tags]
+        conditions.append(tag_conditions[0] if len(tag_conditions) == 1 else {"$or": tag_conditions})
+    if not conditions:
+        return None
+    return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+
+def format_results(results: list) -> Dict:
+    """Shape (Document, distance) pairs like a Chroma query result."""
+    ids = []
+    docs = []
+    metadatas = []
+    distances = []
+
+    for doc, score in results:
+        ids.append(doc.id)
+        docs.append(doc.page_content)
+        metadatas.append(doc.metadata)
+        # Convert similarity score to distance (lower is better)
+        distances.append(float(score))
+
+    return {
+        "ids": [ids],
+        "documents": [docs],
+        "metadatas": [metadatas],
+        "distances": [distances],
+    }
+
+
+def fuse_results(
+    dense: list,
+    lexical: list,
+    top_k: int,
+    fetch: Callable[[List[str]], list],
+) -> list:
+    """
+    Fuse dense and BM25 candidates with reciprocal rank fusion.
+
+    Args:
+        dense: (Document, distance) pairs, best first
+        lexical: (chunk_id, BM25 score) pairs, best first
+        top_k: Number of fused results to keep
+        fetch: Returns (Document, distance) pairs for chunks found only lexically
+
+    Returns:
+        (Document, distance) pairs in fused order
+    """
+    by_id = {doc.id: (doc, score) for doc, score in dense}
+    fused = reciprocal_rank_fusion(
+        [[doc.id for doc, _ in dense], [chunk_id for chunk_id, _ in lexical]], k=RRF_K
+    )[:top_k]
+
+    missing = [chunk_id for chunk_id in fused if chunk_id not in by_id]
+    if missing:
+        for doc, distance in fetch(missing):
+            by_id[doc.id] = (doc, distance)
+
+    return [by_id[chunk_id] for chunk_id in fused if chunk_id in by_id]
 
 
 class ChromaVectorStore:
-    def __init__(self, collection_name: str = "eduquill_docs"):
-        """Initialize LangChain Chroma vector store."""
-        embeddings = get_embedding_model()
-        self.vectorstore = Chroma(
-            collection_name=collection_name,
-            embedding_function=embeddings,
-            persist_directory="data/chroma"
-        )
+    def __init__(self, collection_name: str = "eduquill_docs", embedding_model: str | None = None):
+        """Initialize LangChain Chroma vector store and its BM25 lexical index.
+
+        ``embedding_model`` embeds chunks and queries; defaults to the active model.
+        """
+        # chromadb is slow to import and unused with the numpy backend
+        from langchain_chroma import Chroma
+
+        embeddings = get_embedding_model(embedding_model)
+        self.embeddings = embeddings
+        self.collection_name = collection_name
+        if CHROMA_URL:
+            import chromadb
+
+            url = urlsplit(CHROMA_URL)
+            self.vectorstore = Chroma(
+                collection_name=collection_name,
+                embedding_function=embeddings,
+                client=chromadb.HttpClient(
+                    host=url.hostname,
+                    port=url.port or (443 if url.scheme == "https" else 8000),
+                    ssl=url.scheme == "https",
+                ),
+            )
+        elif MULTI_WORKER:
+            # The embedded client keeps its HNSW index in process memory, so other workers never see its writes
+            raise ValueError(
+                "The chroma backend needs a Chroma server (EDUQUILL_CHROMA_URL) in multi-worker mode; "
+                "alternatively use EDUQUILL_VECTOR_BACKEND=numpy"
+            )
+        else:
+            self.vectorstore = Chroma(
+                collection_name=collection_name,
+                embedding_function=embeddings,
+                persist_directory=CHROMA_DIR
+            )
+        self.lexical = BM25Index(os.path.join(LEXICAL_INDEX_DIR, f"{collection_name}.sqlite3"))
+        self._backfill_lexical()
 
-    def add_chunks(self, doc_id: str, chunks: List[str], metadatas: List[Dict]):
-        """Add document chunks to the vector store."""
+    def _backfill_lexical(self, page_size: int = 1000):
+        """Build the lexical index from Chroma for collections indexed before it existed."""
+        collection = self.vectorstore._collection
+        if len(self.lexical) or not collection.count():
+            return
+        offset = 0
+        while True:
+            page = collection.get(limit=page_size, offset=offset, include=["documents"])
+            if not page["ids"]:
+                break
+            self.lexical.add(page["ids"], [doc or "" for doc in page["documents"]])
+            offset += len(page["ids"])
+
+    def add_chunks(
+        self,
+        doc_id: str,
+        chunks: List[str],
+        metadatas: List[Dict],
+        start_index: int = 0,
+        embeddings: List[List[float]] | None = None,
+        ids: List[str] | None = None,
+    ):
+        """Add document chunks to the vector store.
+
+        Chunk ids default to ``{doc_id}_{i}``; ``start_index`` offsets them so
+        a document can be written in several batches, and explicit ``ids``
+        override them. When ``embeddings`` are given they are written as-is
+        in bulk, skipping LangChain's own embedding call.
+        """
         # Create LangChain Document objects with unique IDs
         documents = []
-        ids = []
-        for i, (chunk, meta) in enumerate(zip(chunks, metadatas)):
-            chunk_id = f"{doc_id}_{i}"
+        if ids is None:
+            ids = [f"{doc_id}_{i}" for i in range(start_index, start_index + len(chunks))]
+        for chunk, meta in zip(chunks, metadatas):
             documents.append(
                 Document(
                     page_content=chunk,
                     metadata={**meta, "doc_id": doc_id}
                 )
             )
-            ids.append(chunk_id)
-        
-        # Add documents to vectorstore with IDs
-        # Note: Persistence is automatic when persist_directory is provided
-        self.vectorstore.add_documents(documents, ids=ids)
-
-    def query(self, query: str, top_k: int = 5):
-        """Query the vector store and return results in the original format."""
-        # Use similarity_search_with_score to get scores
-        results = self.vectorstore.similarity_search_with_score(query, k=top_k)
-        
+
+        if embeddings is not None:
+            self._upsert_embedded(ids, documents, embeddings)
+        else:
+            # Add documents to vectorstore with IDs
+            # Note: Persistence is automatic when persist_directory is provided
+            self.vectorstore.add_documents(documents, ids=ids)
+        self.lexical.add(ids, chunks)
+
+    def _upsert_embedded(
+        self,
+        ids: List[str],
+        documents: List[Document],
+        embeddings: List[List[float]],
+    ):
+        """Write pre-embedded documents straight to the Chroma collection in bulk."""
+        collection = self.vectorstore._collection
+        max_batch = len(ids) or 1
+        client = getattr(self.vectorstore, "_client", None)
+        if client is not None and hasattr(client, "get_max_batch_size"):
+            max_batch = min(max_batch, client.get_max_batch_size())
+
+        for start in range(0, len(ids), max_batch):
+            end = start + max_batch
+            collection.upsert(
+                ids=ids[start:end],
+                embeddings=embeddings[start:end],
+                documents=[d.page_content for d in documents[start:end]],
+                metadatas=[d.metadata for d in documents[start:end]],
+            )
+
+    def update_metadatas(self, ids: List[str], metadatas: List[Dict]):
+        """Replace the metadata of existing chunks without re-embedding them.
+
+        Chroma merges an update into the stored metadata, so keys the new
+        metadata lacks (such as tags dropped by a new revision) are removed
+        explicitly by setting them to None.
+        """
+        if not ids:
+            return
+        collection = self.vectorstore._collection
+        current = collection.get(ids=ids, include=["metadatas"])
+        stored = {chunk_id: meta or {} for chunk_id, meta in zip(current["ids"], current["metadatas"])}
+        collection.update(
+            ids=ids,
+            metadatas=[
+                {**{key: None for key in stored.get(chunk_id, {}) if key not in meta}, **meta}
+                for chunk_id, meta in zip(ids, metadatas)
+            ],
+        )
+
+    def delete_chunks(self, ids: List[str]):
+        """Delete chunks by id."""
+        if ids:
+            self.vectorstore.delete(ids=ids)
+            self.lexical.delete(ids)
+
+    def query(
+        self,
+        query: str,
+        top_k: int = 5,
+        embedding: List[float] | None = None,
+        mode: RetrievalMode | None = None,
+        where: Dict | None = None,
+    ):
+        """Query the vector store and return results in the original format.
+
+        Pass ``embedding`` to reuse an already computed query embedding.
+        ``mode`` is "dense" (vector search only) or "hybrid" (BM25 and vector
+        results fused with reciprocal rank fusion); it defaults to the
+        configured retrieval mode. ``where`` (see build_where) is pushed down
+        into the Chroma search. Distances are always vector distances
+        (lower is better), also for chunks found only by the lexical index.
+        """
+        mode = mode or RETRIEVAL_MODE
+        if embedding is None:
+            embedding = self.vectorstore.embeddings.embed_query(query)
+
+        if mode == "hybrid":
+            results = self._hybrid_search(query, embedding, top_k, where=where)
+        else:
+            # Distances match similarity_search_with_score
+            results = self.vectorstore.similarity_search_by_vector_with_relevance_scores(
+                embedding, k=top_k, filter=where
+            )
+
         # Format results to match original structure
-        docs = []
-        metadatas = []
-        distances = []
-        
-        for doc, score in results:
-            docs.append(doc.page_content)
-            metadatas.append(doc.metadata)
-            # Convert similarity score to distance (lower is better)
-            distances.append(float(score))
-        
-        return {
-            "documents": [docs],
-            "metadatas": [metadatas],
-            "distances": [distances],
-        }
+        return format_results(results)
+
+    def query_batch(
+        self,
+        queries: List[str],
+        embeddings: List[List[float]],
+        top_k: int = 5,
+        mode: RetrievalMode | None = None,
+        where: Dict | None = None,
+    ) -> List[Dict]:
+        """Run several queries with one Chroma search call.
+
+        Returns one result per query, shaped like query(). Chunks that come
+        back for several queries share a single Document, and lexical-only
+        hits are fetched once for the whole batch.
+        """
+        mode = mode or RETRIEVAL_MODE
+        if not queries:
+            return []
+        n_results = top_k * HYBRID_CANDIDATE_FACTOR if mode == "hybrid" else top_k
+        raw = self.vectorstore._collection.query(
+            query_embeddings=embeddings,
+            n_results=n_results,
+            where=where,
+            include=["documents", "metadatas", "distances"],
+        )
+
+        shared: Dict[str, Document] = {}
+        dense_lists = []
+        for ids, texts, metas, distances in zip(
+            raw["ids"], raw["documents"], raw["metadatas"], raw["distances"]
+        ):
+            dense = []
+            for chunk_id, text, meta, distance in zip(ids, texts, metas, distances):
+                doc = shared.get(chunk_id)
+                if doc is None:
+                    doc = Document(page_content=text or "", metadata=meta or {}, id=chunk_id)
+                    shared[chunk_id] = doc
+                dense.append((doc, distance))
+            dense_lists.append(dense)
+        if mode != "hybrid":
+            return [format_results(dense) for dense in dense_lists]
+
+        lexical_lists = [self.lexical.search(query, k=n_results) for query in queries]
+        if where:
+            # The lexical index has no metadata: keep only candidates matching the filter
+            lexical_ids = sorted({chunk_id for lexical in lexical_lists for chunk_id, _ in lexical})
+            allowed = set(
+                self.vectorstore._collection.get(ids=lexical_ids, where=where, include=[])["ids"]
+            ) if lexical_ids else set()
+            lexical_lists = [
+                [(chunk_id, score) for chunk_id, score in lexical if chunk_id in allowed]
+                for lexical in lexical_lists
+            ]
+
+        vectors: Dict[str, List[float]] = {}
+
+        def fetcher(embedding: List[float]):
+            def fetch(missing: List[str]) -> list:
+                unknown = [chunk_id for chunk_id in missing if chunk_id not in vectors]
+                if unknown:
+                    fetched = self.vectorstore._collection.get(
+                        ids=unknown, include=["documents", "metadatas", "embeddings"]
+                    )
+                    for chunk_id, text, meta, vector in zip(
+                        fetched["ids"], fetched["documents"], fetched["metadatas"], fetched["embeddings"]
+                    ):
+                        shared.setdefault(
+                            chunk_id, Document(page_content=text or "", metadata=meta or {}, id=chunk_id)
+                        )
+                        vectors[chunk_id] = vector
+                return [
+                    (shared[chunk_id], self._distance(embedding, vectors[chunk_id]))
+                    for chunk_id in missing
+                    if chunk_id in vectors
+                ]
+
+            return fetch
+
+        return [
+            format_results(fuse_results(dense, lexical, top_k, fetcher(embedding)))
+            for dense, lexical, embedding in zip(dense_lists, lexical_lists, embeddings)
+        ]
+
+    def _hybrid_search(
+        self,
+        query: str,
+        embedding: List[float],
+        top_k: int,
+        where: Dict | None = None,
+    ) -> list:
+        """Fuse dense and BM25 candidates with reciprocal rank fusion."""
+        n_candidates = top_k * HYBRID_CANDIDATE_FACTOR
+        dense = self.vectorstore.similarity_search_by_vector_with_relevance_scores(
+            embedding, k=n_candidates, filter=where
+        )
+        lexical = self.lexical.search(query, k=n_candidates)
+        if where and lexical:
+            # The lexical index has no metadata: keep only candidates matching the filter
+            allowed = set(
+                self.vectorstore._collection.get(
+                    ids=[chunk_id for chunk_id, _ in lexical], where=where, include=[]
+                )["ids"]
+            )
+            lexical = [(chunk_id, score) for chunk_id, score in lexical if chunk_id in allowed]
+
+        def fetch(missing: List[str]) -> list:
+            # Chunks found only lexically: fetch them and compute their vector distance
+            fetched = self.vectorstore._collection.get(
+                ids=missing, include=["documents", "metadatas", "embeddings"]
+            )
+            return [
+                (
+                    Document(page_content=text or "", metadata=meta or {}, id=chunk_id),
+                    self._distance(embedding, vector),
+                )
+                for chunk_id, text, meta, vector in zip(
+                    fetched["ids"], fetched["documents"], fetched["metadatas"], fetched["embeddings"]
+                )
+            ]
+
+        return fuse_results(dense, lexical, top_k, fetch)
+
+    def _distance(self, a: List[float], b: List[float]) -> float:
+        """Distance between two vectors in the collection's metric space."""
+        a = np.asarray(a, dtype=np.float32)
+        b = np.asarray(b, dtype=np.float32)
+        space = (self.vectorstore._collection.metadata or {}).get("hnsw:space", "l2")
+        if space == "cosine":
+            return float(1 - a @ b / ((np.linalg.norm(a) * np.linalg.norm(b)) or 1.0))
+        if space == "ip":
+            return float(1 - a @ b)
+        return float(np.sum((a - b) ** 2))
     
     def as_retriever(self, k: int = 5):
         """Get a LangChain retriever for use in chains."""
         return self.vectorstore.as_retriever(search_kwargs={"k": k})
+
+    def iter_chunks(self, batch_size: int = 256, embeddings: bool = True) -> Iterator[tuple]:
+        """Yield (ids, documents, metadatas, vectors or None) for every chunk."""
+        include = ["documents", "metadatas"] + (["embeddings"] if embeddings else [])
+        offset = 0
+        while True:
+            page = self.vectorstore._collection.get(limit=batch_size, offset=offset, include=include)
+            if not page["ids"]:
+                return
+            offset += len(page["ids"])
+            yield (
+                page["ids"],
+                [doc or "" for doc in page["documents"]],
+                [meta or {} for meta in page["metadatas"]],
+                np.asarray(page["embeddings"], dtype=np.float32).tolist() if embeddings else None,
+            )
+
+    def stats(self) -> dict:
+        """Chunk count; Chroma reclaims deleted entries itself."""
+        count = self.vectorstore._collection.count()
+        return {"chunks": count, "rows": count, "dead_rows": 0}
+
+    def __len__(self) -> int:
+        return self.vectorstore._collection.count()
+
+    def drop(self):
+        """Delete the collection and its lexical index."""
+        self.vectorstore.delete_collection()
+        self.lexical.close()
+        for suffix in ("", "-wal", "-shm"):
+            try:
+                os.remove(self.lexical.path + suffix)
+            except FileNotFoundError:
+                pass
+
+    def refresh(self):
+        """Pick up lexical index writes made by another process; the Chroma server is always current."""
+        self.lexical.reload()
+
+    def close(self):
+        """Release the underlying Chroma client and the lexical index."""
+        self.lexical.close()
+        client = getattr(self.vectorstore, "_client", None)
+        if client is not None and hasattr(client, "clear_system_cache"):
+            client.clear_system_cache()
@@ -0,0 +1,74 @@
+import asyncio
+import time
+
+from app.config import RERANK_ENABLED, WARMUP_ENABLED, WARMUP_RETRY_MAX_SECONDS, WARMUP_RETRY_SECONDS
+from app.rag import resources
+from app.rag.embeddings import get_embedding_model
+from app.rag.reranker import get_reranker
+
+_WARMUP_TEXT = "warm-up"
+
+# "warming_up" -> "ready", or "failed" until a retry succeeds
+_state = {"status": "warming_up", "seconds": None, "error": None, "attempts": 0}
+_task: asyncio.Task | None = None
+
+
+def _warm_up():
+    """Load models and touch the index so the first request does not pay for it."""
+    # Opening the default collection loads the embedding model
+    resources.startup()
+    # Bypass the embedding cache: the point is to run one forward pass
+    embedding = get_embedding_model().embeddings.embed_query(_WARMUP_TEXT)
+    store = resources.get_vector_store(resources.DEFAULT_COLLECTION)
+    store.query(_WARMUP_TEXT, top_k=1, embedding=embedding)
+    if RERANK_ENABLED:
+        get_reranker().score([(_WARMUP_TEXT, _WARMUP_TEXT)])
+
+
+async def _run():
+    """Warm up, retrying with exponential backoff until it succeeds."""
+    started = time.perf_counter()
+    delay = WARMUP_RETRY_SECONDS
+    while True:
+        _state["attempts"] += 1
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, _warm_up)
+        except Exception as exc:
+            # e.g. the model download or the index volume was briefly unavailable
+            _state.update(status="failed", error=f"{type(exc).__name__}: {exc}")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, WARMUP_RETRY_MAX_SECONDS)
+            continue
+        _state.update(status="ready", seconds=time.perf_counter() - started, error=None)
+        return
+
+
+def start():
+    """
+    Start warming up in the background.
+
+    The app serves /health right away while /ready reports 503 until the
+    embedding model is loaded and a dummy search has run; a failed warm-up
+    is retried in the background. With
+    EDUQUILL_WARMUP=0 resources are opened inline and the app is ready at once.
+    """
+    global _task
+    if not WARMUP_ENABLED:
+        resources.startup()
+        _state.update(status="ready", seconds=0.0)
+        return
+    _task = asyncio.get_running_loop().create_task(_run())
+
+
+def is_ready() -> bool:
+    return _state["status"] == "ready"
+
+
+def status() -> dict:
+    return dict(_state)
+
+
+async def shutdown():
+    """Stop a warm-up still in progress or waiting to retry."""
+    if _task is not None and not _task.done():
+        _task.cancel()
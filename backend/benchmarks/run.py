@@ -0,0 +1,353 @@
+"""
+Offline benchmarks for the ingestion and query paths.
+
+Run from the backend directory:
+
+    python -m benchmarks.run --output bench.json
+    python -m benchmarks.run --quick
+    python -m benchmarks.run --only vector_query --corpus-sizes 1000,10000,100000,1000000
+
+Everything runs in-process against a throwaway data directory. Embeddings
+and the LLM are replaced by deterministic stubs (see benchmarks.synthetic)
+unless ``--embeddings model`` is given, which uses the configured
+sentence-transformers model from the local cache. Results are written as
+JSON with p50/p95/p99 latencies and peak RSS per section.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Callable, List
+
+import numpy as np
+
+SECTIONS = ("chunking", "ingest", "vector_query", "chat_load")
+
+
+def summarize(seconds: List[float]) -> dict:
+    """Latency distribution in milliseconds."""
+    samples = np.asarray(seconds) * 1000
+    p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+    return {
+        "n": len(samples),
+        "mean_ms": float(samples.mean()),
+        "p50_ms": float(p50),
+        "p95_ms": float(p95),
+        "p99_ms": float(p99),
+        "max_ms": float(samples.max()),
+    }
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process and its finished children so far."""
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(own, children) * scale / 2**20
+
+
+def log(message: str):
+    print(message, file=sys.stderr, flush=True)
+
+
+def configure(workdir: str, args: argparse.Namespace):
+    """Point every on-disk store at ``workdir``; must run before ``app`` is imported."""
+    env = {
+        "EDUQUILL_CHROMA_DIR": os.path.join(workdir, "chroma"),
+        "EDUQUILL_LEXICAL_INDEX_DIR": os.path.join(workdir, "lexical"),
+        "EDUQUILL_VECTOR_INDEX_DIR": os.path.join(workdir, "vectors"),
+        "EDUQUILL_REGISTRY_PATH": os.path.join(workdir, "registry.sqlite3"),
+        "EDUQUILL_SESSION_DB_PATH": os.path.join(workdir, "sessions.sqlite3"),
+        "EDUQUILL_EMBEDDING_CACHE_DIR": "",
+        # Measure the full query path, not cached answers
+        "EDUQUILL_SEMANTIC_CACHE": "0",
+        "EDUQUILL_OLLAMA_REQUESTS_PER_MINUTE": "0",
+        "HF_HUB_OFFLINE": "1",
+        "TRANSFORMERS_OFFLINE": "1",
+    }
+    if args.embeddings == "stub":
+        # The stub has no sentence-transformers model to spread across processes
+        env["EDUQUILL_INGEST_EMBED_PROCESSES"] = "0"
+    os.environ.update(env)
+
+    from benchmarks.synthetic import StubChatModel, StubEmbeddings
+    from app.rag import embeddings, llm_client
+
+    if args.embeddings == "stub":
+        embeddings._huggingface_embeddings = StubEmbeddings
+
+    def stub_llm(*_, **__):
+        return StubChatModel(
+            tokens=args.llm_tokens,
+            prefill_seconds=args.llm_prefill_ms / 1000,
+            token_seconds=args.llm_token_ms / 1000,
+        )
+
+    llm_client.get_llm = stub_llm
+
+
+def timed(fn: Callable, *args, **kwargs) -> tuple[float, object]:
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def register(doc_id: str, title: str, path: str):
+    """Register a PDF in the document registry, as the upload endpoint does."""
+    from app.rag import doc_registry
+
+    with open(path, "rb") as f:
+        doc_registry.register_document(doc_id, title, doc_registry.hash_bytes(f.read()), path)
+
+
+def bench_chunking(args: argparse.Namespace, workdir: str) -> dict:
+    from benchmarks.synthetic import write_pdf
+    from app.rag.pipeline import pdf_to_chunks
+
+    results = {}
+    for pages in args.pdf_pages:
+        path = os.path.join(workdir, f"chunking_{pages}.pdf")
+        write_pdf(path, pages, seed=pages)
+        runs, chunks = [], 0
+        for _ in range(args.repeat):
+            seconds, chunk_list = timed(pdf_to_chunks, path)
+            runs.append(seconds)
+            chunks = len(chunk_list)
+        best = min(runs)
+        results[str(pages)] = {
+            "pages": pages,
+            "chunks": chunks,
+            "latency": summarize(runs),
+            "pages_per_second": pages / best,
+            "chunks_per_second": chunks / best,
+        }
+        log(f"chunking {pages} pages: {pages / best:.0f} pages/s")
+    return results
+
+
+def bench_ingest(args: argparse.Namespace, workdir: str) -> dict:
+    from benchmarks.synthetic import write_pdf
+    from app.rag import doc_registry
+    from app.rag.pipeline import ingest_document
+
+    results = {}
+    for pages in args.pdf_pages:
+        runs, chunks = [], 0
+        for run in range(args.repeat):
+            # Fresh text per run so the embedding cache does not skew repeats
+            path = os.path.join(workdir, f"ingest_{pages}_{run}.pdf")
+            write_pdf(path, pages, seed=pages * 1000 + run)
+            doc_id = f"bench_{pages}_{run}"
+            register(doc_id, f"Benchmark {pages} pages", path)
+            seconds, _ = timed(ingest_document, path, doc_id, f"Benchmark {pages} pages")
+            runs.append(seconds)
+            chunks = sum(len(ids) for ids in doc_registry.get_chunk_ids_by_hash(doc_id).values())
+        best = min(runs)
+        results[str(pages)] = {
+            "pages": pages,
+            "chunks": chunks,
+            "latency": summarize(runs),
+            "pages_per_second": pages / best,
+            "chunks_per_second": chunks / best,
+        }
+        log(f"ingest {pages} pages: {pages / best:.0f} pages/s, {chunks / best:.0f} chunks/s")
+    return results
+
+
+def bench_vector_query(args: argparse.Namespace, workdir: str) -> dict:
+    from benchmarks.synthetic import iter_corpus
+    from app.rag.embeddings import get_embedding_model
+    from app.rag.resources import get_vector_store
+
+    store = get_vector_store("bench_vectors")
+    model = get_embedding_model()
+    queries = [text[:60] for text in iter_corpus(args.queries, seed=99)]
+    query_vectors = [model.embed_query(query) for query in queries]
+
+    results = {}
+    size, batch = 0, 5000
+    for target in sorted(args.corpus_sizes):
+        start = time.perf_counter()
+        while size < target:
+            count = min(batch, target - size)
+            texts = list(iter_corpus(count, seed=1, start=size))
+            store.add_chunks(
+                doc_id="bench_corpus",
+                chunks=texts,
+                metadatas=[{"title": "Benchmark corpus", "chunk_index": size + i} for i in range(count)],
+                start_index=size,
+                embeddings=model.embed_documents(texts),
+            )
+            size += count
+        build_seconds = time.perf_counter() - start
+
+        entry = {"chunks": size, "build_seconds": build_seconds}
+        for mode in ("dense", "hybrid"):
+            store.query(queries[0], top_k=5, embedding=query_vectors[0], mode=mode)  # warm up
+            latencies = [
+                timed(store.query, query, top_k=5, embedding=vector, mode=mode)[0]
+                for query, vector in zip(queries, query_vectors)
+            ]
+            entry[mode] = summarize(latencies)
+        results[str(target)] = entry
+        log(
+            f"vector_query {size} chunks: dense p50 {entry['dense']['p50_ms']:.1f} ms, "
+            f"hybrid p50 {entry['hybrid']['p50_ms']:.1f} ms"
+        )
+    return results
+
+
+async def _chat_load(args: argparse.Namespace, workdir: str) -> dict:
+    import httpx
+
+    from benchmarks.synthetic import iter_corpus, write_pdf
+    from app.main import app
+    from app.rag.pipeline import ingest_document
+
+    path = os.path.join(workdir, "chat_corpus.pdf")
+    write_pdf(path, 50, seed=7)
+    register("bench_chat", "Benchmark chat corpus", path)
+    ingest_document(path, "bench_chat", "Benchmark chat corpus")
+
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            for concurrency in args.concurrency:
+                total = max(args.requests_per_level, concurrency)
+                # Distinct questions, so no query embedding is served from cache
+                questions = list(iter_corpus(total, seed=concurrency))
+                pending = iter(questions)
+                latencies: List[float] = []
+                errors = 0
+
+                async def worker():
+                    nonlocal errors
+                    for question in pending:
+                        start = time.perf_counter()
+                        response = await client.post(
+                            "/api/v1/chat/query", json={"query": question[:200], "k": 5}
+                        )
+                        latencies.append(time.perf_counter() - start)
+                        errors += response.status_code != 200
+
+                start = time.perf_counter()
+                await asyncio.gather(*(worker() for _ in range(concurrency)))
+                elapsed = time.perf_counter() - start
+                results[str(concurrency)] = {
+                    "concurrency": concurrency,
+                    "requests": total,
+                    "errors": errors,
+                    "latency": summarize(latencies),
+                    "requests_per_second": total / elapsed,
+                    "completion_tokens_per_second": total * args.llm_tokens / elapsed,
+                }
+                log(
+                    f"chat_load concurrency {concurrency}: "
+                    f"p50 {results[str(concurrency)]['latency']['p50_ms']:.0f} ms, "
+                    f"{total / elapsed:.1f} req/s"
+                )
+    return results
+
+
+def bench_chat_load(args: argparse.Namespace, workdir: str) -> dict:
+    return asyncio.run(_chat_load(args, workdir))
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_args(argv: List[str] | None = None) -> argparse.Namespace:
+    def ints(value: str) -> List[int]:
+        return [int(part) for part in value.split(",") if part]
+
+    parser = argparse.ArgumentParser(description="EduQuill offline benchmarks")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    parser.add_argument("--only", type=lambda v: v.split(","), default=list(SECTIONS),
+                        help=f"Comma-separated sections to run ({','.join(SECTIONS)})")
+    parser.add_argument("--quick", action="store_true", help="Small sizes for a smoke run")
+    parser.add_argument("--workdir", help="Data directory (default: a new temporary directory)")
+    parser.add_argument("--embeddings", choices=("stub", "model"), default="stub")
+    parser.add_argument("--pdf-pages", type=ints, default=[10, 100, 500])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--corpus-sizes", type=ints, default=[1000, 10000, 100000])
+    parser.add_argument("--queries", type=int, default=200, help="Queries per corpus size")
+    parser.add_argument("--concurrency", type=ints, default=[1, 4, 16, 64])
+    parser.add_argument("--requests-per-level", type=int, default=200)
+    parser.add_argument("--llm-tokens", type=int, default=64, help="Tokens in every stub LLM reply")
+    parser.add_argument("--llm-prefill-ms", type=float, default=50)
+    parser.add_argument("--llm-token-ms", type=float, default=5)
+    args = parser.parse_args(argv)
+    if args.quick:
+        args.pdf_pages, args.repeat = [5, 20], 2
+        args.corpus_sizes, args.queries = [1000, 5000], 50
+        args.concurrency, args.requests_per_level = [1, 8], 16
+    unknown = set(args.only) - set(SECTIONS)
+    if unknown:
+        parser.error(f"unknown sections: {', '.join(sorted(unknown))}")
+    return args
+
+
+def main(argv: List[str] | None = None):
+    args = parse_args(argv)
+    workdir = args.workdir = args.workdir or tempfile.mkdtemp(prefix="eduquill-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    configure(workdir, args)
+
+    from app.config import VECTOR_BACKEND
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "vector_backend": VECTOR_BACKEND,
+            "args": {key: value for key, value in vars(args).items() if key != "output"},
+        },
+        "results": {},
+    }
+    benches = {
+        "chunking": bench_chunking,
+        "ingest": bench_ingest,
+        "vector_query": bench_vector_query,
+        "chat_load": bench_chat_load,
+    }
+    for name in SECTIONS:
+        if name not in args.only:
+            continue
+        log(f"== {name}")
+        start = time.perf_counter()
+        result = benches[name](args, workdir)
+        report["results"][name] = {
+            "runs": result,
+            "seconds": time.perf_counter() - start,
+            "peak_rss_mb": peak_rss_mb(),
+        }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+        log(f"wrote {args.output}")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
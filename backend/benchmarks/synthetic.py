@@ -0,0 +1,149 @@
+import asyncio
+import hashlib
+import random
+import time
+from typing import Any, AsyncIterator, Iterator, List
+
+import numpy as np
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+WORDS = (
+    "photosynthesis chlorophyll mitochondria enzyme protein membrane osmosis diffusion "
+    "equation derivative integral matrix vector theorem proof function variable "
+    "revolution empire treaty parliament constitution economy trade migration "
+    "molecule atom electron reaction catalyst energy entropy temperature pressure "
+    "grammar syntax metaphor narrative poem essay argument evidence source citation "
+    "ecosystem species habitat climate erosion volcano glacier river ocean continent "
+    "algorithm data structure recursion complexity network protocol database query"
+).split()
+
+
+def sentence(rng: random.Random, words: int = 14) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def _pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(path: str, pages: int, lines_per_page: int = 45, seed: int = 0):
+    """
+    Write a text-only PDF of ``pages`` pages of deterministic pseudo-text.
+
+    Hand-assembled (Helvetica, one content stream per page) so no PDF
+    authoring library is needed; pypdf extracts the text like any real PDF.
+    """
+    rng = random.Random(seed)
+    objects: List[bytes] = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"",  # page tree, filled in once the page object numbers are known
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    page_refs = []
+    for _ in range(pages):
+        lines = ["BT /F1 10 Tf 12 TL 50 790 Td"]
+        for _ in range(lines_per_page):
+            lines.append(f"({_pdf_escape(sentence(rng))}) Tj T*")
+        lines.append("ET")
+        stream = "\n".join(lines).encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % (len(objects))
+        )
+        page_refs.append(len(objects))
+    kids = " ".join(f"{ref} 0 R" for ref in page_refs).encode()
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, pages)
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+def iter_corpus(count: int, seed: int = 0, start: int = 0) -> Iterator[str]:
+    """Chunk-sized pseudo-texts for filling a vector store directly."""
+    rng = random.Random(seed * 1_000_003 + start)
+    for _ in range(count):
+        yield " ".join(sentence(rng) for _ in range(3))
+
+
+class StubEmbeddings(Embeddings):
+    """
+    Deterministic pseudo-random unit vectors seeded by the text's hash.
+
+    Stands in for HuggingFaceEmbeddings (same constructor keywords), so
+    benchmarks measure the pipeline around the model, not the model.
+    """
+
+    def __init__(self, dimension: int = 384, **kwargs: Any):
+        self.dimension = dimension
+
+    def _vector(self, text: str) -> List[float]:
+        seed = int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+        vector = np.random.default_rng(seed).standard_normal(self.dimension)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._vector(text)
+
+
+class StubChatModel(BaseChatModel):
+    """
+    Chat model that replies with a fixed number of tokens at a fixed pace.
+
+    ``prefill_seconds`` passes before the first token and ``token_seconds``
+    between tokens, so request latency is predictable and only the server's
+    own overhead varies.
+    """
+
+    tokens: int = 64
+    prefill_seconds: float = 0.05
+    token_seconds: float = 0.005
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub"
+
+    def _usage(self) -> dict:
+        return {"input_tokens": 0, "output_tokens": self.tokens, "total_tokens": self.tokens}
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: List[str] | None = None,
+        run_manager: CallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        time.sleep(self.prefill_seconds + self.token_seconds * self.tokens)
+        message = AIMessage(content=" token" * self.tokens, usage_metadata=self._usage())
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: List[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self.prefill_seconds)
+        for i in range(self.tokens):
+            if i:
+                await asyncio.sleep(self.token_seconds)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=" token"))
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=self._usage()))
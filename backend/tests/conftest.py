@@ -0,0 +1,52 @@
+import hashlib
+import os
+import sys
+import tempfile
+
+import pytest
+from langchain_core.embeddings import Embeddings
+
+# Keep the registry, sessions and indexes the app opens out of the working tree
+_DATA_DIR = tempfile.mkdtemp(prefix="eduquill-tests-")
+for _variable, _name in (
+    ("EDUQUILL_REGISTRY_PATH", "registry.sqlite3"),
+    ("EDUQUILL_SESSION_DB_PATH", "sessions.sqlite3"),
+    ("EDUQUILL_INGEST_JOB_DB_PATH", "jobs.sqlite3"),
+    ("EDUQUILL_INDEX_GENERATION_PATH", "index.generation"),
+    ("EDUQUILL_CHROMA_DIR", "chroma"),
+    ("EDUQUILL_LEXICAL_INDEX_DIR", "lexical"),
+    ("EDUQUILL_VECTOR_INDEX_DIR", "vectors"),
+):
+    os.environ.setdefault(_variable, os.path.join(_DATA_DIR, _name))
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class FakeEmbeddings(Embeddings):
+    """Deterministic unit vectors derived from a hash of the text."""
+
+    model_name = "fake-embeddings"
+    dimension = 8
+
+    def _vector(self, text: str) -> list[float]:
+        digest = hashlib.sha256(text.encode("utf-8")).digest()
+        vector = [byte - 127.5 for byte in digest[: self.dimension]]
+        norm = sum(value * value for value in vector) ** 0.5
+        return [value / norm for value in vector]
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._vector(text)
+
+
+@pytest.fixture
+def fake_embeddings(monkeypatch):
+    """Replace the embedding model the vector stores load."""
+    from app.rag import numpy_store, vector_store
+
+    embeddings = FakeEmbeddings()
+    monkeypatch.setattr(vector_store, "get_embedding_model", lambda model_name=None: embeddings)
+    monkeypatch.setattr(numpy_store, "get_embedding_model", lambda model_name=None: embeddings)
+    return embeddings
@@ -0,0 +1,19 @@
+import asyncio
+import threading
+
+from app.api import chat
+from app.models.schemas import ChatRequest
+
+
+def test_session_append_runs_off_the_event_loop(monkeypatch):
+    loop_thread = threading.get_ident()
+    writers = []
+
+    async def answer(query, **kwargs):
+        return "an answer", {"docs": [], "metadatas": [], "scores": []}
+
+    monkeypatch.setattr(chat, "rag_answer", answer)
+    monkeypatch.setattr(chat, "add_message", lambda *args: writers.append(threading.get_ident()))
+    response = asyncio.run(chat.chat_query(ChatRequest(query="question", session_id="s")))
+    assert response.answer == "an answer"
+    assert writers and writers[0] != loop_thread
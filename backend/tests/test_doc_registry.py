@@ -0,0 +1,30 @@
+import uuid
+
+from app.rag import doc_registry
+
+
+def _register(status: str, file_hash: str | None = None) -> str:
+    doc_id = str(uuid.uuid4())
+    doc_registry.register_document(doc_id, "notes.pdf", file_hash or doc_id, f"{doc_id}.pdf")
+    doc_registry.set_status(doc_id, status)
+    return doc_id
+
+
+def test_fail_interrupted_keeps_documents_with_active_jobs():
+    queued = _register("pending")
+    lost = _register("pending")
+    deleting = _register("deleting")
+    ready = _register("ready")
+
+    doc_registry.fail_interrupted({queued})
+
+    statuses = {doc_id: doc_registry.get_document(doc_id)["status"] for doc_id in (queued, lost, deleting, ready)}
+    assert statuses == {queued: "pending", lost: "failed", deleting: "failed", ready: "ready"}
+
+
+def test_find_by_hash_only_returns_ready_documents():
+    file_hash = uuid.uuid4().hex
+    pending = _register("pending", file_hash)
+    assert doc_registry.find_by_hash(file_hash) is None
+    doc_registry.set_status(pending, "ready")
+    assert doc_registry.find_by_hash(file_hash)["doc_id"] == pending
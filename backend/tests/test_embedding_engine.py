@@ -0,0 +1,63 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+from app.rag.embedding_engine import EmbeddingEngine
+
+
+class FakePoolModel:
+    """Mimics sentence-transformers' pool: one shared output queue, chunks numbered per call."""
+
+    def __init__(self):
+        self.output: list = []
+        self.active = 0
+        self.overlapped = False
+
+    def start_multi_process_pool(self, target_devices):
+        return {"output": self.output}
+
+    def stop_multi_process_pool(self, pool):
+        pass
+
+    def encode_multi_process(self, texts, pool, batch_size=32):
+        self.active += 1
+        self.overlapped |= self.active > 1
+        for i, text in enumerate(texts):
+            pool["output"].append((i, [float(len(text))]))
+        time.sleep(0.05)
+        # Read back as many results as were submitted, whoever produced them
+        results = sorted(pool["output"][: len(texts)], key=lambda item: item[0])
+        del pool["output"][: len(texts)]
+        self.active -= 1
+        return np.asarray([vector for _, vector in results])
+
+
+class FakeEmbeddings:
+    def __init__(self, model):
+        self.embeddings = SimpleNamespace(_client=model)
+
+    def embed_documents_with(self, texts, embed):
+        return embed(texts)
+
+
+def test_concurrent_pool_embeds_keep_their_own_results():
+    model = FakePoolModel()
+    engine = EmbeddingEngine(FakeEmbeddings(model), processes=2)
+    batches = [["a", "bb", "ccc"], ["dddd", "eeeee", "ffffff"]]
+    results = [None, None]
+
+    def embed(index):
+        results[index] = engine.embed(batches[index])
+
+    threads = [threading.Thread(target=embed, args=(index,)) for index in range(len(batches))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    engine.close()
+
+    assert not model.overlapped
+    for batch, vectors in zip(batches, results):
+        assert vectors == [[float(len(text))] for text in batch]
@@ -0,0 +1,60 @@
+import threading
+
+from app.rag.lexical_index import BM25Index
+
+
+def _index(tmp_path, texts: dict[str, str]) -> BM25Index:
+    index = BM25Index(str(tmp_path / "lexical.sqlite3"))
+    index.add(list(texts), list(texts.values()))
+    return index
+
+
+def test_ranks_by_bm25_and_keeps_top_k(tmp_path):
+    index = _index(tmp_path, {
+        "a": "glucose glucose glucose energy",
+        "b": "glucose energy",
+        "c": "chlorophyll light",
+        "d": "mitochondria energy",
+    })
+    results = index.search("glucose", k=1)
+    assert [chunk_id for chunk_id, _ in results] == ["a"]
+    assert [chunk_id for chunk_id, _ in index.search("glucose", k=5)] == ["a", "b"]
+
+
+def test_common_terms_are_skipped_when_the_query_has_rarer_ones(tmp_path):
+    index = _index(tmp_path, {f"c{n}": f"the cell part {n}" for n in range(10)} | {"x": "the ribosome"})
+    assert [chunk_id for chunk_id, _ in index.search("the ribosome", k=5)] == ["x"]
+    # A query made only of common terms still gets results
+    assert len(index.search("the", k=5)) == 5
+
+
+def test_search_while_chunks_are_added_and_deleted(tmp_path):
+    index = _index(tmp_path, {f"base{n}": f"osmosis water {n}" for n in range(50)})
+    stop = threading.Event()
+    errors = []
+
+    def write():
+        n = 0
+        while not stop.is_set():
+            ids = [f"new{n}_{i}" for i in range(20)]
+            index.add(ids, ["osmosis salt"] * len(ids))
+            index.delete(ids)
+            n += 1
+
+    def search():
+        try:
+            for _ in range(200):
+                assert index.search("osmosis water", k=10)
+        except Exception as exc:
+            errors.append(exc)
+
+    writer = threading.Thread(target=write)
+    readers = [threading.Thread(target=search) for _ in range(4)]
+    writer.start()
+    for reader in readers:
+        reader.start()
+    for reader in readers:
+        reader.join()
+    stop.set()
+    writer.join()
+    assert not errors
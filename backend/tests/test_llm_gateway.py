@@ -0,0 +1,192 @@
+import asyncio
+from contextlib import nullcontext
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from langchain_core.messages import HumanMessage
+
+from app.rag import llm_gateway
+from app.rag.llm_gateway import LLMGateway
+from app.rag.metrics import StageTimer
+from app.rag.prompt_builder import PromptBuild
+
+SERVERS = ["http://ollama-a", "http://ollama-b"]
+
+
+class FakeLLM:
+    """Streams ``tokens``, optionally failing before or after the first one."""
+
+    def __init__(self, tokens=("Hello", " world"), error=None, fail_after=0, delay=0.0, first_delay=0.0):
+        self.tokens = tokens
+        self.error = error
+        self.fail_after = fail_after
+        self.delay = delay
+        self.first_delay = first_delay
+        self.calls = 0
+
+    async def astream(self, messages):
+        self.calls += 1
+        await asyncio.sleep(self.first_delay)
+        for i, token in enumerate(self.tokens):
+            if self.error is not None and i == self.fail_after:
+                raise self.error
+            if i:
+                await asyncio.sleep(self.delay)
+            yield SimpleNamespace(content=token)
+
+
+def _status_error(status: int) -> httpx.HTTPStatusError:
+    request = httpx.Request("POST", "http://llm")
+    return httpx.HTTPStatusError("error", request=request, response=httpx.Response(status, request=request))
+
+
+@pytest.fixture(autouse=True)
+def gateway_settings(monkeypatch):
+    monkeypatch.setattr(llm_gateway, "OLLAMA_BASE_URLS", SERVERS)
+    monkeypatch.setattr(llm_gateway, "LLM_FALLBACK_GROQ_MODEL", "")
+    monkeypatch.setattr(llm_gateway, "LLM_MAX_RETRIES", 1)
+    monkeypatch.setattr(llm_gateway, "LLM_RETRY_BACKOFF_SECONDS", 0.0)
+    monkeypatch.setattr(llm_gateway, "LLM_FIRST_TOKEN_TIMEOUT_SECONDS", 0.0)
+    monkeypatch.setattr(llm_gateway, "LLM_TIMEOUT_SECONDS", 0.0)
+    monkeypatch.setattr(llm_gateway, "LLM_SINGLE_FLIGHT", True)
+
+
+def _gateway(llms: dict[str, FakeLLM]) -> LLMGateway:
+    return LLMGateway(lambda target: nullcontext(llms[target.base_url]))
+
+
+def _prompt(text: str = "question") -> PromptBuild:
+    return PromptBuild([HumanMessage(content=text)], {"total": 10})
+
+
+async def _stream(gateway: LLMGateway, prompt: PromptBuild | None = None) -> str:
+    return "".join([token async for token in gateway.stream(prompt or _prompt(), "llama3", "ollama")])
+
+
+def test_retries_transient_error_on_same_server():
+    flaky = FakeLLM(error=_status_error(503))
+    healthy = FakeLLM()
+    calls = []
+
+    def connect(target):
+        calls.append(target.base_url)
+        return nullcontext(flaky if len(calls) == 1 else healthy)
+
+    gateway = LLMGateway(connect)
+    assert asyncio.run(_stream(gateway)) == "Hello world"
+    assert calls == [SERVERS[0], SERVERS[0]]
+    assert gateway.retries == 1 and gateway.fallbacks == 0
+
+
+def test_fails_over_to_next_server_after_retries():
+    failing = FakeLLM(error=httpx.ConnectError("refused"))
+    healthy = FakeLLM()
+    gateway = _gateway({SERVERS[0]: failing, SERVERS[1]: healthy})
+    assert asyncio.run(_stream(gateway)) == "Hello world"
+    assert failing.calls == 2 and healthy.calls == 1
+    assert gateway.fallbacks == 1
+
+
+def test_does_not_retry_client_errors():
+    failing = FakeLLM(error=_status_error(400))
+    healthy = FakeLLM()
+    gateway = _gateway({SERVERS[0]: failing, SERVERS[1]: healthy})
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(_stream(gateway))
+    assert failing.calls == 1 and healthy.calls == 0
+
+
+def test_does_not_retry_after_first_token():
+    failing = FakeLLM(error=_status_error(503), fail_after=1)
+    healthy = FakeLLM()
+    gateway = _gateway({SERVERS[0]: failing, SERVERS[1]: healthy})
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(_stream(gateway))
+    assert failing.calls == 1 and healthy.calls == 0
+
+
+def test_first_token_timeout_fails_over(monkeypatch):
+    monkeypatch.setattr(llm_gateway, "LLM_FIRST_TOKEN_TIMEOUT_SECONDS", 0.05)
+    monkeypatch.setattr(llm_gateway, "LLM_MAX_RETRIES", 0)
+    slow = FakeLLM(first_delay=1.0)
+    healthy = FakeLLM()
+    gateway = _gateway({SERVERS[0]: slow, SERVERS[1]: healthy})
+    assert asyncio.run(_stream(gateway)) == "Hello world"
+    assert gateway.fallbacks == 1
+
+
+def test_timeout_never_fires_inside_the_consumer(monkeypatch):
+    monkeypatch.setattr(llm_gateway, "LLM_TIMEOUT_SECONDS", 0.05)
+    gateway = _gateway({SERVERS[0]: FakeLLM(tokens=("a", "b")), SERVERS[1]: FakeLLM()})
+    handled = []
+
+    async def slow_consumer():
+        async for token in gateway.stream(_prompt(), "llama3", "ollama"):
+            # Outlives the deadline; must not be cancelled by the gateway's timeout
+            await asyncio.sleep(0.1)
+            handled.append(token)
+
+    with pytest.raises(TimeoutError):
+        asyncio.run(slow_consumer())
+    assert handled == ["a"]
+
+
+def test_overall_timeout_while_generating(monkeypatch):
+    monkeypatch.setattr(llm_gateway, "LLM_TIMEOUT_SECONDS", 0.05)
+    monkeypatch.setattr(llm_gateway, "LLM_MAX_RETRIES", 0)
+    slow = FakeLLM(tokens=("a", "b", "c"), delay=0.1)
+    gateway = _gateway({SERVERS[0]: slow, SERVERS[1]: slow})
+    with pytest.raises(TimeoutError):
+        asyncio.run(_stream(gateway))
+
+
+def test_identical_prompts_share_one_generation():
+    llm = FakeLLM(delay=0.02)
+    gateway = _gateway({SERVERS[0]: llm, SERVERS[1]: llm})
+
+    async def run():
+        timers = [StageTimer(), StageTimer()]
+        answers = await asyncio.gather(
+            *(gateway.generate(_prompt(), "llama3", "ollama", timer=timer) for timer in timers)
+        )
+        return answers, timers
+
+    answers, timers = asyncio.run(run())
+    assert answers == ["Hello world", "Hello world"]
+    assert llm.calls == 1 and gateway.coalesced == 1
+    assert "llm_coalesced" in timers[1].durations
+
+
+def test_joined_caller_runs_its_own_generation_when_the_shared_one_fails(monkeypatch):
+    monkeypatch.setattr(llm_gateway, "LLM_MAX_RETRIES", 0)
+    failing = FakeLLM(error=_status_error(400), first_delay=0.02)
+    healthy = FakeLLM()
+    llms = iter([failing, healthy])
+    gateway = LLMGateway(lambda target: nullcontext(next(llms)))
+
+    async def run():
+        return await asyncio.gather(
+            gateway.generate(_prompt(), "llama3", "ollama"),
+            gateway.generate(_prompt(), "llama3", "ollama"),
+            return_exceptions=True,
+        )
+
+    leader, follower = asyncio.run(run())
+    assert isinstance(leader, httpx.HTTPStatusError)
+    assert follower == "Hello world"
+
+
+def test_shared_generation_continues_while_a_caller_waits():
+    llm = FakeLLM(delay=0.02)
+    gateway = _gateway({SERVERS[0]: llm, SERVERS[1]: llm})
+
+    async def run():
+        first = asyncio.create_task(gateway.generate(_prompt(), "llama3", "ollama"))
+        second = asyncio.create_task(gateway.generate(_prompt(), "llama3", "ollama"))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(run()) == "Hello world"
+    assert llm.calls == 1
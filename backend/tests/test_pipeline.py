@@ -0,0 +1,131 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+
+import pytest
+from langchain_core.documents import Document
+
+from app.rag import doc_registry, pipeline
+
+
+class FakeEngine:
+    batch_size = 2
+
+    def embed_pipelined(self, batches, texts_of, timer=None):
+        for batch in batches:
+            yield batch, [[float(len(text))] for text in texts_of(batch)]
+
+
+class FakeStore:
+    """Records chunks by id; writes to an existing id overwrite it, like an upsert."""
+
+    def __init__(self):
+        self.embeddings = SimpleNamespace(model_name="fake-model")
+        self.chunks: dict[str, tuple[str, dict]] = {}
+
+    def add_chunks(self, doc_id, chunks, metadatas, embeddings, ids):
+        for chunk_id, text, metadata in zip(ids, chunks, metadatas):
+            self.chunks[chunk_id] = (text, dict(metadata))
+
+    def update_metadatas(self, ids, metadatas):
+        for chunk_id, metadata in zip(ids, metadatas):
+            self.chunks[chunk_id] = (self.chunks[chunk_id][0], dict(metadata))
+
+    def delete_chunks(self, ids):
+        for chunk_id in ids:
+            self.chunks.pop(chunk_id, None)
+
+
+@pytest.fixture
+def ingest(monkeypatch):
+    store = FakeStore()
+    monkeypatch.setattr(pipeline, "get_vector_store", lambda name: store)
+    monkeypatch.setattr(pipeline, "get_ingest_engine", lambda: FakeEngine())
+
+    def run(doc_id: str, texts: list[str], tags: list[str] | None = None, fail_after: int | None = None):
+        def chunks(file_path, progress=None, timer=None):
+            for i, text in enumerate(texts):
+                if i == fail_after:
+                    raise ValueError("unreadable page")
+                yield Document(page_content=text, metadata={"page": 0})
+
+        monkeypatch.setattr(pipeline, "iter_pdf_chunks", chunks)
+        doc_registry.register_document(doc_id, "Title", doc_registry.hash_text("".join(texts)), "unused.pdf")
+        pipeline.ingest_document("unused.pdf", doc_id, "Title", tags=tags)
+        return store
+
+    return run
+
+
+def _indexed_texts(store: FakeStore, doc_id: str) -> list[str]:
+    registered = doc_registry.get_chunk_ids_by_hash(doc_id)
+    ids = {chunk_id for chunk_ids in registered.values() for chunk_id in chunk_ids}
+    assert ids == set(store.chunks)
+    return sorted(text for text, _ in store.chunks.values())
+
+
+def test_new_chunk_id_skips_taken_suffixes():
+    used = {"d_abc", "d_abc_1"}
+    assert pipeline.new_chunk_id("d", "abc", set()) == "d_abc"
+    assert pipeline.new_chunk_id("d", "abc", used) == "d_abc_2"
+
+
+def test_reingest_reuses_unchanged_chunks(ingest):
+    store = ingest("doc-reuse", ["alpha", "beta"])
+    before = dict(store.chunks)
+    ingest("doc-reuse", ["alpha", "gamma"])
+    assert _indexed_texts(store, "doc-reuse") == ["alpha", "gamma"]
+    alpha_id = next(chunk_id for chunk_id, (text, _) in before.items() if text == "alpha")
+    assert alpha_id in store.chunks
+    assert doc_registry.get_document("doc-reuse")["status"] == "ready"
+
+
+def test_reingest_with_more_repeats_than_before(ingest):
+    store = ingest("doc-repeats", ["same", "same", "other"])
+    ingest("doc-repeats", ["same", "same", "same", "other"])
+    assert _indexed_texts(store, "doc-repeats") == ["other", "same", "same", "same"]
+    assert doc_registry.get_document("doc-repeats")["status"] == "ready"
+
+
+def test_reingest_with_fewer_repeats_deletes_extra_copies(ingest):
+    store = ingest("doc-fewer", ["same", "same", "same"])
+    ingest("doc-fewer", ["same"])
+    assert _indexed_texts(store, "doc-fewer") == ["same"]
+
+
+def test_prompt_keeps_retrieval_order():
+    # A lexical-only hybrid hit ranked first has no meaningful vector distance
+    data = {
+        "ids": ["lexical", "dense"],
+        "docs": ["Lexical hit text.", "Dense hit text."],
+        "metadatas": [{"doc_id": "a", "page": 1}, {"doc_id": "b", "page": 2}],
+        "scores": [1.9, 0.2],
+    }
+    prompt = pipeline._build_prompt("question", data, [], "llama3")
+    user_message = prompt.messages[-1].content
+    assert user_message.index("Lexical hit text.") < user_message.index("Dense hit text.")
+
+
+def test_failed_revision_removes_its_partial_chunks(ingest, monkeypatch):
+    monkeypatch.setattr(pipeline, "INGEST_WRITE_BATCH_SIZE", 1)
+    store = ingest("doc-partial", ["alpha", "beta"])
+    with pytest.raises(ValueError):
+        ingest("doc-partial", ["alpha", "gamma", "delta", "epsilon", "zeta"], fail_after=4)
+    # Only the previous revision stays indexed, as the registry records
+    assert _indexed_texts(store, "doc-partial") == ["alpha", "beta"]
+    assert doc_registry.get_document("doc-partial")["status"] == "failed"
+
+
+def test_history_is_loaded_off_the_event_loop(monkeypatch):
+    loop_thread = threading.get_ident()
+    readers = []
+
+    def history(session_id):
+        readers.append(threading.get_ident())
+        return []
+
+    monkeypatch.setattr(pipeline, "get_history_messages", history)
+    assert asyncio.run(pipeline._load_history("s")) == []
+    assert readers and readers[0] != loop_thread
+    assert asyncio.run(pipeline._load_history(None)) == []
+    assert len(readers) == 1
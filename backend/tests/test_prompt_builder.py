@@ -0,0 +1,37 @@
+from app.rag.prompt_builder import _merge_contexts
+
+PAGE = "0123456789ABCDEFGHIJKLMNOPQRST"
+
+
+def _span(start: int, end: int, doc_id: str = "doc", page: int = 1) -> tuple[str, dict]:
+    return PAGE[start:end], {"doc_id": doc_id, "page": page, "start_index": start, "end_index": end}
+
+
+def _merge(*spans: tuple[str, dict]) -> list[tuple[str, list[int]]]:
+    return _merge_contexts([text for text, _ in spans], [meta for _, meta in spans], None)
+
+
+def test_merges_prefix_overlap():
+    assert _merge(_span(10, 20), _span(5, 15)) == [(PAGE[5:20], [1, 2])]
+
+
+def test_merges_suffix_overlap():
+    assert _merge(_span(10, 20), _span(15, 25)) == [(PAGE[10:25], [1, 2])]
+
+
+def test_chunk_containing_merged_span_replaces_it():
+    assert _merge(_span(10, 20), _span(0, 30)) == [(PAGE, [1, 2])]
+
+
+def test_chunk_inside_merged_span_adds_only_its_source():
+    assert _merge(_span(0, 30), _span(10, 20)) == [(PAGE, [1, 2])]
+
+
+def test_keeps_other_pages_and_duplicates_apart():
+    merged = _merge(_span(0, 10), _span(5, 15, page=2), _span(0, 10))
+    assert merged == [(PAGE[0:10], [1]), (PAGE[5:15], [2])]
+
+
+def test_ranks_by_score():
+    contexts = ["worse", "better"]
+    assert _merge_contexts(contexts, None, [0.9, 0.1]) == [("better", [2]), ("worse", [1])]
@@ -0,0 +1,61 @@
+import asyncio
+import threading
+
+import pytest
+
+from app.rag import resources
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setattr(resources, "LLM_POOL_MAX_CLIENTS", 1)
+    monkeypatch.setattr(resources, "_llm_clients", type(resources._llm_clients)())
+    monkeypatch.setattr(resources, "_draining", set())
+    closed = []
+
+    async def closer(client):
+        closed.append(client)
+
+    return closed, closer
+
+
+def test_client_evicted_while_leased_is_closed_on_release(pool):
+    closed, closer = pool
+
+    async def run():
+        with resources.lease_llm_client("a", lambda: "client-a", closer) as client:
+            assert client == "client-a"
+            # Evicts "a" from the pool while it is still streaming
+            resources.get_llm_client("b", lambda: "client-b", closer)
+            await asyncio.sleep(0)
+            assert closed == []
+        await asyncio.sleep(0)
+        assert closed == ["client-a"]
+        # An idle client is closed as soon as it is evicted
+        resources.get_llm_client("c", lambda: "client-c", closer)
+        await asyncio.sleep(0)
+        assert closed == ["client-a", "client-b"]
+
+    asyncio.run(run())
+
+
+def test_factory_runs_outside_the_pool_lock(pool):
+    _, closer = pool
+    building = threading.Event()
+    release = threading.Event()
+
+    def slow_factory():
+        building.set()
+        release.wait(5)
+        return "slow"
+
+    thread = threading.Thread(target=resources.get_llm_client, args=("slow", slow_factory, closer))
+    thread.start()
+    assert building.wait(5)
+    try:
+        # Not blocked behind the slow build
+        assert resources._lock.acquire(timeout=1)
+        resources._lock.release()
+    finally:
+        release.set()
+        thread.join()
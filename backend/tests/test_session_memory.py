@@ -0,0 +1,46 @@
+import threading
+
+from app.rag.session_memory import InMemorySessionBackend, SessionStore, SQLiteSessionBackend
+
+
+def _exchange(n: int) -> list[tuple[str, str]]:
+    return [("human", f"question {n}"), ("ai", f"answer {n}")]
+
+
+def test_trims_to_whole_exchanges():
+    store = SessionStore(InMemorySessionBackend(), max_messages=5, token_budget=10000)
+    for n in range(4):
+        store.append("s", _exchange(n))
+    assert store.load("s") == _exchange(2) + _exchange(3)
+
+
+def test_concurrent_appends_from_several_workers_keep_every_exchange(tmp_path):
+    path = str(tmp_path / "sessions.sqlite3")
+    # One backend (connection) per simulated worker process
+    stores = [SessionStore(SQLiteSessionBackend(path), max_messages=1000, token_budget=100000) for _ in range(4)]
+    per_worker = 25
+
+    def worker(index: int):
+        for n in range(per_worker):
+            stores[index].append("shared", _exchange(index * per_worker + n))
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(len(stores))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    history = stores[0].load("shared")
+    assert len(history) == 2 * per_worker * len(stores)
+    assert {content for _, content in history} == {
+        content for n in range(per_worker * len(stores)) for _, content in _exchange(n)
+    }
+
+
+def test_sqlite_load_does_not_write(tmp_path):
+    backend = SQLiteSessionBackend(str(tmp_path / "sessions.sqlite3"))
+    store = SessionStore(backend)
+    store.append("s", _exchange(0))
+    changes = backend._conn.total_changes
+    assert store.load("s") == _exchange(0)
+    assert backend._conn.total_changes == changes
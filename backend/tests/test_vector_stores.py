@@ -0,0 +1,118 @@
+import uuid
+
+import numpy as np
+import pytest
+
+from app.rag.numpy_store import NumpyVectorStore
+from app.rag.vector_store import ChromaVectorStore, build_where, tag_metadata
+
+
+@pytest.fixture(params=["numpy", "chroma"])
+def store(request, fake_embeddings):
+    name = f"test_{request.param}_{uuid.uuid4().hex[:8]}"
+    store = NumpyVectorStore(name) if request.param == "numpy" else ChromaVectorStore(name)
+    yield store
+    store.drop()
+
+
+def _add(store, doc_id: str, texts: list[str], tags: list[str]) -> list[str]:
+    ids = [f"{doc_id}_{i}" for i in range(len(texts))]
+    store.add_chunks(
+        doc_id=doc_id,
+        chunks=texts,
+        metadatas=[{"doc_id": doc_id, "title": doc_id.title(), **tag_metadata(tags)} for _ in texts],
+        embeddings=store.embeddings.embed_documents(texts),
+        ids=ids,
+    )
+    return ids
+
+
+def _matching_ids(store, where) -> set[str]:
+    results = store.query("photosynthesis", top_k=10, mode="dense", where=where)
+    return set(results["ids"][0])
+
+
+def test_where_filters_by_document_title_and_tag(store):
+    biology = _add(store, "bio", ["cells divide", "plants grow"], ["science"])
+    history = _add(store, "hist", ["empires fall"], ["humanities"])
+
+    assert _matching_ids(store, None) == set(biology + history)
+    assert _matching_ids(store, build_where(doc_ids=["hist"])) == set(history)
+    assert _matching_ids(store, build_where(titles=["Bio"])) == set(biology)
+    assert _matching_ids(store, build_where(tags=["science", "humanities"])) == set(biology + history)
+    assert _matching_ids(store, build_where(doc_ids=["bio"], tags=["humanities"])) == set()
+
+
+def test_update_metadatas_replaces_tags(store):
+    ids = _add(store, "doc", ["chlorophyll absorbs light", "stomata exchange gas"], ["old"])
+
+    store.update_metadatas(ids, [{"doc_id": "doc", "title": "Doc", **tag_metadata(["new"])} for _ in ids])
+
+    assert _matching_ids(store, build_where(tags=["old"])) == set()
+    assert _matching_ids(store, build_where(tags=["new"])) == set(ids)
+
+
+def _random_chunks(store, rng, start: int, count: int, dimension: int = 8) -> np.ndarray:
+    vectors = rng.normal(size=(count, dimension)).astype(np.float32)
+    ids = [f"chunk_{i}" for i in range(start, start + count)]
+    store.add_chunks(
+        doc_id="doc",
+        chunks=[f"text {i}" for i in range(start, start + count)],
+        metadatas=[{"doc_id": "doc"} for _ in ids],
+        embeddings=vectors.tolist(),
+        ids=ids,
+    )
+    return vectors
+
+
+@pytest.fixture
+def ivf_store(monkeypatch, fake_embeddings):
+    from app.rag import numpy_store
+
+    monkeypatch.setattr(numpy_store, "VECTOR_IVF_MIN_ROWS", 200)
+    monkeypatch.setattr(numpy_store, "VECTOR_IVF_LISTS", 8)
+    store = NumpyVectorStore(f"test_ivf_{uuid.uuid4().hex[:8]}", quantization="none")
+    yield store
+    store.drop()
+
+
+def _assert_lists_match_assignment(store):
+    assign = np.asarray(store._assign[:store._count])
+    for partition, rows in enumerate(store._lists):
+        assert np.array_equal(rows, np.flatnonzero(assign == partition))
+
+
+def test_ivf_lists_follow_added_and_moved_rows(ivf_store):
+    rng = np.random.default_rng(0)
+    _random_chunks(ivf_store, rng, 0, 250)
+    assert ivf_store._centroids is not None
+    _assert_lists_match_assignment(ivf_store)
+
+    _random_chunks(ivf_store, rng, 250, 50)
+    # Overwrite existing chunks with new vectors, moving them between partitions
+    _random_chunks(ivf_store, rng, 0, 40)
+    _assert_lists_match_assignment(ivf_store)
+
+    reopened = NumpyVectorStore(ivf_store.collection_name, quantization="none")
+    try:
+        for rows, reloaded in zip(ivf_store._lists, reopened._lists):
+            assert np.array_equal(rows, reloaded)
+    finally:
+        reopened.close()
+
+
+def test_ivf_search_probing_every_list_is_exact(ivf_store, monkeypatch):
+    from app.rag import numpy_store
+
+    rng = np.random.default_rng(1)
+    vectors = _random_chunks(ivf_store, rng, 0, 300)
+    ivf_store.delete_chunks(["chunk_3", "chunk_7"])
+    monkeypatch.setattr(numpy_store, "VECTOR_IVF_NPROBE", 8)
+
+    query = rng.normal(size=8).astype(np.float32)
+    distances = np.sum((vectors - query) ** 2, axis=1)
+    distances[[3, 7]] = np.inf
+    expected = [f"chunk_{i}" for i in np.argsort(distances)[:5]]
+
+    results = ivf_store._search(query.tolist(), 5)
+    assert [document.id for document, _ in results] == expected
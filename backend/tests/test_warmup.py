@@ -0,0 +1,30 @@
+import asyncio
+
+from app.rag import warmup
+
+
+def test_failed_warm_up_is_retried_with_backoff(monkeypatch):
+    monkeypatch.setattr(warmup, "_state", {"status": "warming_up", "seconds": None, "error": None, "attempts": 0})
+    monkeypatch.setattr(warmup, "WARMUP_RETRY_SECONDS", 0.01)
+    monkeypatch.setattr(warmup, "WARMUP_RETRY_MAX_SECONDS", 0.02)
+    attempts = []
+    delays = []
+    sleep = asyncio.sleep
+
+    def warm_up():
+        attempts.append(warmup.status())
+        if len(attempts) < 4:
+            raise OSError("model download failed")
+
+    async def record_sleep(delay):
+        delays.append(delay)
+        await sleep(0)
+
+    monkeypatch.setattr(warmup, "_warm_up", warm_up)
+    monkeypatch.setattr(warmup.asyncio, "sleep", record_sleep)
+    asyncio.run(warmup._run())
+
+    assert attempts[1]["status"] == "failed" and "model download failed" in attempts[1]["error"]
+    assert delays == [0.01, 0.02, 0.02]
+    assert warmup.is_ready()
+    assert warmup.status()["attempts"] == 4 and warmup.status()["error"] is None
@@ -26,7 +26,20 @@ function App() {
     try {
       const formData = new FormData();
       formData.append("file", file);
-      await axios.post(`${API_BASE}/api/v1/documents/upload`, formData);
+      const res = await axios.post(`${API_BASE}/api/v1/documents/upload`, formData);
+
+      // Ingestion runs in the background: poll the job until it finishes
+      let job = res.data;
+      while (job.status === "queued" || job.status === "running") {
+        await new Promise((resolve) => setTimeout(resolve, 1000));
+        const jobRes = await axios.get(
+          `${API_BASE}/api/v1/documents/jobs/${res.data.job_id}`
+        );
+        job = jobRes.data;
+      }
+      if (job.status === "failed") {
+        throw new Error(job.error || "Ingestion failed");
+      }
       alert("✅ Document uploaded & indexed!");
     } catch (err) {
       console.error(err);